@@ -1,3 +1,5 @@
 #!/bin/sh
 
-/usr/local/bin/python /code/manage.py flushexpiredtokens
\ No newline at end of file
+/usr/local/bin/python /code/manage.py flushexpiredtokens
+/usr/local/bin/python /code/manage.py shuffle_recipes
+/usr/local/bin/python /code/manage.py rebuild_facet_counts
\ No newline at end of file
@@ -7,5 +7,30 @@
 # Start cron service
 /usr/sbin/crond -b
 
+# Start the background job worker, restarted whenever it exits.
+# On SIGTERM it finishes its running jobs and stops.
+(
+  trap 'kill -TERM $worker 2>/dev/null; wait $worker; exit 0' TERM INT
+  while true; do
+    /code/manage.py run_worker &
+    worker=$!
+    wait $worker
+    echo "Job worker exited with $?, restarting"
+    sleep 5 &
+    wait $!
+  done
+) &
+supervisor=$!
+
 # Start up gunicorn
-/code/base/gunicorn_start.sh
+/code/base/gunicorn_start.sh &
+gunicorn=$!
+
+# Forward SIGTERM (docker stop) to gunicorn and the worker, and stop both if gunicorn exits.
+trap 'kill -TERM $gunicorn $supervisor 2>/dev/null' TERM INT
+wait $gunicorn
+kill -TERM $gunicorn $supervisor 2>/dev/null
+wait $gunicorn
+status=$?
+wait $supervisor
+exit $status
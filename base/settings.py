@@ -135,6 +135,7 @@ INSTALLED_APPS = (
     'v1.list',
     'v1.menu',
     'v1.rating',
+    'v1.jobs',
 
     'imagekit',
     'corsheaders'
@@ -237,10 +238,42 @@ FILE_UPLOAD_PERMISSIONS = 0o644
 
 RECIPE_IMAGE_QUALITY = os.environ.get('RECIPE_IMAGE_QUALITY', 'MEDIUM')
 
+# The widths (px) recipe photos are pre-rendered in, as WebP and JPEG (see v1/recipe/photo_variants.py).
+RECIPE_PHOTO_VARIANT_WIDTHS = [
+    int(width) for width in os.environ.get('RECIPE_PHOTO_VARIANT_WIDTHS', '400,800,1200').split(',')
+]
+
 DELETE_ORPHAN_FILES = True
 if os.environ.get('DELETE_ORPHAN_FILES', 'True').lower() == 'false':
     DELETE_ORPHAN_FILES = False
 
+# Count filtered browse facets on an in-process bitmap index (see v1/recipe/facet_index.py).
+# Every worker process holds its own copy, changes made by other workers
+# show up after RECIPE_FACET_INDEX_TTL seconds, when it's rebuilt in the background.
+# Off by default, the bitmaps aren't compressed: a million recipes take 125 KB per course,
+# cuisine, season and tag per process, and counting a facet scans all its values.
+RECIPE_FACET_INDEX = False
+if os.environ.get('RECIPE_FACET_INDEX', 'False').lower() == 'true':
+    RECIPE_FACET_INDEX = True
+RECIPE_FACET_INDEX_TTL = int(os.environ.get('RECIPE_FACET_INDEX_TTL', 300))
+
+# Cache the recipe ids and facet totals of filter and search combinations (see v1/recipe/query_cache.py).
+# Entries are keyed by the version of the recipes, so any change invalidates them.
+# Results with more than RECIPE_QUERY_CACHE_MAX_IDS recipes are not cached.
+RECIPE_QUERY_CACHE = False
+if os.environ.get('RECIPE_QUERY_CACHE', 'False').lower() == 'true':
+    RECIPE_QUERY_CACHE = True
+RECIPE_QUERY_CACHE_TIMEOUT = int(os.environ.get('RECIPE_QUERY_CACHE_TIMEOUT', 300))
+RECIPE_QUERY_CACHE_MAX_IDS = int(os.environ.get('RECIPE_QUERY_CACHE_MAX_IDS', 5000))
+
+# Background jobs (see v1/jobs/queue.py), run by the run_worker command.
+# A failed job is retried after JOB_RETRY_DELAY seconds, twice as long each time.
+# A job running for more than JOB_TIMEOUT seconds counts as abandoned and is run again.
+JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 2))
+JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', 30))
+JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 3600))
+JOB_KEEP_FAILED_DAYS = int(os.environ.get('JOB_KEEP_FAILED_DAYS', 30))
+
 # Absolute path to the directory that holds media.
 # Example: "/opt/ownrecipes/ownrecipes-api/site-media/"
 MEDIA_ROOT = os.path.join(PROJECT_PATH, 'site-media')
@@ -1,3 +1,5 @@
 #!/bin/bash
 
 /bin/bash -ac 'cd /opt/ownrecipes/ownrecipes-api; . .env.service.local; exec python3 manage.py flushexpiredtokens'
+/bin/bash -ac 'cd /opt/ownrecipes/ownrecipes-api; . .env.service.local; exec python3 manage.py shuffle_recipes'
+/bin/bash -ac 'cd /opt/ownrecipes/ownrecipes-api; . .env.service.local; exec python3 manage.py rebuild_facet_counts'
\ No newline at end of file
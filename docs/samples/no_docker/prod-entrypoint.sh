@@ -9,5 +9,7 @@ BASEDIR=/opt/ownrecipes/ownrecipes-api
 python3 $BASEDIR/manage.py migrate --no-input
 python3 $BASEDIR/manage.py collectstatic --no-input
 
+# The background job worker is run by ownrecipes-worker.service.
+
 # Start up gunicorn
-bash $BASEDIR/base/gunicorn_start.sh
+exec bash $BASEDIR/base/gunicorn_start.sh
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+class ConditionalGetMixin(object):
+    """
+    Custom viewset mixin answering conditional GETs.
+
+    Before `list` and `retrieve` run, the view is asked for the validators of the response,
+    `get_list_validators()` and `get_object_validators()` return `(version, last_modified)`:
+    anything JSON serializable that changes whenever the response does,
+    and the `datetime` of the last change (or `None`).
+    They should cost a query at most, return `None` to skip.
+
+    A matching `If-None-Match` (or `If-Modified-Since`) is answered with a 304,
+    before the response is queried and serialized.
+    Otherwise the response gets a strong `ETag` and `Last-Modified`.
+    The `ETag` covers the path with its query, the user and the format too.
+    """
+    def get_list_validators(self):
+        return None
+
+    def get_object_validators(self):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_list_validators(), super(ConditionalGetMixin, self).list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_object_validators(), super(ConditionalGetMixin, self).retrieve, request, *args, **kwargs
+        )
+
+    def conditional_response(self, validators, handler, request, *args, **kwargs):
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        version, last_modified = validators
+        etag = self.get_etag(request, version)
+        timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def get_etag(self, request, version):
+        fingerprint = json.dumps([
+            request.get_full_path(),
+            request.user.pk,
+            request.accepted_renderer.format,
+            version,
+        ], default=str, sort_keys=True)
+        return '"%s"' % hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
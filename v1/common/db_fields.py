@@ -5,13 +5,15 @@ import re
 import six
 
 from django.conf import settings
-from django.db.models import SlugField
+from django.db import IntegrityError, transaction
+from django.db.models import FileField, SlugField
 from django.db.models.constants import LOOKUP_SEP
 from django.template.defaultfilters import slugify
 from django.utils.encoding import force_str
 
 
 MAX_UNIQUE_QUERY_ATTEMPTS = getattr(settings, 'EXTENSIONS_MAX_UNIQUE_QUERY_ATTEMPTS', 100)
+MAX_SLUG_SAVE_ATTEMPTS = 3
 
 
 class UniqueFieldMixin(object):
@@ -47,13 +49,61 @@ class UniqueFieldMixin(object):
                 for param in params:
                     kwargs[param] = getattr(model_instance, param, None)
 
-        new = six.next(iterator)
-        kwargs[self.attname] = new
-        while not new or queryset.filter(**kwargs):
-            new = six.next(iterator)
-            kwargs[self.attname] = new
-        setattr(model_instance, self.attname, new)
-        return new
+        # One query finds the taken candidates, the first free one is picked.
+        candidates = [new for new in iterator if new]
+        kwargs['%s__in' % self.attname] = candidates
+        taken = set(queryset.filter(**kwargs).values_list(self.attname, flat=True))
+        for new in candidates:
+            if new not in taken:
+                setattr(model_instance, self.attname, new)
+                return new
+        raise RuntimeError('max slug attempts for %s exceeded (%s)' % (candidates[0], len(candidates)))
+
+
+class AutoSlugRetryMixin(object):
+    """
+    Model mixin for the models with a unique AutoSlugField.
+    The slug is allocated before the insert, another request can take it in the meantime.
+    The insert is then retried with a new slug, up to `MAX_SLUG_SAVE_ATTEMPTS` times.
+    """
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super(AutoSlugRetryMixin, self).save(*args, **kwargs)
+
+        for attempt in range(MAX_SLUG_SAVE_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return super(AutoSlugRetryMixin, self).save(*args, **kwargs)
+            except IntegrityError:
+                if attempt + 1 == MAX_SLUG_SAVE_ATTEMPTS or not self._slug_taken():
+                    raise
+
+    def _slug_taken(self):
+        for field in self._meta.concrete_fields:
+            if isinstance(field, AutoSlugField) and field.unique and not field.allow_duplicates:
+                slugs = self.__class__._default_manager.filter(**{field.attname: getattr(self, field.attname)})
+                if slugs.exists():
+                    return True
+        return False
+
+
+class FileNamesMixin(object):
+    """
+    Model mixin for the models remembering their file names as loaded
+    (see `v1.recipe.models.remember_file_names`, on `post_init` and `post_save`).
+    `refresh_from_db` sends neither, the reloaded names are remembered here.
+    """
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super(FileNamesMixin, self).refresh_from_db(using, fields, **kwargs)
+        original_names = getattr(self, '_original_file_names', {})
+        for field in self._meta.concrete_fields:
+            if not isinstance(field, FileField) or field.attname not in self.__dict__:
+                continue
+            if fields is None or field.attname in fields:
+                value = self.__dict__[field.attname]
+                original_names[field.attname] = getattr(value, 'name', value)
+        self._original_file_names = original_names
+
 
 class AutoSlugField(UniqueFieldMixin, SlugField):
     """ AutoSlugField
@@ -128,7 +178,6 @@ class AutoSlugField(UniqueFieldMixin, SlugField):
                 slug = self._slug_strip(slug)
             slug = '%s%s' % (slug, end)
             yield slug
-        raise RuntimeError('max slug attempts for %s exceeded (%s)' % (original_slug, self.max_unique_query_attempts))
 
     def create_slug(self, model_instance, add):
         # get fields to populate from and slug field to set
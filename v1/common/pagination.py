@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import json
+from base64 import b64decode, b64encode
+from datetime import date, datetime
+from urllib import parse
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(object):
+    """
+    Keyset (a.k.a. seek) pagination.
+
+    The cursor holds the ordering values of the last row of the page,
+    the next page is everything behind that row.
+    So every page costs the same, no matter how deep it is,
+    there is no `COUNT(*)`, and rows inserted meanwhile can't shift a page.
+
+    The ordering is taken from the queryset (i.e. after the `OrderingFilter`),
+    `pk` is appended as tie-breaker.
+    Nullable fields order NULLs first ascending and last descending, on every database.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def paginate_queryset(self, queryset, request):
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(queryset)
+        self.model = queryset.model
+
+        values, self.reverse = self.decode_cursor(request)
+        ordering = [(field, desc != self.reverse) for field, desc in self.ordering]
+
+        queryset = queryset.order_by(*[self.order_by(field, desc) for field, desc in ordering])
+        if values is not None:
+            queryset = queryset.filter(self.after(ordering, values))
+
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+        if self.reverse:
+            results.reverse()
+
+        self.next_values = self.values(results[-1]) if results and (has_more or self.reverse) else None
+        self.previous_values = self.values(results[0]) if results and (has_more if self.reverse else values is not None) else None
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_link(self.next_values, False),
+            'previous': self.get_link(self.previous_values, True),
+            'results': data,
+        })
+
+    def get_ordering(self, queryset):
+        ordering = []
+        for field in queryset.query.order_by or queryset.model._meta.ordering:
+            if not isinstance(field, str):
+                raise ValueError('Keyset pagination only supports field names as ordering.')
+            name = field.lstrip('-')
+            if name == 'pk':
+                name = queryset.model._meta.pk.name
+            ordering.append((name, field.startswith('-')))
+
+        pk = queryset.model._meta.pk.name
+        if pk not in [name for name, desc in ordering]:
+            ordering.append((pk, False))
+        return ordering
+
+    def order_by(self, field, desc):
+        if not self.is_nullable(field):
+            return '-' + field if desc else field
+        return F(field).desc(nulls_last=True) if desc else F(field).asc(nulls_first=True)
+
+    def after(self, ordering, values):
+        """
+        Build the filter selecting all rows behind `values`, e.g. for `(-a, b, id)`:
+        a < va OR (a = va AND b > vb) OR (a = va AND b = vb AND id > vid)
+        """
+        query = Q(pk__in=[])
+        equal = Q()
+        for (field, desc), value in zip(ordering, values):
+            if value is None:
+                # Descending NULLs come last, ascending NULLs come first.
+                behind = Q(pk__in=[]) if desc else Q(**{'%s__isnull' % field: False})
+                same = Q(**{'%s__isnull' % field: True})
+            else:
+                behind = Q(**{'%s__%s' % (field, 'lt' if desc else 'gt'): value})
+                if desc and self.is_nullable(field):
+                    behind |= Q(**{'%s__isnull' % field: True})
+                same = Q(**{field: value})
+            query |= equal & behind
+            equal &= same
+        return query
+
+    def is_nullable(self, field):
+        model_field = self.get_field(field)
+        return model_field is None or model_field.null
+
+    def get_field(self, field):
+        model = self.model
+        *path, name = field.split('__')
+        try:
+            for attr in path:
+                model = model._meta.get_field(attr).related_model
+            return model._meta.get_field(name)
+        except (AttributeError, FieldDoesNotExist):
+            # An annotation, e.g. `search_rank`.
+            return None
+
+    def values(self, instance):
+        values = []
+        for field, desc in self.ordering:
+            value = instance
+            for attr in field.split('__'):
+                value = getattr(value, attr, None)
+            values.append(value)
+        return values
+
+    def get_link(self, values, reverse):
+        if values is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(values, reverse))
+
+    def encode_cursor(self, values, reverse):
+        def encode(value):
+            if isinstance(value, (date, datetime)):
+                return value.isoformat()
+            return value
+
+        data = {'v': [encode(value) for value in values]}
+        if reverse:
+            data['r'] = 1
+        return b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            data = json.loads(b64decode(parse.unquote(encoded).encode('ascii')).decode('utf-8'))
+            values = data['v']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [self.to_python(field, value) for (field, desc), value in zip(self.ordering, values)], bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_python(self, field, value):
+        model_field = self.get_field(field)
+        if value is None or model_field is None:
+            return value
+        return model_field.to_python(value)
+
+
+class LimitOffsetOrKeysetPagination(LimitOffsetPagination):
+    """
+    `LimitOffsetPagination`, unless the request passes a `cursor`.
+    Then the page is served by `KeysetPagination`.
+    Start with an empty cursor (`?cursor=&limit=50`) and follow the `next` links.
+
+    The keyset response has no `count`, that's the point of it.
+    """
+    cursor_query_param = KeysetPagination.cursor_query_param
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.cursor_query_param not in request.query_params:
+            return super(LimitOffsetOrKeysetPagination, self).paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.keyset = KeysetPagination(self.get_limit(request) or self.default_limit)
+        return self.keyset.paginate_queryset(queryset, request)
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super(LimitOffsetOrKeysetPagination, self).get_paginated_response(data)
+        return self.keyset.get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super(LimitOffsetOrKeysetPagination, self).get_schema_operation_parameters(view)
+        parameters.append({
+            'name': self.cursor_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'The pagination cursor value, replaces offset.',
+            'schema': {
+                'type': 'string',
+            },
+        })
+        return parameters
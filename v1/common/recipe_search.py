@@ -2,8 +2,12 @@
 # encoding: utf-8
 
 import operator
+import re
+from collections import defaultdict
 from functools import reduce
+from django.conf import settings
 from django.db import models
+from rest_framework import filters
 
 
 def get_search_results(search_fields, queryset, search_term):
@@ -11,7 +15,7 @@ def get_search_results(search_fields, queryset, search_term):
     This code mirrors the search functionality that the django admin pages uses.
     It also happens to match what django rest users for there search implementation.
     https://docs.djangoproject.com/en/2.0/ref/contrib/admin/#django.contrib.admin.ModelAdmin.search_fields
-    
+
     Usage: Returns a queryset to implement the search.
     Example:
         query = get_search_results(
@@ -46,3 +50,300 @@ def get_search_results(search_fields, queryset, search_term):
             queryset = queryset.filter(reduce(operator.or_, or_queries))
 
     return queryset
+
+
+def build_search_document(*texts):
+    """
+    Usage: Returns the normalized text stored in `Recipe.search_document`.
+    Example:
+        build_search_document('Tasty Chili', 'Beans', 'Spicy')
+        'tasty chili beans spicy'
+    """
+    return ' '.join(' '.join(text for text in texts if text).lower().split())
+
+
+def build_search_documents(recipe_model, ingredient_model, chunk_size=500):
+    """
+    Usage: (Re)builds the `search_document` of all recipes, returns their number.
+    One grouped query per table and one `bulk_update` per chunk of recipes.
+    Takes the models as arguments, so migrations can pass their historical ones.
+    Example:
+        build_search_documents(Recipe, Ingredient)
+    """
+    last_id = 0
+    total = 0
+    while True:
+        recipes = list(recipe_model.objects.filter(id__gt=last_id).order_by('id').only('id', 'title')[:chunk_size])
+        if not recipes:
+            return total
+
+        ids = [recipe.id for recipe in recipes]
+        texts = defaultdict(list)
+        for recipe_id, title in ingredient_model.objects.filter(ingredient_group__recipe_id__in=ids).values_list('ingredient_group__recipe_id', 'title'):
+            texts[recipe_id].append(title)
+        for recipe_id, title in recipe_model.tags.through.objects.filter(recipe_id__in=ids).values_list('recipe_id', 'tag__title'):
+            texts[recipe_id].append(title)
+        for recipe_id, title in recipe_model.seasons.through.objects.filter(recipe_id__in=ids).values_list('recipe_id', 'season__title'):
+            texts[recipe_id].append(title)
+
+        for recipe in recipes:
+            recipe.search_document = build_search_document(recipe.title, *texts[recipe.id])
+        recipe_model.objects.bulk_update(recipes, ['search_document'])
+
+        last_id = ids[-1]
+        total += len(recipes)
+
+
+class SearchSQL(models.Func):
+    """
+    Like `RawSQL`, but the column is passed in as an expression
+    (`%(expressions)s` in the template), so the ORM resolves its table alias.
+    `RawSQL` with a hard-coded table name breaks as soon as the queryset
+    is used as a subquery (e.g. `recipe__in=...`), which re-aliases the table.
+    The column has to come before the `%%s` placeholders of `params`.
+    """
+    def __init__(self, template, column, params, output_field):
+        super(SearchSQL, self).__init__(models.F(column), template=template, output_field=output_field)
+        self.params = list(params)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = super(SearchSQL, self).as_sql(compiler, connection, **extra_context)
+        return sql, list(params) + self.params
+
+
+class SearchBackend(object):
+    """
+    Searches recipes by their `search_document`, the normalized text
+    of their title, ingredients, seasons and tags.
+
+    Every word of the search term has to be found in the document.
+    There are no joins, so the result needs no `.distinct()`.
+
+    This is the fallback backend, it uses plain `icontains` lookups
+    and works on every database.
+    Subclasses use the native full-text index of their database,
+    see `get_search_backend`.
+    """
+    column = 'search_document'
+
+    def tokens(self, bit):
+        return re.findall(r'\w+', bit.lower())
+
+    def match(self, bit):
+        """ Return a `Q` object that matches `bit` against the search document. """
+        return models.Q(**{'%s__icontains' % self.column: bit.lower()})
+
+    def rank(self, search_term):
+        """ Return an expression used to rank the recipes by relevance. """
+        return models.Value(0.0, output_field=models.FloatField())
+
+    def filter(self, queryset, search_term):
+        """ Restrict the recipe `queryset` to the recipes matching `search_term`. """
+        if not search_term:
+            return queryset
+
+        for bit in search_term.split():
+            queryset = queryset.filter(self.match(bit))
+        return queryset
+
+    def ranked_ids(self, queryset, search_term):
+        """ Return the ids of the recipes matching `search_term`, best match first. """
+        return list(
+            self.filter(queryset, search_term)
+                .annotate(search_rank=self.rank(search_term))
+                .order_by('-search_rank', 'title')
+                .values_list('id', flat=True)
+        )
+
+
+class NativeSearchBackend(SearchBackend):
+    """
+    Base class for the backends using a native full-text index
+    on `recipe.search_document`, see migration `recipe.0027`.
+
+    All indexed words go into one full-text predicate.
+    Words the index can't handle (e.g. too short) fall back to `icontains`.
+    """
+    min_token_length = 1
+    # The column the full-text predicate is built on.
+    match_column = SearchBackend.column
+
+    def query(self, tokens):
+        raise NotImplementedError
+
+    def match_template(self):
+        raise NotImplementedError
+
+    def indexable(self, bit):
+        tokens = self.tokens(bit)
+        return tokens and min(len(token) for token in tokens) >= self.min_token_length
+
+    def filter(self, queryset, search_term):
+        if not search_term:
+            return queryset
+
+        tokens = []
+        for bit in search_term.split():
+            if self.indexable(bit):
+                tokens += self.tokens(bit)
+            else:
+                queryset = queryset.filter(self.match(bit))
+
+        if tokens:
+            queryset = queryset.filter(SearchSQL(
+                self.match_template(),
+                self.match_column,
+                [self.query(tokens)],
+                output_field=models.BooleanField()
+            ))
+        return queryset
+
+
+class MySQLSearchBackend(NativeSearchBackend):
+    """ Uses the `FULLTEXT` index (boolean mode, prefix match). """
+    # InnoDB's default `innodb_ft_min_token_size`.
+    min_token_length = 3
+
+    def query(self, tokens):
+        return ' '.join('+%s*' % token for token in tokens)
+
+    def match_template(self):
+        return 'MATCH (%(expressions)s) AGAINST (%%s IN BOOLEAN MODE)'
+
+    def rank(self, search_term):
+        tokens = self.tokens(search_term)
+        if not tokens:
+            return super(MySQLSearchBackend, self).rank(search_term)
+        return SearchSQL(
+            self.match_template(),
+            self.column,
+            [' '.join('%s*' % token for token in tokens)],
+            output_field=models.FloatField()
+        )
+
+
+class PostgresSearchBackend(NativeSearchBackend):
+    """ Uses the `to_tsvector` GIN index (prefix match). """
+
+    def query(self, tokens):
+        return ' & '.join('%s:*' % token for token in tokens)
+
+    def match_template(self):
+        return "to_tsvector('simple', %(expressions)s) @@ to_tsquery('simple', %%s)"
+
+    def rank(self, search_term):
+        tokens = self.tokens(search_term)
+        if not tokens:
+            return super(PostgresSearchBackend, self).rank(search_term)
+        return SearchSQL(
+            "ts_rank(to_tsvector('simple', %(expressions)s), to_tsquery('simple', %%s))",
+            self.column,
+            [' | '.join('%s:*' % token for token in tokens)],
+            output_field=models.FloatField()
+        )
+
+
+class SQLiteSearchBackend(NativeSearchBackend):
+    """ Uses the FTS5 table `recipe_recipe_fts` (prefix match). """
+    fts_table = 'recipe_recipe_fts'
+    # The FTS5 table is keyed by the recipe id.
+    match_column = 'id'
+
+    def query(self, tokens):
+        return ' '.join('"%s"*' % token for token in tokens)
+
+    def match_template(self):
+        return '%(expressions)s IN (SELECT rowid FROM {0} WHERE {0} MATCH %%s)'.format(self.fts_table)
+
+    def rank(self, search_term):
+        tokens = self.tokens(search_term)
+        if not tokens:
+            return super(SQLiteSearchBackend, self).rank(search_term)
+        return SearchSQL(
+            'COALESCE((SELECT -bm25({0}) FROM {0} WHERE {0}.rowid = %(expressions)s AND {0} MATCH %%s), 0)'.format(self.fts_table),
+            self.match_column,
+            [' OR '.join('"%s"*' % token for token in tokens)],
+            output_field=models.FloatField()
+        )
+
+
+# The FTS5 tables are external content tables kept in sync by triggers.
+SQLITE_SEARCH_INDEX = (
+    ('recipe_recipe', 'search_document'),
+)
+
+SQLITE_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5({column}, content='{table}', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {table}_fts(rowid, {column}) VALUES (new.id, new.{column}); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {table}_fts({table}_fts, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF {column} ON {table} BEGIN "
+    "INSERT INTO {table}_fts({table}_fts, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+    "INSERT INTO {table}_fts(rowid, {column}) VALUES (new.id, new.{column}); "
+    "END",
+    "INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')",
+)
+
+
+def install_sqlite_search_index(sender, using='default', **kwargs):
+    """
+    `post_migrate` handler (re)creating the FTS5 tables used by `SQLiteSearchBackend`.
+    SQLite rebuilds tables on most schema changes, which drops their triggers,
+    so this runs after every migrate instead of once in a migration.
+    """
+    from django.db import connections
+
+    connection = connections[using]
+    if sender.label != 'recipe' or connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for table, column in SQLITE_SEARCH_INDEX:
+            for statement in SQLITE_FTS:
+                cursor.execute(statement.format(table=table, column=column))
+
+
+SEARCH_BACKENDS = (
+    ('mysql', MySQLSearchBackend),
+    ('postgresql', PostgresSearchBackend),
+    ('sqlite3', SQLiteSearchBackend),
+)
+
+
+def get_search_backend():
+    """
+    Pick the search backend matching `DATABASES['default']['ENGINE']`.
+    Unknown engines use the `icontains` fallback.
+    """
+    engine = settings.DATABASES['default']['ENGINE']
+    for name, backend in SEARCH_BACKENDS:
+        if name in engine:
+            return backend()
+    return SearchBackend()
+
+
+def search_recipes(queryset, search_term):
+    """
+    Usage: Returns the recipe queryset restricted to the recipes matching the search.
+    Example:
+        query = search_recipes(Recipe.objects, 'chicken taco')
+    """
+    return get_search_backend().filter(queryset, search_term)
+
+
+class RecipeSearchFilter(filters.SearchFilter):
+    """
+    DRF filter backend running `?search=` through the search backend.
+    Annotates `search_rank`, so the views can offer `?ordering=-search_rank`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_term = request.query_params.get(self.search_param, '')
+        if not search_term.strip():
+            return queryset.annotate(search_rank=SearchBackend().rank(search_term))
+
+        backend = get_search_backend()
+        return backend.filter(queryset, search_term).annotate(search_rank=backend.rank(search_term))
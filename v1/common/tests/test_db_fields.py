@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import TestCase
+from v1.common.db_fields import AutoSlugField
+from v1.list.models import GroceryList
+from v1.recipe_groups.models import Tag
+
+
+class AutoSlugFieldTests(TestCase):
+    fixtures = ['test/users.json']
+
+    def test_find_unique(self):
+        """ The free slug is picked with one query, however many are taken """
+        user = User.objects.get(pk=1)
+        for i in range(5):
+            GroceryList.objects.create(title='Pancakes', author=user)
+        GroceryList.objects.filter(slug='pancakes-3').delete()
+
+        # One query for the slugs, one for the insert.
+        with self.assertNumQueries(2):
+            grocery_list = GroceryList.objects.create(title='Pancakes', author=user)
+        self.assertEqual(grocery_list.slug, 'pancakes-3')
+        self.assertEqual(GroceryList.objects.create(title='Pancakes', author=user).slug, 'pancakes-6')
+
+        # An update keeps the slug.
+        grocery_list.title = 'Waffles'
+        grocery_list.save()
+        self.assertEqual(grocery_list.slug, 'pancakes-3')
+
+    def test_retry_taken_slug(self):
+        """ A slug taken by another request in the meantime is allocated again """
+        Tag.objects.create(title='Pancakes')
+        with mock.patch.object(AutoSlugField, 'get_queryset', side_effect=[Tag.objects.none(), Tag.objects.all()]):
+            tag = Tag.objects.create(title='Pancakes!')
+        self.assertEqual(tag.slug, 'pancakes-2')
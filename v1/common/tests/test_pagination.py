@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+
+from v1.list import views as list_views
+from v1.recipe import views as recipe_views
+from v1.recipe.models import Recipe
+
+
+class KeysetPaginationTests(TestCase):
+    fixtures = [
+        'test/users.json',
+        'course_data.json',
+        'cuisine_data.json',
+        'season_data.json',
+        'tag_data.json',
+        'ing_data.json',
+        'recipe_data.json',
+        'test/lists.json',
+        'test/list_items.json',
+    ]
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def walk(self, view, url, user=None, link='next'):
+        """ Follow the `link` links and return the ids of all pages. """
+        ids = []
+        while url:
+            request = self.factory.get(url)
+            if user:
+                request.user = user
+            response = view(request)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse('count' in response.data)
+            ids.append([r.get('id') for r in response.data.get('results')])
+            url = response.data.get(link)
+        return ids
+
+    def test_recipe_orderings(self):
+        """ The cursor pages match the offset pages, for every ordering """
+        view = recipe_views.RecipeViewSet.as_view({'get': 'list'})
+        for ordering in ['', '&ordering=rating', '&ordering=-rating', '&ordering=title', '&ordering=-pub_date']:
+            response = view(self.factory.get('/api/v1/recipe/recipes/?fields=id&limit=100' + ordering))
+            expected = [r.get('id') for r in response.data.get('results')]
+
+            pages = self.walk(view, '/api/v1/recipe/recipes/?fields=id&limit=7&cursor=' + ordering)
+            self.assertEqual(len(pages), 5)
+            self.assertEqual(sum(pages, []), expected)
+
+    def test_recipe_ties(self):
+        """ Rows with the same ordering value are neither skipped nor repeated """
+        Recipe.objects.update(rating=3)
+        view = recipe_views.RecipeViewSet.as_view({'get': 'list'})
+
+        pages = self.walk(view, '/api/v1/recipe/recipes/?fields=id&limit=4&cursor=&ordering=-rating')
+        ids = sum(pages, [])
+        self.assertEqual(len(ids), 31)
+        self.assertEqual(len(set(ids)), 31)
+
+    def test_previous(self):
+        """ The previous links walk the pages backwards """
+        view = recipe_views.RecipeViewSet.as_view({'get': 'list'})
+        forward = self.walk(view, '/api/v1/recipe/recipes/?fields=id&limit=10&cursor=')
+
+        request = self.factory.get('/api/v1/recipe/recipes/?fields=id&limit=10&cursor=')
+        url = view(request).data.get('next')
+        url = view(self.factory.get(url)).data.get('next')
+        backward = self.walk(view, url, link='previous')
+
+        self.assertEqual(backward, list(reversed(forward[:3])))
+
+    def test_inserts_do_not_shift_pages(self):
+        """ A recipe created while paging does not repeat rows on the next page """
+        view = recipe_views.RecipeViewSet.as_view({'get': 'list'})
+        response = view(self.factory.get('/api/v1/recipe/recipes/?fields=id&limit=10&cursor='))
+        first = [r.get('id') for r in response.data.get('results')]
+
+        Recipe.objects.create(title='Brand new', servings=1)
+
+        response = view(self.factory.get(response.data.get('next')))
+        second = [r.get('id') for r in response.data.get('results')]
+        self.assertFalse(set(first) & set(second))
+
+    def test_invalid_cursor(self):
+        view = recipe_views.RecipeViewSet.as_view({'get': 'list'})
+        response = view(self.factory.get('/api/v1/recipe/recipes/?cursor=nonsense'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_grocery_items(self):
+        view = list_views.GroceryItemViewSet.as_view({'get': 'list'})
+        pages = self.walk(view, '/api/v1/list/items/?list=8&limit=3&cursor=', user=User.objects.get(pk=1))
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
+from io import StringIO
+from django.core.management import call_command
 from django.test import TestCase
 from v1.recipe.models import Recipe
-from v1.common.recipe_search import get_search_results
+from v1.common.recipe_search import SearchBackend, build_search_document, get_search_backend, get_search_results, search_recipes
 
 
 class GetSearchResultsTests(TestCase):
@@ -12,10 +14,14 @@ class GetSearchResultsTests(TestCase):
         'course_data.json',
         'cuisine_data.json',
         'season_data.json',
+        'tag_data.json',
         'recipe_data.json',
         'ing_data.json'
     ]
 
+    def setUp(self):
+        call_command('build_search_documents', stdout=StringIO())
+
     def test_get_search_results(self):
         """ Run a search that will return data """
         query = get_search_results(
@@ -35,3 +41,37 @@ class GetSearchResultsTests(TestCase):
         ).distinct()
 
         self.assertTrue(len(query.all()) == 0)
+
+    def test_search_document(self):
+        """ The search document holds the normalized title, ingredients, tags and seasons """
+        recipe = Recipe.objects.get(slug='tasty-chili')
+        self.assertEqual(recipe.search_document, recipe.build_search_document())
+        self.assertTrue(recipe.search_document.startswith('tasty chili'))
+        self.assertEqual(build_search_document('  Tasty\tChili ', None, 'BEANS'), 'tasty chili beans')
+
+    def test_search_recipes(self):
+        """ Search the search document through the database's search backend """
+        query = search_recipes(Recipe.objects, 'chili')
+        self.assertTrue(query.count() > 0)
+        self.assertEqual(query.count(), query.distinct().count())
+
+        query = search_recipes(Recipe.objects, 'blue berry')
+        self.assertEqual(query.count(), 0)
+
+    def test_search_backend_ranked_ids(self):
+        """ The fallback and the native backend find the same recipes """
+        native = get_search_backend().ranked_ids(Recipe.objects, 'tasty chili')
+        fallback = SearchBackend().ranked_ids(Recipe.objects, 'tasty chili')
+
+        self.assertTrue(len(native) > 0)
+        self.assertEqual(sorted(native), sorted(fallback))
+
+    def test_search_backend_prefix_match(self):
+        """ The native backend matches word prefixes, unlike the fallback it doesn't match inside words """
+        native = get_search_backend()
+        self.assertNotEqual(type(native), SearchBackend)
+        chili = set(native.ranked_ids(Recipe.objects, 'chili'))
+        self.assertTrue(chili)
+        self.assertTrue(chili <= set(native.ranked_ids(Recipe.objects, 'chil')))
+        self.assertEqual(native.ranked_ids(Recipe.objects, 'hili'), [])
+        self.assertTrue(len(SearchBackend().ranked_ids(Recipe.objects, 'hili')) > 0)
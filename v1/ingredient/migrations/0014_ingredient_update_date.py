@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingredient', '0013_auto_20220514_1110'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='update_date',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='ingredientgroup',
+            name='update_date',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
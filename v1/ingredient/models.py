@@ -2,9 +2,12 @@
 # encoding: utf-8
 
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 
 from v1.recipe.models import Recipe
+from v1.recipe.versions import bump_collection_version
 
 
 class IngredientGroup(models.Model):
@@ -13,9 +16,11 @@ class IngredientGroup(models.Model):
     Ingredient Groups share a many to one relationship.
     Meaning each Recipe will have many Ingredient Groups.
     :title: = Title of the Ingredient Group (EX: Cheddar Biscuits)
+    :update_date: = When the Ingredient Group was updated
     """
     title = models.CharField(_('title'), max_length=150, null=True, blank=True)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='ingredient_groups')
+    update_date = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ['title', 'recipe']
@@ -34,12 +39,21 @@ class Ingredient(models.Model):
     :denominator: = Denominator of the quantity expressed as a fraction
     :measurement: = Measurement of the Ingredient (EX: Liters, Cups, Grams, tablespoons)
     :quantity: = Amount of the Ingredient Needed (EX: 200, 15, 2)
+    :update_date: = When the Ingredient was updated
     """
     title = models.CharField(_('title'), max_length=250)
     numerator = models.FloatField(_('numerator'), default=0)
     denominator = models.FloatField(_('denominator'), default=1)
     measurement = models.CharField(_('measurement'), max_length=200, blank=True, null=True)
     ingredient_group = models.ForeignKey(IngredientGroup, on_delete=models.CASCADE, related_name='ingredients', null=True)
+    update_date = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return '%s' % self.title
+
+@receiver(post_save, sender=IngredientGroup)
+@receiver(post_delete, sender=IngredientGroup)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_recipe_version(sender, **kwargs):
+    bump_collection_version('recipe')
@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.contrib import admin
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    search_fields = ['name', 'key']
+    list_display = ['name', 'status', 'run_at', 'attempts', 'locked_by']
+    list_filter = ['status', 'name']
+
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,57 @@
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from v1.jobs.queue import claim_jobs, run_job, run_pending_jobs, schedule_periodic_jobs
+
+
+def _run_job(job):
+    try:
+        run_job(job)
+    finally:
+        # Every thread has its own connection.
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Runs the background jobs (e.g. deleting orphan files) on a thread pool, until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=getattr(settings, 'JOB_WORKER_THREADS', 2), help='Number of jobs run at once')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when there is nothing to do')
+        parser.add_argument('--once', action='store_true', help='Run the due jobs one after the other and exit')
+
+    def handle(self, *args, **options):
+        worker = '%s:%s' % (socket.gethostname(), os.getpid())
+        schedule_periodic_jobs()
+        if options['once']:
+            count = run_pending_jobs(worker)
+            self.stdout.write(self.style.SUCCESS('Successfully ran %s jobs' % count))
+            return
+
+        threads = max(1, options['threads'])
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        self.stdout.write('Worker %s started with %s threads' % (worker, threads))
+
+        running = set()
+        # Leaving the block waits for the running jobs.
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='job') as executor:
+            try:
+                while not stop.is_set():
+                    running = {future for future in running if not future.done()}
+                    jobs = claim_jobs(threads - len(running), worker) if len(running) < threads else []
+                    for job in jobs:
+                        running.add(executor.submit(_run_job, job))
+                    if not jobs:
+                        close_old_connections()
+                        stop.wait(options['poll_interval'])
+            except KeyboardInterrupt:
+                pass
+            self.stdout.write('Worker %s stopping, waiting for the running jobs' % worker)
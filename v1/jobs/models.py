@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class Job(models.Model):
+    """
+    Django Model to hold a background job, run by the `run_worker` command.
+    Queued by `v1.jobs.queue.enqueue`, in the transaction of the change it follows from,
+    so it isn't run if that rolls back.
+    Done jobs are deleted, failed ones are kept for a while.
+    :name: = The registered name of the job function, see `v1.jobs.queue.job`
+    :args: = The arguments of the job function (JSON)
+    :key: = De-duplication key, a job isn't queued while one with the same key is pending
+    :status: = pending, running or failed
+    :run_at: = When the job is due
+    :attempts: = How often the job was started
+    :last_error: = The error of the last attempt
+    :locked_by: = The worker running the job
+    :locked_at: = When the worker started the job
+    :pub_date: = When the job was queued
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+
+    name = models.CharField(_('name'), max_length=100)
+    args = models.JSONField(_('args'), default=list, blank=True)
+    key = models.CharField(_('key'), max_length=191, unique=True, null=True, blank=True)
+    status = models.CharField(_('status'), max_length=10, default=PENDING, choices=(
+        (PENDING, _('pending')),
+        (RUNNING, _('running')),
+        (FAILED, _('failed')),
+    ))
+    run_at = models.DateTimeField(_('run at'), default=timezone.now)
+    attempts = models.IntegerField(_('attempts'), default=0)
+    last_error = models.TextField(_('last error'), blank=True, default='')
+    locked_by = models.CharField(_('locked by'), max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(_('locked at'), null=True, blank=True)
+    pub_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at'),
+        ]
+
+    def __str__(self):
+        return '%s (%s)' % (self.name, self.status)
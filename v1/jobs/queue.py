@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# The registered job functions by name, see `job`.
+_jobs = {}
+
+
+def job(name, max_attempts=5, every=None, on_failure=None):
+    """
+    Usage: Registers a function as job `name`, so `enqueue` can queue it for the worker.
+    A failed job is retried up to `max_attempts` times, waiting twice as long each time.
+    After the last attempt `on_failure` is called with the same arguments.
+    With `every` (a `timedelta`) the worker also runs it periodically.
+    Register in a module imported on startup (e.g. the `models.py` of the app),
+    the arguments have to be JSON serializable.
+    Example:
+        @job('recipe.delete_file')
+        def delete_file(model_label, fieldname, file_name):
+            ...
+    """
+    def register(function):
+        function.job_name = name
+        function.max_attempts = max_attempts
+        function.every = every
+        function.on_failure = on_failure
+        _jobs[name] = function
+        return function
+    return register
+
+
+def registered_jobs():
+    return dict(_jobs)
+
+
+def enqueue(function, *args, key=None, run_at=None):
+    """
+    Usage: Queues the job `function(*args)` for the worker, as part of the current transaction.
+    A job with a `key` isn't queued again while one with the same key is pending.
+    Example:
+        enqueue(delete_file, 'recipe.Recipe', 'photo', 'upload/recipe_photos/food.jpg')
+    """
+    values = dict(name=function.job_name, args=list(args), run_at=run_at or timezone.now())
+    if key is None:
+        Job.objects.create(**values)
+        return
+    try:
+        with transaction.atomic():
+            Job.objects.create(key=key, **values)
+    except IntegrityError:
+        # Already pending.
+        pass
+
+
+def schedule_periodic_jobs():
+    """ Usage: Queues the periodic jobs that aren't pending or running yet, see `job`. """
+    for name, function in _jobs.items():
+        if function.every is not None and not Job.objects.filter(
+            name=name, status__in=(Job.PENDING, Job.RUNNING)
+        ).exists():
+            enqueue(function, key=name)
+
+
+def claim_jobs(limit, worker='local'):
+    """
+    Usage: Claims up to `limit` due jobs for `worker`, marking them running.
+    Several workers may claim at once, locked rows are skipped where the database can.
+    A job running longer than `JOB_TIMEOUT` seconds counts as abandoned, it's claimed again.
+    """
+    now = timezone.now()
+    abandoned = now - timedelta(seconds=getattr(settings, 'JOB_TIMEOUT', 3600))
+    with transaction.atomic():
+        due = Job.objects.filter(
+            Q(status=Job.PENDING, run_at__lte=now) | Q(status=Job.RUNNING, locked_at__lt=abandoned)
+        ).order_by('run_at')
+        due = due.select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+        ids = list(due.values_list('id', flat=True)[:limit])
+        # A running job no longer blocks its key, a change meanwhile queues it again.
+        Job.objects.filter(id__in=ids).update(
+            status=Job.RUNNING, key=None, locked_by=worker, locked_at=now, attempts=F('attempts') + 1
+        )
+    return list(Job.objects.filter(id__in=ids).order_by('run_at'))
+
+
+def run_job(job):
+    """ Usage: Runs a claimed job, deletes it when done, otherwise retries it later or marks it failed. """
+    function = _jobs.get(job.name)
+    try:
+        if function is None:
+            raise LookupError('Unknown job "%s".' % job.name)
+        function(*job.args)
+    except Exception as e:
+        logger.error('Job %s failed (attempt %s).' % (job.name, job.attempts), exc_info=e)
+        error = traceback.format_exc()
+        if function is not None and job.attempts < function.max_attempts:
+            delay = getattr(settings, 'JOB_RETRY_DELAY', 30) * 2 ** (job.attempts - 1)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.PENDING, run_at=timezone.now() + timedelta(seconds=delay), last_error=error
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(status=Job.FAILED, last_error=error)
+            if function is not None:
+                if function.on_failure is not None:
+                    try:
+                        function.on_failure(*job.args)
+                    except Exception as e:
+                        logger.error('Failure handler of job %s failed.' % job.name, exc_info=e)
+                # A periodic job still runs next time.
+                schedule_next_run(function, job)
+        return False
+
+    Job.objects.filter(pk=job.pk).delete()
+    schedule_next_run(function, job)
+    return True
+
+
+def schedule_next_run(function, job):
+    if function.every is not None:
+        enqueue(function, *job.args, key=job.name, run_at=timezone.now() + function.every)
+
+
+def run_pending_jobs(worker='local'):
+    """ Usage: Runs the due jobs one after the other in this thread, returns how many ran. """
+    count = 0
+    while True:
+        jobs = claim_jobs(100, worker)
+        if not jobs:
+            return count
+        for job in jobs:
+            run_job(job)
+        count += len(jobs)
+
+
+@job('jobs.delete_failed_jobs', every=timedelta(days=1))
+def delete_failed_jobs():
+    """ Deletes the failed jobs older than `JOB_KEEP_FAILED_DAYS`. """
+    before = timezone.now() - timedelta(days=getattr(settings, 'JOB_KEEP_FAILED_DAYS', 30))
+    Job.objects.filter(status=Job.FAILED, pub_date__lt=before).delete()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from v1.jobs.models import Job
+from v1.jobs.queue import claim_jobs, enqueue, job, registered_jobs, run_job, run_pending_jobs
+
+calls = []
+
+
+@job('tests.append')
+def append(value):
+    calls.append(value)
+
+
+@job('tests.fail', max_attempts=2)
+def fail():
+    raise ValueError('failed')
+
+
+@job('tests.periodic', every=timedelta(hours=1))
+def periodic():
+    calls.append('periodic')
+
+
+@job('tests.periodic_fail', max_attempts=1, every=timedelta(hours=1))
+def periodic_fail():
+    raise ValueError('failed')
+
+
+class JobTests(TestCase):
+
+    def setUp(self):
+        del calls[:]
+
+    def test_enqueue_and_run(self):
+        enqueue(append, 1)
+        enqueue(append, 2)
+        self.assertEqual(run_pending_jobs(), 2)
+        self.assertEqual(calls, [1, 2])
+        self.assertFalse(Job.objects.exists())
+
+    def test_key(self):
+        """ A pending job isn't queued twice, once it's running it is """
+        enqueue(append, 1, key='append')
+        enqueue(append, 1, key='append')
+        self.assertEqual(Job.objects.count(), 1)
+
+        claimed = claim_jobs(10)
+        enqueue(append, 1, key='append')
+        self.assertEqual(Job.objects.count(), 2)
+        run_job(claimed[0])
+        run_pending_jobs()
+        self.assertEqual(calls, [1, 1])
+
+    def test_scheduled(self):
+        enqueue(append, 1, run_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(run_pending_jobs(), 0)
+        self.assertEqual(Job.objects.get().status, Job.PENDING)
+
+    @override_settings(JOB_RETRY_DELAY=10)
+    def test_retry_with_backoff(self):
+        enqueue(fail)
+        before = timezone.now()
+        self.assertEqual(run_pending_jobs(), 1)
+        failed = Job.objects.get()
+        self.assertEqual((failed.status, failed.attempts), (Job.PENDING, 1))
+        self.assertGreaterEqual(failed.run_at, before + timedelta(seconds=10))
+        self.assertIn('ValueError', failed.last_error)
+
+        # The last attempt marks it failed.
+        Job.objects.update(run_at=timezone.now())
+        run_pending_jobs()
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    def test_abandoned(self):
+        enqueue(append, 1)
+        claim_jobs(10)
+        self.assertEqual(run_pending_jobs(), 0)
+        Job.objects.update(locked_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(run_pending_jobs(), 1)
+        self.assertEqual(calls, [1])
+
+    def test_periodic(self):
+        self.assertIn('recipe.delete_file', registered_jobs())
+        call_command('run_worker', once=True, stdout=StringIO())
+        self.assertIn('periodic', calls)
+        # Queued again for the next run.
+        self.assertGreater(Job.objects.get(name='tests.periodic').run_at, timezone.now() + timedelta(minutes=59))
+
+        call_command('run_worker', once=True, stdout=StringIO())
+        self.assertEqual(calls.count('periodic'), 1)
+
+    def test_periodic_failed(self):
+        """ A periodic job failing for good still runs next time """
+        enqueue(periodic_fail, key='tests.periodic_fail')
+        run_pending_jobs()
+        jobs = Job.objects.filter(name='tests.periodic_fail').order_by('id')
+        self.assertEqual([job.status for job in jobs], [Job.FAILED, Job.PENDING])
+        self.assertGreater(jobs[1].run_at, timezone.now() + timedelta(minutes=59))
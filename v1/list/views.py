@@ -7,6 +7,7 @@ from rest_framework_bulk import ListBulkCreateUpdateDestroyAPIView
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q
 
+from v1.common.pagination import LimitOffsetOrKeysetPagination
 from v1.common.permissions import IsOwner
 from .models import GroceryList, GroceryItem
 from .serializers import GroceryListSerializer, \
@@ -43,6 +44,7 @@ class GroceryItemViewSet(viewsets.ModelViewSet):
     """
     serializer_class = GroceryItemSerializer
     permission_classes = (IsItemOwner,)
+    pagination_class = LimitOffsetOrKeysetPagination
     filter_backends = (DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter)
     filterset_fields = ('list',)
     ordering_fields = ('list_id', 'order', 'pk')
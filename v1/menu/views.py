@@ -10,6 +10,7 @@ from django.db.models import Count, Max
 from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
 
+from v1.common.pagination import LimitOffsetOrKeysetPagination
 from v1.recipe.models import Recipe
 from .models import MenuItem
 from .serializers import MenuItemSerializer
@@ -29,6 +30,7 @@ class MenuItemViewSet(viewsets.ModelViewSet):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
     permission_classes = (IsGlobalOrOwner,)
+    pagination_class = LimitOffsetOrKeysetPagination
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     filterset_fields = ('recipe', 'start_date', 'complete_date', 'complete')
     ordering_fields = ('start_date', 'id')
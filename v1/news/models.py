@@ -4,10 +4,10 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
-from v1.common.db_fields import AutoSlugField
+from v1.common.db_fields import AutoSlugField, AutoSlugRetryMixin, FileNamesMixin
 
 
-class News(models.Model):
+class News(AutoSlugRetryMixin, FileNamesMixin, models.Model):
     """
     Django Model to hold News that will display on the homepage.
     :title: = Title of the News
@@ -1,13 +1,70 @@
+import time
+from math import floor
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
 
+from v1.rating.models import Rating, rating_avg
+from v1.recipe.facet_counts import rebuild_facet_counts
 from v1.recipe.models import Recipe
-from v1.rating.models import update_recipe_rating
+from v1.recipe.versions import bump_collection_version
+
 
 class Command(BaseCommand):
     help = 'Calculates all recipes ratings (avg, count)'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of recipes updated per query')
+        parser.add_argument('--start-id', type=int, default=0, help='Resume after this recipe id, see the checkpoints')
+
     def handle(self, *args, **options):
-        for recipe in Recipe.objects.all():
-          update_recipe_rating(recipe)
+        chunk_size = options['chunk_size']
+        last_id = options['start_id']
+        total = 0
+        changed = 0
+        started = time.monotonic()
+        while True:
+            recipes = list(
+                Recipe.objects.filter(id__gt=last_id).order_by('id')
+                .only('id', 'rating', 'rating_bucket', 'rating_count', 'rating_sum')[:chunk_size]
+            )
+            if not recipes:
+                break
+
+            # One grouped aggregate for the whole chunk.
+            totals = {
+                recipe_id: (rating_sum, rating_count) for recipe_id, rating_sum, rating_count in
+                Rating.objects.filter(recipe_id__gte=recipes[0].id, recipe_id__lte=recipes[-1].id).order_by()
+                .values('recipe_id').annotate(rating_sum=Sum('rating'), rating_count=Count('id'))
+                .values_list('recipe_id', 'rating_sum', 'rating_count')
+            }
+
+            updates = []
+            for recipe in recipes:
+                rating_sum, rating_count = totals.get(recipe.id, (0, 0))
+                rating = rating_avg(rating_sum, rating_count)
+                fields = (rating, floor(rating), rating_count, rating_sum)
+                if (recipe.rating, recipe.rating_bucket, recipe.rating_count, recipe.rating_sum) != fields:
+                    recipe.rating, recipe.rating_bucket, recipe.rating_count, recipe.rating_sum = fields
+                    updates.append(recipe)
+            if updates:
+                with transaction.atomic():
+                    # Leaves update_date alone, recalculating doesn't edit the recipes.
+                    Recipe.objects.bulk_update(updates, ['rating', 'rating_bucket', 'rating_count', 'rating_sum'])
+                    bump_collection_version('recipe')
+
+            last_id = recipes[-1].id
+            total += len(recipes)
+            changed += len(updates)
+            self.stdout.write('Checkpoint: %s recipes up to id %s (resume with --start-id %s)' % (total, last_id, last_id))
+
+        # The changed ratings may count towards other rating facets.
+        # Also when nothing changed, an interrupted run may have written chunks before this one resumed it.
+        rebuild_facet_counts()
 
-        self.stdout.write(self.style.SUCCESS('Successfully updated recipe rating fields'))
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully updated recipe rating fields, %s of %s recipes changed in %.1fs (%d recipes/s)'
+            % (changed, total, elapsed, total / elapsed if elapsed else total)
+        ))
@@ -1,16 +1,20 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
-from django.db import models
+from django.db import models, transaction
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Avg
-from django.db.models.signals import post_save, post_delete
+from django.db.models import Case, Count, F, FloatField, IntegerField, Sum, Value, When
+from django.db.models.functions import Cast, Floor
+from django.db.models.lookups import GreaterThan
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
 
 from math import floor
 
+from v1.recipe.facet_counts import FacetCounter, deleting, move_rating
 from v1.recipe.models import Recipe
+from v1.recipe.versions import bump_collection_version
 
 
 class Rating(models.Model):
@@ -37,24 +41,127 @@ class Rating(models.Model):
     def __str__(self):
         return '%s - %s' % (self.rating, self.comment)
 
+    def save(self, *args, **kwargs):
+        # The stored rating is read in the same transaction as the write, see `lock_stored_rating`.
+        with transaction.atomic(savepoint=False):
+            lock_stored_rating(self)
+            super(Rating, self).save(*args, **kwargs)
+
 @receiver(post_save, sender=Rating)
-def update_recipe_rating_on_save(sender, instance, **kwargs):
-    recipe = getattr(instance, 'recipe')
-    if recipe:
-        update_recipe_rating(recipe)
-    return
+@receiver(post_delete, sender=Rating)
+def bump_recipe_version(sender, **kwargs):
+    bump_collection_version('recipe')
+
+@receiver(post_init, sender=Rating)
+def remember_rating(sender, instance, **kwargs):
+    # The stored recipe and rating, so a change is applied as a delta.
+    # Raw values, a deferred field isn't loaded just for this.
+    instance._original_rating = (instance.__dict__.get('recipe_id'), instance.__dict__.get('rating'))
+
+def lock_stored_rating(instance):
+    """
+    Usage: Reads and locks the stored recipe and rating of a rating about to be changed or deleted,
+    in the transaction of the write.
+    The loaded ones may be stale, another request may have changed the rating meanwhile.
+    So concurrent edits apply their deltas one after the other.
+    """
+    if instance.pk is None or instance._state.adding or instance.recipe_id in deleting():
+        return
+    stored = Rating.objects.select_for_update().filter(pk=instance.pk).values_list('recipe_id', 'rating').first()
+    # Gone already, the recipe is recalculated.
+    instance._original_rating = stored or (None, None)
+
+@receiver(pre_delete, sender=Rating)
+def lock_stored_rating_on_delete(sender, instance, **kwargs):
+    lock_stored_rating(instance)
+
+@receiver(post_save, sender=Rating)
+def update_recipe_rating_on_save(sender, instance, created=False, raw=False, **kwargs):
+    # A loaded fixture may overwrite a stored rating, recalculate.
+    apply_rating_changes(None if raw else rating_changes(instance, added=created), instance)
+    remember_rating(sender, instance)
 
 @receiver(post_delete, sender=Rating)
 def update_recipe_rating_on_delete(sender, instance, **kwargs):
-    recipe = getattr(instance, 'recipe')
-    if recipe:
-        update_recipe_rating(recipe)
-    return
+    apply_rating_changes(rating_changes(instance, deleted=True), instance)
 
+def rating_changes(instance, added=False, deleted=False):
+    """
+    Usage: Returns the `(recipe_id, sum_delta, count_delta)` a rating save or delete applies to its recipes.
+    `None` if the stored values aren't known, the recipe is then recalculated.
+    """
+    recipe_id, rating = getattr(instance, '_original_rating', (None, None))
+    if added:
+        return [(instance.recipe_id, instance.rating, 1)]
+    if recipe_id is None or rating is None:
+        return None
+    if deleted:
+        return [(recipe_id, -rating, -1)]
+    if recipe_id != instance.recipe_id:
+        return [(recipe_id, -rating, -1), (instance.recipe_id, instance.rating, 1)]
+    return [(recipe_id, instance.rating - rating, 0)]
+
+def apply_rating_changes(changes, instance):
+    if changes is None:
+        if instance.recipe_id is not None:
+            update_recipe_rating(Recipe(pk=instance.recipe_id))
+        return
+    for recipe_id, sum_delta, count_delta in changes:
+        if sum_delta or count_delta:
+            add_to_recipe_rating(recipe_id, sum_delta, count_delta)
+
+def rating_avg(rating_sum, rating_count):
+    """ Usage: Returns the avg rating stored on a recipe, floored to 1 decimal. """
+    return floor(rating_sum * 10 / rating_count) / 10 if rating_count > 0 else 0
+
+def _rating_avg(rating_sum, rating_count):
+    # The `rating_avg` of column expressions.
+    return Case(
+        When(GreaterThan(rating_count, 0), then=Floor(rating_sum * 10.0 / rating_count) / 10.0),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+@transaction.atomic
+def add_to_recipe_rating(recipe_id, sum_delta, count_delta):
+    """
+    Usage: Adds a rating change to the rating fields of a recipe, one targeted UPDATE.
+    Concurrent raters don't overwrite each other,
+    and `update_date` is left alone, rating a recipe doesn't edit it.
+    Example:
+        add_to_recipe_rating(recipe.id, 4, 1)  # a new 4 star rating
+    """
+    if recipe_id in deleting():
+        # Its counts are gone already, see `deleting`.
+        return
+
+    rating_sum, rating_count = F('rating_sum') + sum_delta, F('rating_count') + count_delta
+    # The averages are set first: MySQL reads the columns set before them with their new values.
+    if not Recipe.objects.filter(pk=recipe_id).update(
+        rating=_rating_avg(rating_sum, rating_count),
+        rating_bucket=Cast(Floor(_rating_avg(rating_sum, rating_count)), IntegerField()),
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+    ):
+        return
+
+    # The row stays locked until the commit, so the values before are exact.
+    row = Recipe.objects.filter(pk=recipe_id).values('rating_sum', 'rating_count', 'rating', 'public').get()
+    before = rating_avg(row['rating_sum'] - sum_delta, row['rating_count'] - count_delta)
+    move_rating(recipe_id, row['public'], before, row['rating'])
+
+@transaction.atomic
 def update_recipe_rating(recipe=Recipe):
-    ratings = Rating.objects.filter(recipe__id=recipe.id)
-    rating_avg = ratings.aggregate(Avg('rating'))['rating__avg'] or 0
-    recipe.rating = floor(rating_avg*10)/10 # floor to 1 decimal
-    recipe.rating_count = ratings.count()
-    recipe.save()
-    return
\ No newline at end of file
+    """ Usage: Recalculates the rating fields of a recipe from all its ratings, see `calc_ratings`. """
+    facet_counter = FacetCounter(recipe)
+    totals = Rating.objects.filter(recipe__id=recipe.id).aggregate(rating_sum=Sum('rating'), rating_count=Count('id'))
+    recipe.rating_sum = totals['rating_sum'] or 0
+    recipe.rating_count = totals['rating_count']
+    recipe.rating = rating_avg(recipe.rating_sum, recipe.rating_count)
+    recipe.rating_bucket = floor(recipe.rating)
+    Recipe.objects.filter(pk=recipe.pk).update(
+        rating=recipe.rating, rating_bucket=recipe.rating_bucket,
+        rating_sum=recipe.rating_sum, rating_count=recipe.rating_count
+    )
+    facet_counter.commit(recipe)
+    return
@@ -1,8 +1,14 @@
 # #!/usr/bin/env python
 # # encoding: utf-8
 
+from io import StringIO
+from math import floor
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
+from v1.rating.models import Rating, update_recipe_rating
+from v1.recipe.facet_counts import rebuild_facet_counts
+from v1.recipe.models import FacetCount, Recipe
 
 
 class RatingsSerializerTests(TestCase):
@@ -117,3 +123,91 @@ class RatingsSerializerTests(TestCase):
         self.assertEqual(response.status_code, 200)
         retrieved_recipe_data = response.json()
         self.assertEqual(retrieved_recipe_data['slug'], new_rating_data['recipe'])
+
+
+class RecipeRatingTests(TestCase):
+    fixtures = ['test/users.json', 'course_data.json', 'cuisine_data.json', 'season_data.json', 'tag_data.json', 'recipe_data.json']
+
+    def setUp(self):
+        call_command('rebuild_facet_counts', stdout=StringIO())
+        self.user = User.objects.get(pk=1)
+        self.recipe = Recipe.objects.get(slug='tasty-chili')
+
+    def assertRating(self, rating, rating_count, rating_sum):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        self.assertEqual((recipe.rating, recipe.rating_count, recipe.rating_sum), (rating, rating_count, rating_sum))
+        self.assertEqual(recipe.rating_bucket, floor(rating))
+        # The recipe isn't edited by its ratings.
+        self.assertEqual(recipe.update_date, self.recipe.update_date)
+        # The facet counts moved along.
+        self.assertEqual(rebuild_facet_counts(), 0)
+
+    def test_rating_deltas(self):
+        """ Creating, changing and deleting ratings adds to the rating fields of the recipe """
+        Rating.objects.create(recipe=self.recipe, comment='good', rating=4, author=self.user)
+        rating = Rating.objects.create(recipe=self.recipe, comment='ok', rating=3, author=self.user)
+        self.assertRating(3.5, 2, 7)
+
+        rating = Rating.objects.get(pk=rating.pk)
+        rating.rating = 2
+        rating.save()
+        self.assertRating(3.0, 2, 6)
+
+        rating.comment = 'meh'
+        # The stored rating and the update.
+        with self.assertNumQueries(2):
+            rating.save()
+
+        # Changed meanwhile, the change applies to the stored rating.
+        stale = Rating.objects.get(pk=rating.pk)
+        rating.rating = 5
+        rating.save()
+        self.assertRating(4.5, 2, 9)
+        stale.rating = 2
+        stale.save()
+        self.assertRating(3.0, 2, 6)
+
+        Rating.objects.filter(rating=4).delete()
+        self.assertRating(2.0, 1, 2)
+        rating.delete()
+        self.assertRating(0, 0, 0)
+
+    def test_update_recipe_rating(self):
+        """ The full recalculation agrees with the deltas """
+        for value in (5, 4, 4):
+            Rating.objects.create(recipe=self.recipe, comment='good', rating=value, author=self.user)
+        Recipe.objects.filter(pk=self.recipe.pk).update(rating=0, rating_count=0, rating_sum=0)
+        rebuild_facet_counts()
+        update_recipe_rating(self.recipe)
+        self.assertRating(4.3, 3, 13)
+
+    def test_calc_ratings(self):
+        """ The command recalculates the ratings in chunks and resumes after a checkpoint """
+        for value in (5, 4, 4):
+            Rating.objects.create(recipe=self.recipe, comment='good', rating=value, author=self.user)
+        Recipe.objects.update(rating=1, rating_count=1, rating_sum=1)
+
+        call_command('calc_ratings', start_id=self.recipe.pk, stdout=StringIO())
+        self.assertEqual(Recipe.objects.get(pk=self.recipe.pk).rating_sum, 1)
+
+        out = StringIO()
+        call_command('calc_ratings', chunk_size=2, stdout=out)
+        self.assertIn('Checkpoint: 2 recipes', out.getvalue())
+        self.assertRating(4.3, 3, 13)
+        self.assertFalse(Recipe.objects.exclude(pk=self.recipe.pk).exclude(rating=0, rating_count=0, rating_sum=0).exists())
+
+    def test_calc_ratings_resumed(self):
+        """ A resumed run reconciles the facets of the chunks the interrupted run wrote """
+        def rating_facets():
+            return set(FacetCount.objects.filter(facet='rating').values_list('value', 'public', 'total'))
+
+        rebuild_facet_counts()
+        # Written by the interrupted run, the facets weren't reconciled yet.
+        Recipe.objects.filter(pk=self.recipe.pk).update(rating=4, rating_bucket=4, rating_count=1, rating_sum=4)
+        stale = rating_facets()
+
+        call_command('calc_ratings', start_id=Recipe.objects.order_by('-pk').first().pk, stdout=StringIO())
+        self.assertNotEqual(rating_facets(), stale)
+        reconciled = rating_facets()
+        rebuild_facet_counts()
+        self.assertEqual(rating_facets(), reconciled)
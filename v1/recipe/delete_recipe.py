@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.deletion import CASCADE, DO_NOTHING, get_candidate_relations_to_delete
+
+from v1.recipe.facet_counts import FacetCounter
+from v1.recipe.models import Recipe, delete_file_if_unused
+from v1.recipe.versions import bump_collection_version
+
+
+def _cascade(model, queryset, deletes):
+    """
+    Usage: Appends the querysets deleting the rows `queryset` cascades to, and `queryset` itself,
+    dependent rows first. `False` if a relation needs the collector (e.g. `SET_NULL` or `PROTECT`).
+    """
+    for related in get_candidate_relations_to_delete(model._meta):
+        if related.on_delete is DO_NOTHING:
+            continue
+        if related.on_delete is not CASCADE:
+            return False
+        related_model = related.related_model
+        related_queryset = related_model._base_manager.filter(**{'%s__in' % related.field.name: queryset})
+        if not _cascade(related_model, related_queryset, deletes):
+            return False
+    deletes.append(queryset)
+    return True
+
+
+@transaction.atomic
+def delete_recipe(recipe):
+    """
+    Usage: Deletes a recipe with its ingredient groups, ingredients, subrecipe links,
+    ratings, menu items, tags and seasons, one DELETE per table.
+
+    Django's collector loads every one of those rows and sends their signals.
+    Here the rows aren't loaded, the effects of the signals are applied once instead:
+    the facet counts, the recipe version and the file cleanup, which is queued for the worker.
+    Falls back to `recipe.delete()` if a relation isn't a plain cascade.
+    Example:
+        delete_recipe(Recipe.objects.get(slug='tasty-chili'))
+    """
+    deletes = []
+    if not _cascade(Recipe, Recipe._base_manager.filter(pk=recipe.pk), deletes):
+        recipe.delete()
+        return
+
+    facet_counter = FacetCounter(recipe)
+    for queryset in deletes:
+        # What the collector does for the rows without signals.
+        queryset._raw_delete(queryset.db)
+    bump_collection_version('recipe')
+
+    if settings.DELETE_ORPHAN_FILES:
+        for field in Recipe._meta.concrete_fields:
+            if isinstance(field, models.FileField):
+                delete_file_if_unused(Recipe, recipe, field.name, getattr(recipe, field.name).name)
+    facet_counter.commit(None)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import threading
+from functools import reduce
+from math import floor
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce, Floor
+
+from .facet_index import move_in_facet_index
+from .models import FacetCount, Recipe
+
+
+# The ids of the recipes this thread is deleting.
+# Their counts are already gone, cascading deletes (e.g. of their ratings)
+# must not count them again.
+_deleting = threading.local()
+
+
+def deleting():
+    if not hasattr(_deleting, 'ids'):
+        _deleting.ids = set()
+    return _deleting.ids
+
+
+def facet_keys(recipe):
+    """
+    Usage: Returns the `FacetCount` keys `(facet, value, public)` a saved recipe counts towards.
+    Everything is read from the database, so a stale instance can't skew the counts.
+    Example:
+        facet_keys(recipe)
+        {('course', 6, True), ('cuisine', 2, True), ('rating', 3, True), ('tag', 1, True)}
+    """
+    if recipe is None or recipe.pk is None or recipe.pk in deleting():
+        return set()
+
+    row = Recipe.objects.filter(pk=recipe.pk).values('course', 'cuisine', 'rating', 'public').first()
+    if row is None:
+        return set()
+
+    keys = {
+        ('course', row['course']),
+        ('cuisine', row['cuisine']),
+        ('rating', floor(row['rating'])),
+    }
+    keys.update(('season', pk) for pk in recipe.seasons.values_list('id', flat=True))
+    keys.update(('tag', pk) for pk in recipe.tags.values_list('id', flat=True))
+    return {(facet, value, row['public']) for facet, value in keys if value is not None}
+
+
+def move_facet_counts(before, after):
+    """
+    Counts a recipe out of the `FacetCount` rows of the keys `before` and into the rows of the keys `after`.
+    The missing rows are inserted first, ignoring the ones another request inserted meanwhile.
+    Then one UPDATE moves the counts. It locks the most contended rows in the app,
+    so call it last in the transaction, they stay locked until the commit.
+    Example:
+        move_facet_counts({('rating', 3, True)}, {('rating', 4, True)})
+    """
+    before, after = before - after, after - before
+    if not before and not after:
+        return
+
+    if after:
+        FacetCount.objects.bulk_create([
+            FacetCount(facet=facet, value=value, public=public, total=0) for facet, value, public in after
+        ], ignore_conflicts=True)
+
+    def matching(keys):
+        return reduce(or_, (Q(facet=facet, value=value, public=public) for facet, value, public in keys))
+
+    total = F('total') - 1
+    if after:
+        total = Case(When(matching(after), then=F('total') + 1), default=total)
+    FacetCount.objects.filter(matching(before | after)).update(total=total)
+
+
+class FacetCounter(object):
+    """
+    Moves a recipe from the `FacetCount` rows it counted towards
+    to the rows it counts towards now.
+    Only the keys that changed are touched, see `move_facet_counts`.
+    The `FacetIndex` of this process follows on commit.
+    Usage:
+        with transaction.atomic():
+            counter = FacetCounter(recipe)  # before the change, `None` for a new recipe
+            ...
+            counter.commit(recipe)  # last, after the change, `None` once it is deleted
+    """
+    def __init__(self, recipe=None):
+        self.pk = recipe.pk if recipe is not None else None
+        self.before = facet_keys(recipe)
+
+    def commit(self, recipe):
+        after = facet_keys(recipe)
+        move_facet_counts(self.before, after)
+
+        if recipe is not None:
+            self.pk = recipe.pk
+        move_in_facet_index(self.pk, self.before, after)
+        self.before = after
+
+
+def move_rating(pk, public, before, after):
+    """
+    Usage: Moves a recipe whose average rating changed from `before` to `after`
+    to the rating `FacetCount` row it counts towards now.
+    Cheaper than a `FacetCounter` when nothing but the rating changed.
+    """
+    if pk in deleting() or floor(before) == floor(after):
+        return
+
+    before, after = {('rating', floor(before), public)}, {('rating', floor(after), public)}
+    move_facet_counts(before, after)
+    move_in_facet_index(pk, before, after)
+
+
+def uncount_deleted_recipe(recipe):
+    """ `pre_delete` handler of `Recipe`, see `forget_deleted_recipe`. """
+    # The keys are read while the recipe is there, they're counted out once it's gone.
+    recipe._facet_counter = FacetCounter(recipe)
+    deleting().add(recipe.pk)
+
+
+def forget_deleted_recipe(recipe):
+    """ `post_delete` handler of `Recipe`. """
+    deleting().discard(recipe.pk)
+    facet_counter = getattr(recipe, '_facet_counter', None)
+    if facet_counter is not None:
+        del recipe._facet_counter
+        facet_counter.commit(None)
+
+
+def count_facets(recipe_model=Recipe):
+    """
+    Usage: Returns the facet totals `{(facet, value, public): total}` counted from the recipes.
+    One grouped aggregate per facet.
+    """
+    totals = {}
+    recipes = recipe_model.objects.order_by()
+
+    for facet in ('course', 'cuisine'):
+        rows = recipes.filter(**{'%s__isnull' % facet: False}).values_list(facet, 'public')
+        for value, public, total in rows.annotate(total=Count('id')):
+            totals[(facet, value, public)] = total
+
+    for facet, field in (('season', 'seasons'), ('tag', 'tags')):
+        model_field = recipe_model._meta.get_field(field)
+        rows = model_field.remote_field.through.objects.order_by().values_list(
+            model_field.m2m_reverse_field_name(), '%s__public' % model_field.m2m_field_name()
+        )
+        for value, public, total in rows.annotate(total=Count('id')):
+            totals[(facet, value, public)] = total
+
+    rows = recipes.annotate(
+        rating_c=Floor('rating', output_field=IntegerField())
+    ).values_list('rating_c', 'public')
+    for value, public, total in rows.annotate(total=Count('id')):
+        totals[('rating', value, public)] = total
+
+    return totals
+
+
+def rebuild_facet_counts(recipe_model=Recipe, count_model=FacetCount):
+    """
+    Usage: Reconciles the `FacetCount` table with the recipes, returns the number of rows fixed.
+    Takes the models as arguments, so migrations can pass their historical ones.
+    """
+    with transaction.atomic():
+        # Lock the counters first, saves running meanwhile wait for us.
+        counts = list(count_model.objects.select_for_update())
+        totals = count_facets(recipe_model)
+
+        fixed, empty = 0, []
+        for count in counts:
+            total = totals.pop((count.facet, count.value, count.public), 0)
+            if count.total != total:
+                fixed += 1
+            if not total:
+                # Also drops the rows that were counted down to 0.
+                empty.append(count.pk)
+            elif count.total != total:
+                count_model.objects.filter(pk=count.pk).update(total=total)
+        count_model.objects.filter(pk__in=empty).delete()
+
+        count_model.objects.bulk_create([
+            count_model(facet=facet, value=value, public=public, total=total)
+            for (facet, value, public), total in totals.items()
+        ], batch_size=1000)
+        return fixed + len(totals)
+
+
+def counted_facet(queryset, facet, public_only):
+    """
+    Usage: Annotates the facet values `queryset` with their number of recipes (`total`)
+    read from the `FacetCount` table, leaving out the empty ones.
+    Example:
+        counted_facet(Course.objects.order_by('title'), 'course', public_only=True)
+    """
+    counts = FacetCount.objects.filter(facet=facet, value=OuterRef('id'))
+    if public_only:
+        counts = counts.filter(public=True)
+    total = Subquery(counts.order_by().values('facet').annotate(total=Sum('total')).values('total'))
+    return queryset.annotate(total=Coalesce(total, 0)).filter(total__gt=0)
+
+
+def counted_ratings(public_only):
+    """ Usage: Returns the number of recipes per floored rating `{rating: total}` from the `FacetCount` table. """
+    counts = FacetCount.objects.filter(facet='rating', total__gt=0)
+    if public_only:
+        counts = counts.filter(public=True)
+    return dict(counts.order_by().values_list('value').annotate(total=Sum('total')))
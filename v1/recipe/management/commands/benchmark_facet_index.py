@@ -0,0 +1,116 @@
+import random
+import time
+from types import SimpleNamespace
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.http import QueryDict
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from v1.recipe.facet_index import rebuild_facet_index
+from v1.recipe.models import Recipe
+from v1.recipe.recipe_filter import RecipeFilter
+from v1.recipe_groups.models import Course, Cuisine, Season, Tag
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the browse facets counted by SQL with the bitmap facet index on synthetic recipes. '
+        'Everything runs in a transaction that is rolled back, still, do not run it on a production database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, nargs='+', default=[10000, 100000, 1000000], help='The recipe counts to benchmark')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, the best one counts')
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        with transaction.atomic():
+            self.create_groups()
+            for size in sorted(options['recipes']):
+                self.create_recipes(size)
+                self.benchmark(size)
+            transaction.set_rollback(True)
+
+    def create_groups(self):
+        self.user = User.objects.create(username='facet-benchmark')
+        self.courses = [Course.objects.create(title='Benchmark course %s' % i, author=self.user) for i in range(10)]
+        self.cuisines = [Cuisine.objects.create(title='Benchmark cuisine %s' % i, author=self.user) for i in range(20)]
+        self.seasons = [Season.objects.create(title='Benchmark season %s' % i) for i in range(4)]
+        self.tags = [Tag.objects.create(title='Benchmark tag %s' % i) for i in range(30)]
+        self.created = 0
+
+    def create_recipes(self, size):
+        # Raw inserts, the slug field queries once per recipe.
+        fields = [f for f in Recipe._meta.local_concrete_fields if not f.primary_key]
+        sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            Recipe._meta.db_table,
+            ', '.join(connection.ops.quote_name(f.column) for f in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        now = timezone.now()
+        seasons = Recipe.seasons.through
+        tags = Recipe.tags.through
+
+        while self.created < size:
+            chunk = range(self.created, min(size, self.created + 10000))
+            rows = []
+            for i in chunk:
+                recipe = Recipe(
+                    title='Benchmark recipe %s' % i, slug='benchmark-recipe-%s' % i, servings=4,
+                    course=random.choice(self.courses), cuisine=random.choice(self.cuisines),
+                    rating=random.uniform(0, 5), public=random.random() < 0.8,
+                    pub_date=now, update_date=now,
+                )
+                rows.append([f.get_db_prep_save(getattr(recipe, f.attname), connection) for f in fields])
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+
+            ids = Recipe.objects.filter(slug__in=['benchmark-recipe-%s' % i for i in chunk]).values_list('id', flat=True)
+            season_rows, tag_rows = [], []
+            for pk in ids:
+                season_rows += [seasons(recipe_id=pk, season=s) for s in random.sample(self.seasons, random.randint(0, 2))]
+                tag_rows += [tags(recipe_id=pk, tag=t) for t in random.sample(self.tags, random.randint(0, 4))]
+            seasons.objects.bulk_create(season_rows)
+            tags.objects.bulk_create(tag_rows)
+            self.created = chunk[-1] + 1
+
+    def benchmark(self, size):
+        filters = [
+            'course=%s' % self.courses[0].slug,
+            'course=%s&tag=%s,%s' % (self.courses[0].slug, self.tags[0].slug, self.tags[1].slug),
+            'cuisine=%s&season=%s&rating=3,4' % (self.cuisines[0].slug, self.seasons[0].slug),
+            'course=%s&cuisine=%s&season=%s&tag=%s&rating=4' % (
+                self.courses[0].slug, self.cuisines[0].slug, self.seasons[0].slug, self.tags[0].slug
+            ),
+        ]
+
+        with override_settings(RECIPE_FACET_INDEX=True, RECIPE_FACET_INDEX_TTL=None):
+            start = time.perf_counter()
+            rebuild_facet_index()
+            build = time.perf_counter() - start
+
+        self.stdout.write('%s recipes, index build %.0f ms' % (size, build * 1000))
+        for query in filters:
+            with override_settings(RECIPE_FACET_INDEX=False):
+                sql, sql_facets = self.measure(query)
+            with override_settings(RECIPE_FACET_INDEX=True, RECIPE_FACET_INDEX_TTL=None):
+                bitmap, bitmap_facets = self.measure(query)
+
+            if sql_facets != bitmap_facets:
+                self.stderr.write('  the facets of %s differ' % query)
+            self.stdout.write('  %-70s sql %8.1f ms   bitmap %8.1f ms   x%.0f' % (
+                query, sql * 1000, bitmap * 1000, sql / bitmap if bitmap else 0
+            ))
+
+    def measure(self, query):
+        request = SimpleNamespace(query_params=QueryDict(query), user=AnonymousUser())
+        best, facets = None, None
+        for i in range(self.repeat):
+            start = time.perf_counter()
+            facets = RecipeFilter(request).facets()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, facets
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from v1.common.recipe_search import build_search_documents
+from v1.ingredient.models import Ingredient
+from v1.recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Builds the search document of all recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of recipes updated per query')
+
+    def handle(self, *args, **options):
+        total = build_search_documents(Recipe, Ingredient, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS('Successfully built the search document of %s recipes' % total))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from v1.recipe_groups.models import delete_unused_recipe_groups
+
+
+class Command(BaseCommand):
+    help = 'Deletes the courses and cuisines no recipe uses anymore (except the ones of staff users)'
+
+    def handle(self, *args, **options):
+        courses, cuisines = delete_unused_recipe_groups()
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully deleted %s unused courses and %s unused cuisines' % (courses, cuisines)
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from v1.recipe.facet_counts import rebuild_facet_counts
+
+
+class Command(BaseCommand):
+    help = 'Recounts the recipes per course, cuisine, season, tag and rating (browse facets) and fixes any drift'
+
+    def handle(self, *args, **options):
+        fixed = rebuild_facet_counts()
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt the facet counts, %s rows fixed' % fixed))
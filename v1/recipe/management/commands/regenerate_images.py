@@ -0,0 +1,98 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from v1.recipe.models import Recipe, hash_photo
+from v1.recipe.photo_variants import generate_variants
+from v1.recipe.versions import bump_collection_version
+
+
+def regenerate(photo):
+    """
+    Renders the thumbnail and the variants of a recipe photo, in a worker process without queries.
+    Returns what to record, `None` if they are up to date, or the error.
+    """
+    pk, file_name, photo_hash, thumbnail_name, variant_names, force = photo
+    try:
+        new_hash = hash_photo(file_name)
+        if new_hash == photo_hash and not force:
+            return pk, file_name, None, None
+
+        recipe = Recipe(photo=file_name)
+        recipe.photo_thumbnail.generate(force=True)
+        variants = generate_variants(recipe.photo.storage, file_name)
+    except OSError as e:
+        return pk, file_name, None, str(e)
+
+    # Left over from the previous specs.
+    new_names = {variant['name'] for format_variants in variants.values() for variant in format_variants}
+    for name in set(variant_names) - new_names:
+        recipe.photo.storage.delete(name)
+    if thumbnail_name and thumbnail_name != recipe.photo_thumbnail.name:
+        recipe.photo.storage.delete(thumbnail_name)
+    return pk, file_name, (new_hash, recipe.photo_thumbnail.name, variants), None
+
+
+class Command(BaseCommand):
+    help = 'Regenerates the thumbnails and variants of the recipe photos that are out of date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of worker processes')
+        parser.add_argument('--chunk-size', type=int, default=100, help='Number of photos recorded per transaction')
+        parser.add_argument('--start-id', type=int, default=0, help='Resume after this recipe id, see the checkpoints')
+        parser.add_argument('--force', action='store_true', help='Regenerate the up to date photos too')
+
+    def handle(self, *args, **options):
+        last_id = options['start_id']
+        total = 0
+        regenerated = 0
+        failed = 0
+        started = time.monotonic()
+        # The workers only render, the queries stay in this process.
+        with ProcessPoolExecutor(max_workers=options['processes'], initializer=django.setup) as executor:
+            while True:
+                photos = [
+                    (pk, photo, photo_hash, thumbnail_name, [
+                        variant['name'] for format_variants in variants.values() for variant in format_variants
+                    ], options['force'])
+                    for pk, photo, photo_hash, thumbnail_name, variants in
+                    Recipe.objects.filter(id__gt=last_id).exclude(photo='').order_by('id')
+                    .values_list('id', 'photo', 'photo_hash', 'photo_thumbnail_name', 'photo_variants')
+                    [:options['chunk_size']]
+                ]
+                if not photos:
+                    break
+
+                # Rendered before the transaction, it's only held for the updates.
+                results = list(executor.map(regenerate, photos))
+                changed = 0
+                with transaction.atomic():
+                    for pk, file_name, rendered, error in results:
+                        if error is not None:
+                            failed += 1
+                            self.stderr.write('Recipe %s: regenerating "%s" failed: %s' % (pk, file_name, error))
+                        elif rendered is not None:
+                            photo_hash, thumbnail_name, variants = rendered
+                            # Unless the recipe got another photo meanwhile.
+                            changed += Recipe.objects.filter(pk=pk, photo=file_name).update(
+                                photo_hash=photo_hash, photo_thumbnail_name=thumbnail_name, photo_variants=variants,
+                                update_date=timezone.now()
+                            )
+                    if changed:
+                        bump_collection_version('recipe')
+
+                last_id = photos[-1][0]
+                total += len(photos)
+                regenerated += changed
+                self.stdout.write('Checkpoint: %s photos up to id %s (resume with --start-id %s)' % (total, last_id, last_id))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully regenerated recipe images, %s of %s photos regenerated, %s failed in %.1fs (%d images/s)'
+            % (regenerated, total, failed, elapsed, total / elapsed if elapsed else total)
+        ))
@@ -0,0 +1,30 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from v1.recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Reshuffles the random keys used to sample recipes (mini-browse)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of recipes updated per query')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = 0
+        total = 0
+        while True:
+            recipes = list(Recipe.objects.filter(id__gt=last_id).order_by('id').only('id')[:chunk_size])
+            if not recipes:
+                break
+
+            for recipe in recipes:
+                recipe.random_key = random.random()
+            Recipe.objects.bulk_update(recipes, ['random_key'])
+
+            last_id = recipes[-1].id
+            total += len(recipes)
+
+        self.stdout.write(self.style.SUCCESS('Successfully reshuffled %s recipes' % total))
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Native full-text indexes used by `v1.common.recipe_search`.
+# Each database gets its own flavour, unknown databases get none
+# and will use the `icontains` fallback.
+# SQLite drops triggers whenever it rebuilds a table during a migration,
+# so its FTS5 tables are (re)installed by a `post_migrate` handler instead.
+TABLES = (
+    ('recipe_recipe', 'title'),
+    ('ingredient_ingredient', 'title'),
+)
+
+
+def create_fulltext_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, column in TABLES:
+        if vendor == 'mysql':
+            schema_editor.execute('ALTER TABLE %s ADD FULLTEXT INDEX %s_%s_ft (%s)' % (table, table, column, column))
+        elif vendor == 'postgresql':
+            schema_editor.execute("CREATE INDEX %s_%s_ft ON %s USING GIN (to_tsvector('simple', %s))" % (table, column, table, column))
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, column in TABLES:
+        if vendor == 'mysql':
+            schema_editor.execute('ALTER TABLE %s DROP INDEX %s_%s_ft' % (table, table, column))
+        elif vendor == 'postgresql':
+            schema_editor.execute('DROP INDEX IF EXISTS %s_%s_ft' % (table, column))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingredient', '0013_auto_20220514_1110'),
+        ('recipe', '0025_recipe_seasons'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_indexes, drop_fulltext_indexes),
+    ]
@@ -0,0 +1,78 @@
+from django.db import migrations, models
+
+from v1.common.recipe_search import build_search_documents
+
+# Move the full-text indexes of `0026` onto the denormalized `search_document`.
+# SQLite's FTS5 table is (re)installed by a `post_migrate` handler,
+# here we only drop the tables of the old layout.
+OLD_TABLES = (
+    ('recipe_recipe', 'title'),
+    ('ingredient_ingredient', 'title'),
+)
+
+SQLITE_FTS_DROP = (
+    "DROP TRIGGER IF EXISTS {table}_fts_ai",
+    "DROP TRIGGER IF EXISTS {table}_fts_ad",
+    "DROP TRIGGER IF EXISTS {table}_fts_au",
+    "DROP TABLE IF EXISTS {table}_fts",
+)
+
+
+def drop_title_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, column in OLD_TABLES:
+        if vendor == 'mysql':
+            schema_editor.execute('ALTER TABLE %s DROP INDEX %s_%s_ft' % (table, table, column))
+        elif vendor == 'postgresql':
+            schema_editor.execute('DROP INDEX IF EXISTS %s_%s_ft' % (table, column))
+        elif vendor == 'sqlite':
+            for statement in SQLITE_FTS_DROP:
+                schema_editor.execute(statement.format(table=table))
+
+
+def create_title_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, column in OLD_TABLES:
+        if vendor == 'mysql':
+            schema_editor.execute('ALTER TABLE %s ADD FULLTEXT INDEX %s_%s_ft (%s)' % (table, table, column, column))
+        elif vendor == 'postgresql':
+            schema_editor.execute("CREATE INDEX %s_%s_ft ON %s USING GIN (to_tsvector('simple', %s))" % (table, column, table, column))
+
+
+def create_document_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE recipe_recipe ADD FULLTEXT INDEX recipe_recipe_search_document_ft (search_document)')
+    elif vendor == 'postgresql':
+        schema_editor.execute("CREATE INDEX recipe_recipe_search_document_ft ON recipe_recipe USING GIN (to_tsvector('simple', search_document))")
+
+
+def drop_document_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE recipe_recipe DROP INDEX recipe_recipe_search_document_ft')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS recipe_recipe_search_document_ft')
+
+
+def fill_search_documents(apps, schema_editor):
+    build_search_documents(apps.get_model('recipe', 'Recipe'), apps.get_model('ingredient', 'Ingredient'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingredient', '0013_auto_20220514_1110'),
+        ('recipe', '0026_recipe_fulltext_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_title_indexes, create_title_indexes),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='search document'),
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_document_index, drop_document_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-18 08:53
+
+import random
+
+from django.db import migrations, models
+import v1.recipe.models
+
+
+def shuffle_recipes(apps, schema_editor):
+    # `AddField` gave every existing recipe the same key.
+    Recipe = apps.get_model('recipe', 'Recipe')
+    recipes = list(Recipe.objects.only('id'))
+    for recipe in recipes:
+        recipe.random_key = random.random()
+    Recipe.objects.bulk_update(recipes, ['random_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0027_recipe_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='random_key',
+            field=models.FloatField(db_index=True, default=v1.recipe.models._getRandomKey, editable=False, verbose_name='random key'),
+        ),
+        migrations.RunPython(shuffle_recipes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['public', 'random_key'], name='recipe_public_random_key'),
+        ),
+    ]
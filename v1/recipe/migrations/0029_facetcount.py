@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+from v1.recipe.facet_counts import rebuild_facet_counts
+
+
+def count_facets(apps, schema_editor):
+    rebuild_facet_counts(apps.get_model('recipe', 'Recipe'), apps.get_model('recipe', 'FacetCount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0028_recipe_random_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('course', 'course'), ('cuisine', 'cuisine'), ('season', 'season'), ('tag', 'tag'), ('rating', 'rating')], max_length=10, verbose_name='facet')),
+                ('value', models.IntegerField(verbose_name='value')),
+                ('public', models.BooleanField(verbose_name='public')),
+                ('total', models.IntegerField(default=0, verbose_name='total')),
+            ],
+            options={
+                'unique_together': {('facet', 'value', 'public')},
+            },
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0029_facetcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=20, unique=True, verbose_name='collection')),
+                ('version', models.BigIntegerField(default=0, verbose_name='version')),
+                ('update_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='update date')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:00
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def sum_ratings(apps, schema_editor):
+    Recipe = apps.get_model('recipe', 'Recipe')
+    Rating = apps.get_model('rating', 'Rating')
+    sums = Rating.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe').annotate(total=Sum('rating'))
+    Recipe.objects.update(rating_sum=Coalesce(Subquery(sums.values('total')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0030_collectionversion'),
+        ('rating', '0008_alter_rating_recipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False, help_text='calculated sum of ratings', verbose_name='rating sum'),
+        ),
+        migrations.RunPython(sum_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:00
+
+from django.db import migrations, models
+from django.db.models.functions import Cast, Floor
+
+
+def fill_rating_bucket(apps, schema_editor):
+    Recipe = apps.get_model('recipe', 'Recipe')
+    Recipe.objects.update(rating_bucket=Cast(Floor('rating'), models.IntegerField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0031_recipe_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_bucket',
+            field=models.IntegerField(db_index=True, default=0, editable=False, help_text='floored avg of ratings', verbose_name='rating bucket'),
+        ),
+        migrations.RunPython(fill_rating_bucket, migrations.RunPython.noop),
+    ]
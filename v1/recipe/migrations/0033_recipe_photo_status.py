@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0032_recipe_rating_bucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='photo_status',
+            field=models.CharField(choices=[('ready', 'ready'), ('processing', 'processing'), ('failed', 'failed')], default='ready', editable=False, max_length=10, verbose_name='photo status'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:00
+
+from django.db import migrations, models
+from imagekit.cachefiles import ImageCacheFile
+from imagekit.processors import ResizeToFill
+from imagekit.specs import ImageSpec
+
+
+class Thumbnail(ImageSpec):
+    # As `Recipe.photo_thumbnail`, the historical model doesn't have it.
+    processors = [ResizeToFill(300, 200)]
+    format = 'JPEG'
+    options = {'quality': 70}
+
+
+def queue_photo_renderings(apps, schema_editor):
+    # The thumbnail names only derive from the photo names, the storage isn't checked.
+    # The worker only renders the variants (and a thumbnail that was never generated).
+    Recipe = apps.get_model('recipe', 'Recipe')
+    Job = apps.get_model('jobs', 'Job')
+    last_id = 0
+    while True:
+        recipes = list(Recipe.objects.filter(id__gt=last_id).exclude(photo='').order_by('id').only('id', 'photo')[:500])
+        if not recipes:
+            break
+        for recipe in recipes:
+            recipe.photo_thumbnail_name = ImageCacheFile(Thumbnail(source=recipe.photo)).name
+        Recipe.objects.bulk_update(recipes, ['photo_thumbnail_name'])
+        Job.objects.bulk_create(
+            Job(name='recipe.generate_photo_variants', args=[recipe.pk, recipe.photo.name]) for recipe in recipes
+        )
+        last_id = recipes[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+        ('recipe', '0034_recipe_photo_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='photo_thumbnail_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='photo thumbnail name'),
+        ),
+        migrations.RunPython(queue_photo_renderings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0035_recipe_photo_thumbnail_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='photo_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='photo hash'),
+        ),
+    ]
@@ -1,6 +1,10 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import permissions, serializers
+
 
 class FieldLimiter(object):
     """
@@ -24,3 +28,147 @@ class FieldLimiter(object):
                 existing = set(self.fields.keys())
                 for field_name in existing - allowed:
                     self.fields.pop(field_name)
+
+
+class QueryPlanner(object):
+    """
+    Reads the (already `FieldLimiter` pruned) fields of a serializer
+    and derives the `select_related`, `prefetch_related` and `only()`
+    needed to render it.
+    So a page costs a fixed number of queries, regardless of its size.
+
+    Relations rendered by a `SerializerMethodField` can't be detected.
+    List their prefetches in the serializers `Meta.prefetch_related`,
+    keyed by the field name.
+    Usage:
+        queryset = QueryPlanner(serializer).plan(queryset)
+    """
+    def __init__(self, serializer):
+        if isinstance(serializer, serializers.ListSerializer):
+            serializer = serializer.child
+        self.serializer = serializer
+
+    def plan(self, queryset):
+        select, prefetch, only = self._walk(self.serializer, queryset.model)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if only is not None:
+            queryset = queryset.only(*only)
+        return queryset
+
+    def _walk(self, serializer, model, prefix=''):
+        """
+        Returns the `select_related` paths, the `prefetch_related` lookups
+        and the `only()` paths (`None` if every field has to be loaded)
+        for `serializer` rendering `model`, with all paths prefixed by `prefix`.
+        """
+        select, prefetch, only = [], [], {prefix + model._meta.pk.name}
+        method_prefetch = getattr(getattr(serializer, 'Meta', None), 'prefetch_related', {})
+
+        for field in serializer._readable_fields:
+            if isinstance(field, serializers.SerializerMethodField):
+                prefetch += [self._prefixed(lookup, prefix) for lookup in method_prefetch.get(field.field_name, ())]
+                continue
+
+            if field.source == '*' or not field.source_attrs:
+                only = None
+                continue
+
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if not isinstance(nested, serializers.BaseSerializer):
+                nested = None
+
+            current_model, path = model, prefix
+            for ix, attr in enumerate(field.source_attrs):
+                is_last = ix == len(field.source_attrs) - 1
+                model_field = self._get_field(current_model, attr)
+                if model_field is None:
+                    model_field = self._get_source_field(current_model, attr)
+                    if model_field is None:
+                        # A property or a method, we can't tell what it reads.
+                        only = None
+                        break
+                    attr = model_field.name
+
+                if model_field.many_to_many or model_field.one_to_many:
+                    lookup = path + attr
+                    if nested is not None and is_last:
+                        prefetch.append(self._prefetch(lookup, nested, model_field))
+                    else:
+                        prefetch.append(lookup)
+                    break
+
+                if only is not None:
+                    only.add(path + attr)
+                if not model_field.is_relation:
+                    break
+                if is_last:
+                    # A forward relation rendered as pk only needs the FK column.
+                    if nested is not None:
+                        sub_select, sub_prefetch, sub_only = self._walk(nested, model_field.related_model, path + attr + '__')
+                        select += [path + attr] + sub_select
+                        prefetch += sub_prefetch
+                        if sub_only is None:
+                            only = None
+                        elif only is not None:
+                            only |= sub_only
+                    break
+
+                select.append(path + attr)
+                current_model, path = model_field.related_model, path + attr + '__'
+
+        return select, prefetch, only
+
+    def _prefetch(self, lookup, serializer, model_field):
+        related_model = model_field.related_model
+        select, prefetch, only = self._walk(serializer, related_model)
+        queryset = related_model._default_manager.all()
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if only is not None:
+            if model_field.one_to_many:
+                # The prefetch needs the FK to match the rows to their parents.
+                only.add(model_field.field.name)
+            queryset = queryset.only(*only)
+        return Prefetch(lookup, queryset=queryset)
+
+    @staticmethod
+    def _prefixed(lookup, prefix):
+        if isinstance(lookup, Prefetch):
+            return Prefetch(prefix + lookup.prefetch_through, queryset=lookup.queryset, to_attr=lookup.to_attr)
+        return prefix + lookup
+
+    @staticmethod
+    def _get_field(model, name):
+        try:
+            return model._meta.get_field(name)
+        except FieldDoesNotExist:
+            for field in model._meta.related_objects:
+                if field.get_accessor_name() == name:
+                    return field
+            return None
+
+    @staticmethod
+    def _get_source_field(model, name):
+        # e.g. imagekit's `ImageSpecField`, which renders from another field.
+        source_field_name = getattr(model.__dict__.get(name), 'source_field_name', None)
+        if source_field_name:
+            return QueryPlanner._get_field(model, source_field_name)
+        return None
+
+
+class QueryPlannerMixin(object):
+    """
+    Custom viewset mixin applying the `QueryPlanner` of the serializer
+    to the queryset of read requests.
+    Writes keep the full instance, `SaveRecipe` relies on it.
+    """
+    def filter_queryset(self, queryset):
+        queryset = super(QueryPlannerMixin, self).filter_queryset(queryset)
+        if self.request.method not in permissions.SAFE_METHODS:
+            return queryset
+        return QueryPlanner(self.get_serializer()).plan(queryset)
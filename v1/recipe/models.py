@@ -1,30 +1,43 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
+import hashlib
 import logging
+import os
+import random
+from math import floor
 
+from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.files import File
 from django.dispatch import receiver
 from django.db import models
-from django.db.models.signals import post_delete, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_migrate, post_save, pre_delete, pre_save
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from imagekit.models import ProcessedImageField, ImageSpecField
-from imagekit.processors import ResizeToFit, ResizeToFill
+from imagekit.processors import ResizeToFit, ResizeToFill, Transpose
+from PIL import Image
 
-from v1.common.db_fields import AutoSlugField
+from v1.common.db_fields import AutoSlugField, AutoSlugRetryMixin, FileNamesMixin
+from v1.common.recipe_search import build_search_document, install_sqlite_search_index
+from v1.news.models import News
+from v1.jobs.queue import enqueue, job
 from v1.recipe_groups.models import Course, Cuisine, Season, Tag
+from .photo_variants import VARIANT_FORMATS, delete_variants, generate_variants
 
 logger = logging.getLogger(__name__)
 
 def _getImageQualityProcessors():
+    # Upright first, the orientation tag isn't kept.
     if settings.RECIPE_IMAGE_QUALITY == 'HIGH':
-        return [ResizeToFit(1920, 1440, False)]
+        return [Transpose(), ResizeToFit(1920, 1440, False)]
     elif settings.RECIPE_IMAGE_QUALITY == 'MEDIUM':
-        return [ResizeToFit(1440, 1080, False)]
+        return [Transpose(), ResizeToFit(1440, 1080, False)]
     elif settings.RECIPE_IMAGE_QUALITY == 'LOW':
-        return [ResizeToFit(1024, 768, False)]
-    else: return None
+        return [Transpose(), ResizeToFit(1024, 768, False)]
+    else: return [Transpose()]
 
 def _getImageQualityOptions():
     if settings.RECIPE_IMAGE_QUALITY == 'HIGH':
@@ -35,7 +48,10 @@ def _getImageQualityOptions():
         return {'quality': 90}
     else: return None
 
-class Recipe(models.Model):
+def _getRandomKey():
+    return random.random()
+
+class Recipe(AutoSlugRetryMixin, FileNamesMixin, models.Model):
     """
     Django Model to hold Recipes.
 
@@ -50,11 +66,17 @@ class Recipe(models.Model):
     :title: = Title of the Recipe
     :photo: = Raw Image of a Recipe
     :photo_thumbnail: = compressed image of the photo
+    :photo_status: = ready, processing (an upload the worker didn't process yet) or failed
+    :photo_variants: = the widths the photo is pre-rendered in, per format, see `v1.recipe.photo_variants`
+    :photo_thumbnail_name: = the file of the generated thumbnail (the upload itself while processing), so its URL is known without checking the storage
+    :photo_hash: = hash of the photo and how it's rendered, tells if the thumbnail and variants are up to date
     :info: = Description of the recipe
     :directions: = How to make the recipe
     :prep_time: = How long it takes to prepare the recipe
     :rating = avg of ratings. 0 if none.
     :rating_count = Number of ratings. 0 if none.
+    :rating_sum = Sum of ratings, the avg is derived from it. 0 if none.
+    :rating_bucket = The floored avg rating, indexed for the rating filters. 0 if none.
     :cook_time: = How long the recipe takes to cook
     :servings: = How many people the recipe with serve
     :public: = If the recipe can be viewed by others
@@ -62,7 +84,13 @@ class Recipe(models.Model):
     :pub_date: = When the recipe was created
     :update_author: = User that updated the recipe
     :update_date: = When the recipe was updated
+    :search_document: = normalized title, ingredients, tags and seasons used by the search
+    :random_key: = random sort key used to sample recipes, reshuffled by `shuffle_recipes`
     """
+    PHOTO_READY = 'ready'
+    PHOTO_PROCESSING = 'processing'
+    PHOTO_FAILED = 'failed'
+
     title = models.CharField(_("Recipe Title"), max_length=250)
     slug = AutoSlugField(_('slug'), populate_from='title', unique=True)
     photo = ProcessedImageField(verbose_name='photo',
@@ -75,6 +103,14 @@ class Recipe(models.Model):
                                      processors=[ResizeToFill(300, 200)],
                                      format='JPEG',
                                      options={'quality': 70})
+    photo_status = models.CharField(_('photo status'), max_length=10, default=PHOTO_READY, editable=False, choices=(
+        (PHOTO_READY, _('ready')),
+        (PHOTO_PROCESSING, _('processing')),
+        (PHOTO_FAILED, _('failed')),
+    ))
+    photo_variants = models.JSONField(_('photo variants'), default=dict, blank=True, editable=False)
+    photo_thumbnail_name = models.CharField(_('photo thumbnail name'), max_length=255, blank=True, default='', editable=False)
+    photo_hash = models.CharField(_('photo hash'), max_length=40, blank=True, default='', editable=False)
     cuisine = models.ForeignKey(Cuisine, on_delete=models.CASCADE, null=True, blank=True)
     course = models.ForeignKey(Course, on_delete=models.CASCADE, null=True, blank=True)
     seasons = models.ManyToManyField(Season, verbose_name=_('season'), blank=True)
@@ -83,6 +119,8 @@ class Recipe(models.Model):
     info = models.TextField(_('info'), help_text="enter information about the recipe", blank=True)
     rating = models.FloatField(_('rating avg'), help_text="calculated avg of ratings", default=0, editable=False)
     rating_count = models.IntegerField(_('rating count'), help_text="calculated number of ratings", default=0, editable=False)
+    rating_sum = models.IntegerField(_('rating sum'), help_text="calculated sum of ratings", default=0, editable=False)
+    rating_bucket = models.IntegerField(_('rating bucket'), help_text="floored avg of ratings", default=0, editable=False, db_index=True)
     directions = models.TextField(_('direction_text'), help_text="directions", blank=True)
     source = models.CharField(_('source'), max_length=200, blank=True)
     prep_time = models.IntegerField(_('prep time'), help_text="enter time in minutes", null=True, blank=True)
@@ -93,10 +131,25 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(auto_now_add=True)
     update_author = models.ForeignKey(User, related_name='recipe_update', on_delete=models.DO_NOTHING, blank=True, null=True)
     update_date = models.DateTimeField(auto_now=True)
+    search_document = models.TextField(_('search document'), blank=True, default='', editable=False)
+    random_key = models.FloatField(_('random key'), default=_getRandomKey, db_index=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['public', 'random_key'], name='recipe_public_random_key'),
+        ]
 
     def __str__(self):
         return '%s' % self.title
 
+    def build_search_document(self):
+        return build_search_document(
+            self.title,
+            *self.ingredient_groups.values_list('ingredients__title', flat=True),
+            *self.tags.values_list('title', flat=True),
+            *self.seasons.values_list('title', flat=True),
+        )
+
 class SubRecipe(models.Model):
     numerator = models.FloatField(_('numerator'), default=0)
     denominator = models.FloatField(_('denominator'), default=1)
@@ -107,6 +160,85 @@ class SubRecipe(models.Model):
     def __str__(self):
         return '%s' % self.parent_recipe.title
 
+class FacetCount(models.Model):
+    """
+    Django Model to hold the number of recipes per facet value.
+    Kept up to date by `SaveRecipe`, the rating signals and recipe deletion,
+    see `v1.recipe.facet_counts`. `rebuild_facet_counts` reconciles drift.
+    :facet: = The facet type (course, cuisine, season, tag or rating)
+    :value: = The id of the Course, Cuisine, Season or Tag, or the floored rating
+    :public: = Whether the counted recipes are public
+    :total: = The number of recipes
+    """
+    FACETS = (
+        ('course', _('course')),
+        ('cuisine', _('cuisine')),
+        ('season', _('season')),
+        ('tag', _('tag')),
+        ('rating', _('rating')),
+    )
+
+    facet = models.CharField(_('facet'), max_length=10, choices=FACETS)
+    value = models.IntegerField(_('value'))
+    public = models.BooleanField(_('public'))
+    total = models.IntegerField(_('total'), default=0)
+
+    class Meta:
+        unique_together = ('facet', 'value', 'public')
+
+    def __str__(self):
+        return '%s %s (%s): %s' % (self.facet, self.value, 'public' if self.public else 'private', self.total)
+
+class CollectionVersion(models.Model):
+    """
+    Django Model to hold the version of a collection, e.g. of all recipes.
+    Bumped once per transaction changing the collection, see `v1.recipe.versions`.
+    The list views derive their `ETag` and `Last-Modified` from it.
+    :collection: = The collection (recipe, course, cuisine, season or tag)
+    :version: = Counts the changes of the collection
+    :update_date: = When the collection was changed
+    """
+    collection = models.CharField(_('collection'), max_length=20, unique=True)
+    version = models.BigIntegerField(_('version'), default=0)
+    update_date = models.DateTimeField(_('update date'), default=timezone.now)
+
+    def __str__(self):
+        return '%s: %s' % (self.collection, self.version)
+
+@receiver(pre_delete, sender=Recipe)
+def uncount_facets_on_delete(sender, instance, **kwargs):
+    from .facet_counts import uncount_deleted_recipe
+    uncount_deleted_recipe(instance)
+
+@receiver(post_delete, sender=Recipe)
+def forget_facets_on_delete(sender, instance, **kwargs):
+    from .facet_counts import forget_deleted_recipe
+    forget_deleted_recipe(instance)
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=SubRecipe)
+@receiver(post_delete, sender=SubRecipe)
+@receiver(m2m_changed, sender=Recipe.seasons.through)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_version(sender, **kwargs):
+    from .versions import bump_collection_version
+    bump_collection_version('recipe')
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Cuisine)
+@receiver(post_delete, sender=Cuisine)
+@receiver(post_save, sender=Season)
+@receiver(post_delete, sender=Season)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_recipe_group_version(sender, **kwargs):
+    from .versions import bump_collection_version
+    bump_collection_version(sender._meta.model_name)
+
+post_migrate.connect(install_sqlite_search_index, dispatch_uid='install_sqlite_search_index')
+
 # @see https://github.com/matthewwithanm/django-imagekit/issues/229
 @receiver(post_delete, sender=Recipe)
 def auto_delete_files_on_delete(sender, instance, **kwargs):
@@ -115,43 +247,197 @@ def auto_delete_files_on_delete(sender, instance, **kwargs):
 
     for field in sender._meta.concrete_fields:
         if isinstance(field, models.FileField):
-            instance_file_field = getattr(instance, field.name)
-            delete_file_if_unused(sender, instance, field.name, instance_file_field)
+            delete_file_if_unused(sender, instance, field.name, getattr(instance, field.name).name)
+
+@receiver(pre_save, sender=Recipe)
+def sync_rating_bucket(sender, instance, **kwargs):
+    # Queryset updates of `rating` set the bucket themselves, see `v1.rating.models`.
+    instance.rating_bucket = floor(instance.rating)
+
+def _file_fields(model):
+    return [field for field in model._meta.concrete_fields if isinstance(field, models.FileField)]
+
+""" Remember the file names as loaded, so a change is noticed without querying the row again"""
+@receiver(post_init, sender=Recipe)
+@receiver(post_init, sender=News)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=News)
+def remember_file_names(sender, instance, **kwargs):
+    # Read the raw values, a deferred field isn't loaded just for this.
+    instance._original_file_names = {
+        field.attname: getattr(instance.__dict__[field.attname], 'name', instance.__dict__[field.attname])
+        for field in _file_fields(sender) if field.attname in instance.__dict__
+    }
 
 """ Delete the file if something else get uploaded in its place"""
-@receiver(pre_save)
-def delete_files_when_file_changed(sender, instance, **kwargs):
-    if not settings.DELETE_ORPHAN_FILES:
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=News)
+def delete_files_when_file_changed(sender, instance, raw=False, **kwargs):
+    if not settings.DELETE_ORPHAN_FILES or raw:
         return
 
     # Don't run on initial save
     if not instance.pk:
         return
 
-    for field in sender._meta.concrete_fields:
-        if isinstance(field, models.FileField):
-            try:
-                instance_in_db = sender.objects.get(pk=instance.pk)
-            except sender.DoesNotExist:
-                # We are probably in a transaction and the PK is just temporary
-                # Don't worry about deleting attachments if they aren't actually saved yet.
-                return
-            instance_in_db_file_field = getattr(instance_in_db, field.name)
-            instance_file_field = getattr(instance, field.name)
-            if instance_in_db_file_field.name != instance_file_field.name:
-                delete_file_if_unused(sender, instance_in_db, field.name, instance_in_db_file_field)
+    original_names = getattr(instance, '_original_file_names', {})
+    for field in _file_fields(sender):
+        instance_file_field = getattr(instance, field.name)
+        if field.attname in original_names:
+            original_name = original_names[field.attname]
+        else:
+            # Deferred when loaded, query it.
+            original_name = sender.objects.filter(pk=instance.pk).values_list(field.attname, flat=True).first()
+        if not original_name or original_name == instance_file_field.name:
+            continue
+
+        delete_file_if_unused(sender, instance, field.name, original_name)
 
 """ Only delete the file if no other instances of that model are using it"""
-def delete_file_if_unused(model, instance, fieldname, instance_file_field):
+def delete_file_if_unused(model, instance, fieldname, file_name):
+    if not file_name:
+        return
     dynamic_field = {}
-    dynamic_field[fieldname] = instance_file_field.name
+    dynamic_field[fieldname] = file_name
     other_refs_exist = model.objects.filter(**dynamic_field).exclude(pk=instance.pk).exists()
     if not other_refs_exist:
-        delete_thumbnail(instance, fieldname + '_thumbnail')
-        instance_file_field.delete(False)
+        # By the worker, once committed, a rollback keeps the file.
+        enqueue(delete_file, model._meta.label, fieldname, file_name)
+
+@job('recipe.delete_file')
+def delete_file(model_label, fieldname, file_name):
+    """ Usage: Deletes the file `file_name` of `model.fieldname` and its thumbnail, no queries. """
+    # An unsaved instance derives the thumbnail from the file.
+    instance = apps.get_model(model_label)(**{fieldname: file_name})
+    delete_thumbnail(instance, fieldname + '_thumbnail')
+    delete_variants(getattr(instance, fieldname).storage, file_name)
+    getattr(instance, fieldname).delete(False)
+
+def store_unprocessed_photo(upload):
+    """
+    Usage: Stores an uploaded photo as is and returns its name.
+    Resizing and compressing it is left to the worker, see `process_photo`.
+    Example:
+        recipe.photo = store_unprocessed_photo(request.FILES['photo'])
+        recipe.photo_status = Recipe.PHOTO_PROCESSING
+    """
+    field = Recipe._meta.get_field('photo')
+    name = field.generate_filename(None, os.path.join('unprocessed', os.path.basename(upload.name)))
+    return field.storage.save(name, upload)
+
+def hash_photo(file_name):
+    """
+    Usage: Hashes the content of the photo `file_name` and the specs of its thumbnail and variants.
+    A thumbnail and variants rendered with the same hash are up to date, see `regenerate_images`.
+    """
+    recipe = Recipe(photo=file_name)
+    digest = hashlib.sha1(repr((
+        recipe.photo_thumbnail.generator.get_hash(), settings.RECIPE_PHOTO_VARIANT_WIDTHS, VARIANT_FORMATS
+    )).encode('utf-8'))
+    with recipe.photo.storage.open(file_name) as photo:
+        for chunk in photo.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def photo_processing_failed(recipe_id, file_name):
+    """ Usage: Marks the upload `file_name` of a recipe failed, unless it got another photo meanwhile. """
+    Recipe.objects.filter(pk=recipe_id, photo=file_name).update(photo_status=Recipe.PHOTO_FAILED, photo_thumbnail_name='')
+
+@job('recipe.process_photo', on_failure=photo_processing_failed)
+def process_photo(recipe_id, file_name):
+    """
+    Usage: Makes the final photo and the thumbnail of the unprocessed upload `file_name`,
+    then swaps it in, unless the recipe got another photo meanwhile.
+    """
+    from .versions import bump_collection_version
+
+    # Unsaved, the field file processes what it saves.
+    recipe = Recipe(pk=recipe_id)
+    try:
+        with recipe.photo.storage.open(file_name) as upload:
+            recipe.photo.save(os.path.basename(file_name), File(upload), save=False)
+        recipe.photo_thumbnail.generate()
+        variants = generate_variants(recipe.photo.storage, recipe.photo.name)
+        photo_hash = hash_photo(recipe.photo.name)
+    except (OSError, Image.DecompressionBombError) as e:
+        # Not an image (or gone, or too large), retrying won't help.
+        # Anything else is retried, `photo_processing_failed` once it's given up.
+        logger.warning('Processing of photo "%s" failed.' % file_name, exc_info=e)
+        photo_processing_failed(recipe_id, file_name)
+        return
+
+    swapped = Recipe.objects.filter(pk=recipe_id, photo=file_name).update(
+        photo=recipe.photo.name, photo_status=Recipe.PHOTO_READY, photo_variants=variants,
+        photo_thumbnail_name=recipe.photo_thumbnail.name, photo_hash=photo_hash, update_date=timezone.now()
+    )
+    if swapped:
+        bump_collection_version('recipe')
+        delete_file(Recipe._meta.label, 'photo', file_name)
+    else:
+        # Replaced or deleted meanwhile, the upload is deleted with it.
+        delete_file(Recipe._meta.label, 'photo', recipe.photo.name)
+
+@job('recipe.generate_photo_variants')
+def generate_photo_variants(recipe_id, file_name):
+    """
+    Usage: Generates the thumbnail and pre-renders the variants (see `v1.recipe.photo_variants`)
+    of the photo `file_name` of a recipe and records them.
+    """
+    from .versions import bump_collection_version
+
+    recipe = Recipe(photo=file_name)
+    try:
+        recipe.photo_thumbnail.generate()
+        variants = generate_variants(recipe.photo.storage, file_name)
+        photo_hash = hash_photo(file_name)
+    except OSError as e:
+        logger.warning('Rendering the variants of photo "%s" failed.' % file_name, exc_info=e)
+        return
+
+    if Recipe.objects.filter(pk=recipe_id, photo=file_name).update(
+        photo_variants=variants, photo_thumbnail_name=recipe.photo_thumbnail.name, photo_hash=photo_hash,
+        update_date=timezone.now()
+    ):
+        bump_collection_version('recipe')
+    elif not Recipe.objects.filter(photo=file_name).exists():
+        # Replaced meanwhile, its file may be gone already.
+        delete_thumbnail(recipe, 'photo_thumbnail')
+        delete_variants(recipe.photo.storage, file_name)
+
+""" A new photo gets a new thumbnail and variants, the worker renders them"""
+@receiver(pre_save, sender=Recipe)
+def forget_photo_renderings(sender, instance, raw=False, **kwargs):
+    # A deferred photo wasn't changed.
+    if raw or 'photo' not in instance.__dict__:
+        return
+    original_name = getattr(instance, '_original_file_names', {}).get('photo')
+    instance._photo_changed = instance._state.adding or original_name != instance.photo.name
+    if instance._photo_changed:
+        instance.photo_variants = {}
+        instance.photo_hash = ''
+        # Until processed, the stored upload stands in for the thumbnail.
+        if instance.photo and instance.photo_status == Recipe.PHOTO_PROCESSING:
+            instance.photo_thumbnail_name = instance.photo.name
+        else:
+            instance.photo_thumbnail_name = ''
+
+@receiver(post_save, sender=Recipe)
+def render_photo(sender, instance, raw=False, **kwargs):
+    if raw or not getattr(instance, '_photo_changed', False):
+        return
+    instance._photo_changed = False
+    if not instance.photo:
+        return
+    if instance.photo_status == Recipe.PHOTO_PROCESSING:
+        enqueue(process_photo, instance.pk, instance.photo.name)
+    else:
+        enqueue(generate_photo_variants, instance.pk, instance.photo.name)
 
 def delete_thumbnail(instance, thumbnailFieldname):
-    instance_thumbnail_field = getattr(instance, thumbnailFieldname)
+    instance_thumbnail_field = getattr(instance, thumbnailFieldname, None)
+    if instance_thumbnail_field is None:
+        # No thumbnails, e.g. News.
+        return
     thumbnail_file = None
     try:
         thumbnail_file = instance_thumbnail_field.file
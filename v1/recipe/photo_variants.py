@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# The variant formats, preferred first: file extension, Pillow format and save options.
+VARIANT_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 80, 'progressive': True, 'optimize': True}),
+)
+
+
+def variants_dir(file_name):
+    """ Usage: Returns the directory the variants of the photo `file_name` are stored in. """
+    # With the extension, `food.jpg` and `food.png` are different photos.
+    return os.path.join('CACHE', 'variants', file_name)
+
+
+def generate_variants(storage, file_name):
+    """
+    Usage: Renders the photo `file_name` in the widths of `RECIPE_PHOTO_VARIANT_WIDTHS`
+    (at most its own), as WebP and JPEG, and stores them next to each other.
+    The EXIF orientation is applied and the metadata isn't copied.
+    Returns the variants per format, narrowest first, see `v1.recipe.serializers.ImageSrcsetField`.
+    Example:
+        generate_variants(recipe.photo.storage, recipe.photo.name)
+        {'webp': [{'name': 'CACHE/variants/upload/recipe_photos/food.jpg/400.webp', 'width': 400, 'height': 300}, ...],
+         'jpeg': [...]}
+    """
+    with storage.open(file_name) as f:
+        # Transposed or not, a loaded copy.
+        image = ImageOps.exif_transpose(Image.open(f))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    directory = variants_dir(file_name)
+    variants = {}
+    for width in sorted({min(width, image.width) for width in settings.RECIPE_PHOTO_VARIANT_WIDTHS}):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for extension, format, options in VARIANT_FORMATS:
+            content = BytesIO()
+            resized.save(content, format, **options)
+            name = os.path.join(directory, '%s.%s' % (width, extension))
+            # Rendered again, replace it.
+            storage.delete(name)
+            name = storage.save(name, ContentFile(content.getvalue()))
+            variants.setdefault(extension, []).append({'name': name, 'width': width, 'height': height})
+    return variants
+
+
+def delete_variants(storage, file_name):
+    """ Usage: Deletes the variants of the photo `file_name`, if there are any. """
+    directory = variants_dir(file_name)
+    try:
+        files = storage.listdir(directory)[1]
+    except FileNotFoundError:
+        return
+    for name in files:
+        storage.delete(os.path.join(directory, name))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .versions import RECIPE_COLLECTIONS, collection_versions
+
+
+class RecipeQueryCache(object):
+    """
+    Caches the results of recipe filter and search combinations:
+    the ordered ids of the matching recipes, or the recipe totals of a facet.
+    Never the rendered responses, so the fields, the page and the user don't split the entries.
+
+    Keyed by the normalized query (see `RecipeFilter.normalized`)
+    and the versions of the recipes, courses, cuisines, seasons and tags.
+    Any change bumps a version (see `v1.recipe.versions`), so the entries never go stale,
+    the old ones just expire.
+    Uses the `default` Django cache, configure a shared one to share it between the workers.
+
+    Turned on by `RECIPE_QUERY_CACHE`.
+    Usage:
+        ids = query_cache.get_or_set('recipes', recipe_filter.normalized(), lambda: list(...))
+        query_cache.stats()
+        {'hits': 12, 'misses': 3}
+    """
+    prefix = 'recipe-query'
+
+    def enabled(self):
+        return getattr(settings, 'RECIPE_QUERY_CACHE', False)
+
+    def versions(self):
+        return collection_versions(RECIPE_COLLECTIONS)[0]
+
+    def get_or_set(self, kind, query, compute, versions=None):
+        """
+        Usage: Returns the cached result of the `kind` of `query`,
+        or computes it by calling `compute()` and caches it.
+        Pass the `versions` when making several lookups, it saves a query each.
+        """
+        if not self.enabled():
+            return compute()
+
+        key = self.key(kind, query, versions if versions is not None else self.versions())
+        # Wrapped, so a `None` result is told apart from a miss.
+        cached = cache.get(key)
+        if cached is not None:
+            self.count('hits')
+            return cached[0]
+
+        self.count('misses')
+        value = compute()
+        cache.set(key, (value,), getattr(settings, 'RECIPE_QUERY_CACHE_TIMEOUT', 300))
+        return value
+
+    def key(self, kind, query, versions):
+        fingerprint = json.dumps([kind, query, versions], sort_keys=True)
+        return '%s:%s' % (self.prefix, hashlib.sha1(fingerprint.encode('utf-8')).hexdigest())
+
+    def count(self, name):
+        key = '%s:%s' % (self.prefix, name)
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted in between, a lost count doesn't matter.
+            pass
+
+    def stats(self):
+        """ Usage: Returns the hit and miss counters. """
+        counters = cache.get_many(['%s:%s' % (self.prefix, name) for name in ('hits', 'misses')])
+        return {name: counters.get('%s:%s' % (self.prefix, name), 0) for name in ('hits', 'misses')}
+
+
+query_cache = RecipeQueryCache()
+
+
+def cached_ids(kind, query, queryset, versions=None):
+    """
+    Usage: Returns the ids of the recipe `queryset` in order, cached as `kind` of `query`.
+    `None` if there are more than `RECIPE_QUERY_CACHE_MAX_IDS`, that's cached too,
+    the caller falls back to querying the page.
+    Example:
+        ids = cached_ids('recipes', recipe_filter.normalized(), queryset)
+    """
+    if not query_cache.enabled():
+        return None
+
+    def compute():
+        limit = getattr(settings, 'RECIPE_QUERY_CACHE_MAX_IDS', 5000)
+        ids = list(queryset.values_list('id', flat=True)[:limit + 1])
+        return ids if len(ids) <= limit else None
+    return query_cache.get_or_set(kind, query, compute, versions)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import random
+
+
+def random_sample(queryset, limit):
+    """
+    Usage: Returns the ids of `limit` random recipes of the queryset.
+    Example:
+        ids = random_sample(Recipe.objects.filter(public=True), 4)
+
+    Every recipe has an indexed `random_key`.
+    We pick a random point and take the next `limit` recipes by that key,
+    wrapping around at the end.
+    That's at most two index range scans, no matter how many recipes match.
+    The keys get reshuffled by the `shuffle_recipes` command,
+    so the neighbours of a recipe change over time.
+    """
+    if limit <= 0:
+        return []
+
+    queryset = queryset.order_by('random_key').values_list('id', flat=True)
+    point = random.random()
+    ids = list(queryset.filter(random_key__gte=point)[:limit])
+    if len(ids) < limit:
+        ids += [i for i in queryset.filter(random_key__lt=point)[:limit - len(ids)] if i not in ids]
+    random.shuffle(ids)
+    return ids
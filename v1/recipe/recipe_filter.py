@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .facet_counts import counted_facet, counted_ratings
+from .facet_index import bitset, get_facet_index
+from .models import Recipe
+from .query_cache import query_cache
+from v1.common.recipe_search import search_recipes
+
+# The rating buckets, see `Recipe.rating`.
+RATINGS = (5, 4, 3, 2, 1, 0)
+
+
+class RecipeFilter(object):
+    """
+    The recipe filters shared by the recipe list, the browse view and the count views.
+
+    Query params:
+        course, cuisine, season, tag: comma separated slugs
+            (also accepted as `course__slug`, `cuisine__slug`, ...)
+        rating: comma separated floored ratings
+        search: the search term, see `v1.common.recipe_search`
+    Anonymous users only see public recipes.
+
+    Every filter is a plain condition on the recipe table,
+    the many-to-many ones use a subquery on the through table,
+    so the result never needs a `.distinct()`.
+
+    Usage:
+        recipe_filter = RecipeFilter(request)
+        recipes = recipe_filter.filter(Recipe.objects.all())
+        facets = recipe_filter.facets()
+    """
+    relations = (
+        ('course', 'course'),
+        ('cuisine', 'cuisine'),
+        ('season', 'seasons'),
+        ('tag', 'tags'),
+    )
+
+    def __init__(self, request):
+        params = request.query_params
+        self.public_only = not request.user.is_authenticated
+
+        self.slugs = {}
+        for name, field in self.relations:
+            value = params.get(name, params.get(name + '__slug'))
+            if value is not None:
+                self.slugs[name] = value.split(',')
+
+        self.ratings = None
+        if 'rating' in params:
+            self.ratings = [int(r) for r in params.get('rating').split(',') if r.strip().isdigit()]
+
+        self.search = params.get('search', '')
+        self.search_bits = None
+        self.versions = None
+
+    def filter(self, queryset, exclude=None, search=True):
+        """
+        Apply the filters to the recipe `queryset`.
+        `exclude` names a filter to skip, that's how a facet counts its own values.
+        The recipe list passes `search=False`, its `RecipeSearchFilter` searches and ranks.
+        """
+        if self.public_only:
+            queryset = queryset.filter(public=True)
+
+        for name, field in self.relations:
+            if name == exclude or name not in self.slugs:
+                continue
+            model_field = Recipe._meta.get_field(field)
+            if model_field.many_to_many:
+                through = model_field.remote_field.through
+                queryset = queryset.filter(id__in=through.objects.filter(**{
+                    '%s__slug__in' % model_field.m2m_reverse_field_name(): self.slugs[name]
+                }).values(model_field.m2m_field_name()))
+            else:
+                queryset = queryset.filter(**{'%s__slug__in' % field: self.slugs[name]})
+
+        if self.ratings is not None and exclude != 'rating':
+            queryset = queryset.filter(rating_bucket__in=self.ratings)
+
+        if search and self.search:
+            queryset = search_recipes(queryset, self.search)
+        return queryset
+
+    def is_filtered(self, exclude=None):
+        """ Whether any filter but `exclude` (and the public flag) is set. """
+        return bool(
+            set(self.slugs) - {exclude}
+            or (self.ratings is not None and exclude != 'rating')
+            or self.search
+        )
+
+    def normalized(self, exclude=None):
+        """
+        Usage: Returns the filters but `exclude` in a normal form, the key of the `query_cache`.
+        Search words and slugs are and-ed respectively or-ed, so they are sorted
+        (and the words lower-cased), the visibility makes the scope.
+        Example:
+            RecipeFilter(request).normalized()  # ?search=Chili%20beef&tag=easy,vegan
+            {'scope': 'public', 'slugs': {'tag': ['easy', 'vegan']}, 'ratings': None, 'search': ['beef', 'chili']}
+        """
+        return {
+            'scope': 'public' if self.public_only else 'all',
+            'slugs': {name: sorted(set(slugs)) for name, slugs in self.slugs.items() if name != exclude},
+            'ratings': sorted(set(self.ratings)) if self.ratings is not None and exclude != 'rating' else None,
+            'search': sorted(set(self.search.lower().split())),
+        }
+
+    def cached(self, kind, compute, exclude=None):
+        """ Usage: Returns the result of `compute()` cached by the `query_cache`, see `normalized`. """
+        if self.versions is None and query_cache.enabled():
+            # One read for all the lookups of a request.
+            self.versions = query_cache.versions()
+        return query_cache.get_or_set(kind, self.normalized(exclude), compute, self.versions)
+
+    def annotate_totals(self, queryset, name):
+        """
+        Annotate the values of facet `name` (e.g. `Course.objects.all()`)
+        with their number of matching recipes (`total`), leaving out the empty ones.
+        Without other filters the totals are read from the `FacetCount` table,
+        with the `FacetIndex` turned on they are counted by bit operations.
+        """
+        if not self.is_filtered(exclude=name):
+            return counted_facet(queryset, name, self.public_only)
+
+        totals = self.facet_totals(name)
+        return queryset.filter(id__in=list(totals)).annotate(total=Case(
+            *[When(id=pk, then=Value(total)) for pk, total in totals.items()],
+            default=Value(0), output_field=IntegerField()
+        ))
+
+    def facet_totals(self, name):
+        """
+        Usage: Returns `{value: total}`, the number of recipes per value of facet `name`
+        matching every filter but `name`.
+        Counted by bit operations on the `FacetIndex` if it is turned on,
+        otherwise by one grouped aggregate, cached by the `query_cache`.
+        """
+        index = get_facet_index()
+        if index is not None:
+            return index.totals(name, self.index_bits(index, exclude=name))
+        return self.cached('totals-' + name, lambda: self.count_totals(name), exclude=name)
+
+    def count_totals(self, name):
+        recipes = self.filter(Recipe.objects.all(), exclude=name)
+        if name == 'rating':
+            rows = recipes.values_list('rating_bucket')
+        else:
+            model_field = Recipe._meta.get_field(dict(self.relations)[name])
+            if model_field.many_to_many:
+                # Group the through table, it has one row per recipe and value.
+                rows = model_field.remote_field.through.objects.filter(**{
+                    '%s__in' % model_field.m2m_field_name(): recipes.values('id')
+                }).values_list(model_field.m2m_reverse_field_name())
+            else:
+                rows = recipes.filter(**{'%s__isnull' % model_field.name: False}).values_list(model_field.name)
+        return dict(rows.annotate(total=Count('*')).order_by())
+
+    def index_bits(self, index, exclude=None):
+        """ The bitset of the recipes matching every filter but `exclude`, see `FacetIndex`. """
+        bits = index.recipes(self.public_only)
+        for name, field in self.relations:
+            if name == exclude or name not in self.slugs:
+                continue
+            model = Recipe._meta.get_field(field).related_model
+            bits &= index.union(name, index.group_ids(name, model, self.slugs[name]))
+
+        if self.ratings is not None and exclude != 'rating':
+            bits &= index.union('rating', self.ratings)
+
+        if self.search:
+            if self.search_bits is None:
+                ids = list(search_recipes(Recipe.objects.all(), self.search).values_list('id', flat=True))
+                self.search_bits = bitset(ids, max(ids, default=0))
+            bits &= self.search_bits
+        return bits
+
+    def facets(self):
+        """
+        Count the recipes per course, cuisine, season, tag and rating.
+        Each facet applies every filter but its own,
+        so a facet lists all the values one could switch to.
+        One grouped aggregate per facet,
+        or a read of the `FacetCount` table if there is nothing to filter by,
+        or bit operations on the `FacetIndex` if it is turned on.
+        """
+        facets = {}
+        for name, field in self.relations:
+            facets[name] = self.relation_facet(name, field)
+        facets['rating'] = self.rating_facet()
+        return facets
+
+    def relation_facet(self, name, field):
+        model = Recipe._meta.get_field(field).related_model
+        if not self.is_filtered(exclude=name):
+            rows = counted_facet(model.objects.order_by('title'), name, self.public_only)
+            return list(rows.values('id', 'slug', 'title', 'total'))
+
+        totals = self.facet_totals(name)
+        index = get_facet_index()
+        if index is not None:
+            rows = index.describe(name, model, totals)
+        else:
+            rows = model.objects.filter(id__in=list(totals)).order_by('title').values('id', 'slug', 'title')
+        return [dict(row, total=totals[row['id']]) for row in rows]
+
+    def rating_facet(self):
+        totals = dict.fromkeys(RATINGS, 0)
+        if not self.is_filtered(exclude='rating'):
+            totals.update(counted_ratings(self.public_only))
+        else:
+            totals.update(self.facet_totals('rating'))
+        return [{'rating': rating, 'total': total} for rating, total in totals.items()]
@@ -1,12 +1,18 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
-from django.db.models import Count
-from django.core.exceptions import FieldDoesNotExist, ValidationError
+from functools import wraps
+
+from django.db import transaction
+from django.core.files.uploadedfile import UploadedFile
+from django.core.exceptions import NON_FIELD_ERRORS, FieldDoesNotExist, ValidationError
+from django.utils import timezone
 from rest_framework.exceptions import ParseError
 
-from v1.recipe.models import Recipe, SubRecipe
-from v1.recipe_groups.models import Course, Cuisine, Season, Tag
+from v1.recipe.facet_counts import FacetCounter
+from v1.recipe.models import Recipe, SubRecipe, store_unprocessed_photo
+from v1.recipe.versions import bump_collection_version
+from v1.recipe_groups.models import Course, Cuisine, Season, Tag, delete_unused_recipe_groups
 from v1.ingredient.models import IngredientGroup, Ingredient
 
 
@@ -29,6 +35,23 @@ class Validators(object):
         return None
 
 
+def delete_stored_photo_on_error(method):
+    """
+    Usage: Decorates the (atomic) save methods of `SaveRecipe`,
+    deletes the upload they stored if they fail, the rolled back recipe doesn't refer to it.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except Exception:
+            if self.stored_photo is not None:
+                Recipe._meta.get_field('photo').storage.delete(self.stored_photo)
+                self.stored_photo = None
+            raise
+    return wrapper
+
+
 class SaveRecipe(Validators):
     def __init__(self, data, author, partial=False):
         super(SaveRecipe, self).__init__(partial=partial)
@@ -36,6 +59,8 @@ class SaveRecipe(Validators):
         # Extract the data from data for use in the saving process
         self.author = author
         self.data = data
+        # The upload `_save_photo` stored, deleted again if saving the recipe fails.
+        self.stored_photo = None
 
         # Remove bad fields from the data
         self._clean_data()
@@ -62,10 +87,8 @@ class SaveRecipe(Validators):
             if self.course.get('id'):
                 self.data['course'] = Course.objects.get(id=self.course.get('id'))
             elif self.course.get('title'):
-                self.data['course'], created = Course.objects.get_or_create(
-                    title=self.course.get('title'),
-                    defaults={'author': self.author},
-                )
+                title = self.course.get('title')
+                self.data['course'] = self._get_or_create_titles(Course, [title], author=self.author)[title]
             else:
                 self.data['course'] = None
 
@@ -80,123 +103,231 @@ class SaveRecipe(Validators):
             if self.cuisine.get('id'):
                 self.data['cuisine'] = Cuisine.objects.get(id=self.cuisine.get('id'))
             elif self.cuisine.get('title'):
-                self.data['cuisine'], created = Cuisine.objects.get_or_create(
-                    title=self.cuisine.get('title'),
-                    defaults={'author': self.author},
-                )
+                title = self.cuisine.get('title')
+                self.data['cuisine'] = self._get_or_create_titles(Cuisine, [title], author=self.author)[title]
             else:
                 self.data['cuisine'] = None
 
     @staticmethod
-    def _delete_recipe_groups():
-            # Check to see if we have any Courses, Cuisines or Seasons with no recipes associated with them.
-            # Id we do, delete them.
-            Course.objects.all().exclude(author__is_staff='1').annotate(total=Count('recipe', distinct=True)).filter(total=0).delete()
-            Cuisine.objects.all().exclude(author__is_staff='1').annotate(total=Count('recipe', distinct=True)).filter(total=0).delete()
+    def _get_or_create_titles(model, titles, **defaults):
+        """
+        Usage: Returns `{title: instance}` of the `model` rows (e.g. `Tag`) with the `titles`, creating the missing ones.
+        One query finds them, the missing ones are inserted in bulk ignoring conflicts and read back.
+        So a save creating a title concurrently with another one doesn't raise an IntegrityError.
+        Example:
+            tags = self._get_or_create_titles(Tag, ['easy', 'vegan'])
+        """
+        titles = set(titles)
+        rows = list(model.objects.filter(title__in=titles))
+        missing = titles - {row.title for row in rows}
+        if missing:
+            model.objects.bulk_create([model(title=title, **defaults) for title in missing], ignore_conflicts=True)
+            rows += model.objects.filter(title__in=missing)
+            # The bulk insert doesn't send `post_save`, bump like `bump_recipe_group_version` does.
+            bump_collection_version(model._meta.model_name)
+
+        # MySQL compares the titles case-insensitive.
+        exact = {row.title: row for row in rows}
+        folded = {row.title.lower(): row for row in rows}
+        found = {}
+        for title in titles:
+            found[title] = exact.get(title) or folded.get(title.lower())
+            if found[title] is None:
+                # Lost its insert to a different title with the same slug.
+                found[title], created = model.objects.get_or_create(title=title, defaults=defaults)
+        return found
 
     def _save_seasons(self, recipe):
         if self.seasons is not None:
-            for season in recipe.seasons.all():
-                recipe.seasons.remove(season)
-
-            for season in self.seasons:
-                obj, created = Season.objects.get_or_create(title=season['title'].strip())
-                recipe.seasons.add(obj)
+            seasons = self._get_or_create_titles(Season, [season['title'].strip() for season in self.seasons])
+            recipe.seasons.set(seasons.values())
 
     def _save_tags(self, recipe):
         if self.tags is not None:
-            for tag in recipe.tags.all():
-                recipe.tags.remove(tag)
+            tags = self._get_or_create_titles(Tag, [tag['title'].strip() for tag in self.tags])
+            recipe.tags.set(tags.values())
 
-            for tag in self.tags:
-                obj, created = Tag.objects.get_or_create(title=tag['title'].strip())
-                recipe.tags.add(obj)
+    @staticmethod
+    def _indexed_error(err, prefix, label):
+        """ Prefix the keys of the ValidationError `err` with the index of the item, e.g. `ingredient_groups[1].` """
+        msg_dict = {}
+        for key in err.message_dict:
+            # Properly append the model attribute key
+            msg_dict_key = prefix + key
+            msg_dict[msg_dict_key] = err.message_dict[key]
+            msg_dict[msg_dict_key].append(label) # Workaround to display the value at the frontend
+        return ValidationError(msg_dict)
+
+    @staticmethod
+    def _bulk_create(model, objs, existing=(), **related):
+        """
+        `bulk_create` the `objs`, all related by `related` (e.g. `recipe=recipe`), and return them with their ids.
+        MySQL doesn't return the ids of a bulk insert,
+        they are read back in insertion order, skipping the `existing` ids.
+        """
+        objs = model.objects.bulk_create(objs)
+        if any(obj.pk is None for obj in objs):
+            ids = model.objects.filter(**related).exclude(pk__in=existing).order_by('pk').values_list('pk', flat=True)
+            for obj, pk in zip(objs, ids):
+                obj.pk = pk
+        return objs
 
-    def _save_ingredient_data(self, recipe):
+    @staticmethod
+    def _kept_ids(ids, stored):
+        """
+        Usage: Returns the `ids` of the `stored` rows that keep their row.
+        The rows are listed by id, so only a rising run of ids from the start keeps its place,
+        everything behind a new or moved row is inserted anew.
+        Example:
+            _kept_ids([3, 7, None, 9], {3, 5, 7, 9})
+            {3, 7}
+        """
+        kept, last = set(), 0
+        for pk in ids:
+            if not isinstance(pk, int) or pk not in stored or pk <= last:
+                break
+            kept.add(pk)
+            last = pk
+        return kept
+
+    def _save_ingredient_data(self, recipe, created=False):
+        """
+        Bring the ingredient groups and ingredients of `recipe` in line with the payload.
+        Rows are matched by id and only the changes are written, in bulk,
+        so fixing a typo is a single UPDATE.
+        """
         if self.ingredients is not None:
-            # TODO: don't delete everything when we edit the recipe. Use an ID.
-            for ingredient_group in recipe.ingredient_groups.all():
-                for ingredient in ingredient_group.ingredients.all():
-                    ingredient.delete()
-                ingredient_group.delete()
-
-            ingr_group_ix = -1 # zero based index
-            for ingredient_group in self.ingredients:
-                ingr_group_ix += 1
+            stored_groups, stored_ingredients = {}, {}
+            if not created:
+                stored_groups = {group.pk: group for group in IngredientGroup.objects.filter(recipe=recipe)}
+                stored_ingredients = {
+                    ingr.pk: ingr for ingr in Ingredient.objects.filter(ingredient_group__recipe=recipe)
+                }
+            kept_groups = self._kept_ids([group.get('id') for group in self.ingredients], stored_groups)
+            # An ingredient may move to another kept group.
+            movable = {pk for pk, ingr in stored_ingredients.items() if ingr.ingredient_group_id in kept_groups}
+
+            # Validate everything first, the first error is raised.
+            # The relations are set by us, they don't need a query to validate.
+            groups, ingredients, titles, kept_ingredients = [], [], set(), set()
+            for ingr_group_ix, ingredient_group in enumerate(self.ingredients):
                 group = IngredientGroup(
                     recipe=recipe, title=ingredient_group.get('title')
                 )
+                if ingredient_group.get('id') in kept_groups:
+                    group.pk = ingredient_group.get('id')
                 try:
                     # Django validation
-                    group.full_clean()
+                    group.full_clean(exclude=['recipe'], validate_unique=False)
+                    if group.title is not None and group.title in titles:
+                        raise ValidationError({
+                            NON_FIELD_ERRORS: [group.unique_error_message(IngredientGroup, ('title', 'recipe'))]
+                        })
                 except ValidationError as err:
-                    msg_dict = {}
-                    for key in err.message_dict:
-                        # Properly append the model attribute key
-                        msg_dict_key = f'ingredient_groups[{ingr_group_ix}].{key}'
-                        msg_dict[msg_dict_key] = err.message_dict[key]
-                        msg_dict[msg_dict_key].append(f'Ingredient_Group="{group.title}"') # Workaround to display the value at the frontend
-                    raise ValidationError(msg_dict)
-                group.save()
-
-                ingr_ix = -1 # zero based index
-                for ingredient in ingredient_group.get('ingredients'):
-                    ingr_ix += 1
-                    ingredient.pop('id') if ingredient.get('id') else None
+                    raise self._indexed_error(
+                        err, f'ingredient_groups[{ingr_group_ix}].', f'Ingredient_Group="{group.title}"'
+                    )
+                titles.add(group.title)
+                groups.append(group)
+
+                ingredient_ids = [ingredient.pop('id', None) for ingredient in ingredient_group.get('ingredients')]
+                kept = self._kept_ids(ingredient_ids, movable - kept_ingredients) if group.pk is not None else set()
+                kept_ingredients |= kept
+                for ingr_ix, (pk, ingredient) in enumerate(zip(ingredient_ids, ingredient_group.get('ingredients'))):
                     ingr = Ingredient(
                         ingredient_group=group, **ingredient
                     )
+                    if pk in kept:
+                        ingr.pk = pk
                     try:
                         # Django validation
-                        ingr.full_clean()
+                        ingr.full_clean(exclude=['ingredient_group'], validate_unique=False)
                     except ValidationError as err:
-                        msg_dict = {}
-                        for key in err.message_dict:
-                            # Properly append the model attribute key
-                            msg_dict_key = f'ingredient_groups[{ingr_group_ix}].ingredients[{ingr_ix}].{key}'
-                            msg_dict[msg_dict_key] = err.message_dict[key]
-                            msg_dict[msg_dict_key].append(f'Ingredient="{ingr.title}"') # Workaround to display the value at the frontend
-                        raise ValidationError(msg_dict)
-                    ingr.save()
+                        raise self._indexed_error(
+                            err, f'ingredient_groups[{ingr_group_ix}].ingredients[{ingr_ix}].', f'Ingredient="{ingr.title}"'
+                        )
+                    ingredients.append(ingr)
+
+            # The ingredients of the dropped groups go first, they may have moved.
+            dropped_ingredients = set(stored_ingredients) - kept_ingredients
+            if dropped_ingredients:
+                Ingredient.objects.filter(pk__in=dropped_ingredients).delete()
+            if set(stored_groups) - kept_groups:
+                IngredientGroup.objects.filter(pk__in=set(stored_groups) - kept_groups).delete()
+
+            now = timezone.now()
+            renamed = [group for group in groups if group.pk is not None and group.title != stored_groups[group.pk].title]
+            if renamed:
+                if {group.title for group in renamed} & {stored_groups[pk].title for pk in kept_groups}:
+                    # Swapped titles, the unique (title, recipe) is checked row by row.
+                    IngredientGroup.objects.filter(pk__in=[group.pk for group in renamed]).update(title=None)
+                for group in renamed:
+                    group.update_date = now
+                IngredientGroup.objects.bulk_update(renamed, ['title', 'update_date'])
+            # The ingredients pick up the ids of their groups on insert.
+            self._bulk_create(IngredientGroup, [group for group in groups if group.pk is None], kept_groups, recipe=recipe)
+
+            fields = ['title', 'numerator', 'denominator', 'measurement', 'ingredient_group_id']
+            changed = [
+                ingr for ingr in ingredients if ingr.pk is not None
+                and any(getattr(ingr, field) != getattr(stored_ingredients[ingr.pk], field) for field in fields)
+            ]
+            if changed:
+                for ingr in changed:
+                    ingr.update_date = now
+                Ingredient.objects.bulk_update(changed, ['title', 'numerator', 'denominator', 'measurement', 'ingredient_group', 'update_date'])
+            Ingredient.objects.bulk_create([ingr for ingr in ingredients if ingr.pk is None])
 
     def _save_subrecipe_data(self, recipe):
         if self.subrecipes is not None:
-            for subrecipe in SubRecipe.objects.filter(parent_recipe=recipe):
-                subrecipe.delete()
-
-            subr_ix = -1
-            for subrecipe in self.subrecipes:
-                if subrecipe.get('title'):
-                    subr_ix += 1
-                    child_recipe = Recipe.objects.filter(title=subrecipe.get('title', '')).first()
-                    if recipe:
-                        obj = SubRecipe.objects.create(
-                            numerator=subrecipe.get('numerator', 0),
-                            denominator=subrecipe.get('denominator', 1),
-                            measurement=subrecipe.get('measurement', ''),
-                            child_recipe=child_recipe,
-                            parent_recipe=recipe
-                        )
-                        try:
-                            # Django validation
-                            obj.full_clean()
-                        except ValidationError as err:
-                            msg_dict = {}
-                            for key in err.message_dict:
-                                # Properly append the model attribute key
-                                msg_dict_key = f'subrecipes[{subr_ix}].{key}'
-                                msg_dict[msg_dict_key] = err.message_dict[key]
-                                msg_dict[msg_dict_key].append(f'Subrecipe="{child_recipe.title}') # Workaround to display the value at the frontend
-                            raise ValidationError(msg_dict)
-
-                        obj.save()
+            SubRecipe.objects.filter(parent_recipe=recipe).delete()
+
+            subrecipes = [subrecipe for subrecipe in self.subrecipes if subrecipe.get('title')]
+            # The first recipe of each title, one query for all of them.
+            children = {}
+            for child_recipe in Recipe.objects.filter(title__in=[s.get('title') for s in subrecipes]).order_by('pk'):
+                children.setdefault(child_recipe.title, child_recipe)
+
+            objs = []
+            blank = SubRecipe._meta.get_field('child_recipe').error_messages['blank']
+            for subr_ix, subrecipe in enumerate(subrecipes):
+                obj = SubRecipe(
+                    numerator=subrecipe.get('numerator', 0),
+                    denominator=subrecipe.get('denominator', 1),
+                    measurement=subrecipe.get('measurement', ''),
+                    child_recipe=children.get(subrecipe.get('title')),
+                    parent_recipe=recipe
+                )
+                try:
+                    # Django validation
+                    obj.full_clean(exclude=['child_recipe', 'parent_recipe'])
+                    if obj.child_recipe is None:
+                        raise ValidationError({'child_recipe': [blank]})
+                except ValidationError as err:
+                    raise self._indexed_error(
+                        err, f'subrecipes[{subr_ix}].', f'Subrecipe="{subrecipe.get("title")}'
+                    )
+                objs.append(obj)
+            SubRecipe.objects.bulk_create(objs)
+
+    def _save_photo(self):
+        """
+        Store an uploaded photo as is, so the recipe is saved right away.
+        The worker processes it, see `process_photo`.
+        """
+        photo = self.data.get('photo')
+        if isinstance(photo, UploadedFile):
+            self.stored_photo = self.data['photo'] = store_unprocessed_photo(photo)
+            self.data['photo_status'] = Recipe.PHOTO_PROCESSING
+        elif 'photo' in self.data:
+            self.data['photo_status'] = Recipe.PHOTO_READY
 
     def _clean_data(self):
         """
         Clean up the data before we try and save it into the Recipe model.
         Remove fields that not not apart of the model or shouldn't be saved.
         """
-        for key in ['author', 'id', 'slug']:
+        for key in ['author', 'id', 'slug', 'photo_status', 'photo_variants', 'photo_thumbnail_name', 'photo_hash']:
             self.data.pop(key) if self.data.get(key) is not None else None
         keys = []
         for key, value in self.data.items():
@@ -230,10 +361,14 @@ class SaveRecipe(Validators):
         if len(errors) > 0:
             raise ParseError(errors)
 
+    @delete_stored_photo_on_error
+    @transaction.atomic
     def create(self):
         """ Create and return a new `Recipe` instance, given the validated data """
+        facet_counter = FacetCounter()
         self._save_course()
         self._save_cuisine()
+        self._save_photo()
 
         recipe = Recipe(
             author=self.author,
@@ -243,24 +378,26 @@ class SaveRecipe(Validators):
         recipe.full_clean()
         recipe.save()
 
-        try:
-            self._save_ingredient_data(recipe)
-            self._save_subrecipe_data(recipe)
-            self._save_seasons(recipe)
-            self._save_tags(recipe)
-        except Exception as err:
-            recipe.delete()
-            raise err
+        self._save_ingredient_data(recipe, created=True)
+        self._save_subrecipe_data(recipe)
+        self._save_seasons(recipe)
+        self._save_tags(recipe)
 
-        self._delete_recipe_groups()
+        recipe.search_document = recipe.build_search_document()
+        Recipe.objects.filter(pk=recipe.pk).update(search_document=recipe.search_document)
+        facet_counter.commit(recipe)
 
         return recipe
 
+    @delete_stored_photo_on_error
+    @transaction.atomic
     def update(self, instance):
         """ Update and return a new `Recipe` instance, given the validated data """
-
+        facet_counter = FacetCounter(instance)
+        course_id, cuisine_id = instance.course_id, instance.cuisine_id
         self._save_course()
         self._save_cuisine()
+        self._save_photo()
 
         for attr, value in self.data.items():
             setattr(instance, attr, value)
@@ -272,8 +409,15 @@ class SaveRecipe(Validators):
         self._save_subrecipe_data(instance)
         self._save_seasons(instance)
         self._save_tags(instance)
+        instance.search_document = instance.build_search_document()
         instance.save()
 
-        self._delete_recipe_groups()
+        # Only the course and cuisine the recipe left can have become unused,
+        # the others are swept by the `delete_unused_recipe_groups` command.
+        delete_unused_recipe_groups(
+            course_ids=[course_id] if course_id != instance.course_id else [],
+            cuisine_ids=[cuisine_id] if cuisine_id != instance.cuisine_id else [],
+        )
+        facet_counter.commit(instance)
 
         return instance
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
 from rest_framework import serializers
 from rest_framework.serializers import ImageField
 from rest_framework.settings import api_settings
@@ -25,14 +27,59 @@ class CustomImageField(ImageField):
             if not getattr(value, 'url', None):
                 # If the file has not been saved it may not have a URL.
                 return None
-            url = value.url
-            request = self.context.get('request', None)
-            if request is not None:
-                return request.build_absolute_uri(url)
-            return url
+            return self.absolute_url(value.url)
 
         return super(ImageField, self).to_representation(value)
 
+    def absolute_url(self, url):
+        request = self.context.get('request', None)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class StoredImageField(CustomImageField):
+    """
+    Renders the URL of an image by its recorded file name, e.g. `Recipe.photo_thumbnail_name`.
+    Unlike the `ImageSpecField` it's generated from, the storage isn't checked.
+    Example:
+        photo_thumbnail = StoredImageField(source='photo_thumbnail_name')
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super(StoredImageField, self).__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return self.absolute_url(default_storage.url(value))
+
+
+class ImageSrcsetField(CustomImageField):
+    """
+    Renders the pre-rendered variants of a photo (see `v1.recipe.photo_variants`)
+    as a srcset-style map: per format, preferred first, the URLs with their dimensions, narrowest first.
+    Example:
+        photo_srcset = ImageSrcsetField(source='photo_variants')
+        {"webp": [{"url": "http://.../400.webp", "width": 400, "height": 300}, ...], "jpeg": [...]}
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super(ImageSrcsetField, self).__init__(**kwargs)
+
+    def to_representation(self, value):
+        return {
+            format: [
+                {
+                    'url': self.absolute_url(default_storage.url(variant['name'])),
+                    'width': variant['width'],
+                    'height': variant['height'],
+                }
+                for variant in variants
+            ]
+            for format, variants in (value or {}).items()
+        }
+
 
 class SubRecipeSerializer(serializers.ModelSerializer):
     """ Standard `rest_framework` ModelSerializer """
@@ -54,7 +101,8 @@ class SubRecipeSerializer(serializers.ModelSerializer):
 class MiniBrowseSerializer(FieldLimiter, serializers.ModelSerializer):
     """ Used to get random recipes and limit the return data. """
     pub_date = serializers.DateTimeField(read_only=True)
-    photo_thumbnail = CustomImageField(required=False)
+    photo_thumbnail = StoredImageField(source='photo_thumbnail_name')
+    photo_srcset = ImageSrcsetField(source='photo_variants')
     seasons = SeasonSerializer(many=True, required=False)
     tags = TagSerializer(many=True, required=False)
 
@@ -68,6 +116,8 @@ class MiniBrowseSerializer(FieldLimiter, serializers.ModelSerializer):
             'rating',
             'rating_count',
             'photo_thumbnail',
+            'photo_status',
+            'photo_srcset',
             'info',
             'seasons',
             'tags',
@@ -77,7 +127,8 @@ class MiniBrowseSerializer(FieldLimiter, serializers.ModelSerializer):
 class RecipeSerializer(FieldLimiter, serializers.ModelSerializer):
     """ Used to create new recipes"""
     photo = CustomImageField(required=False)
-    photo_thumbnail = CustomImageField(required=False)
+    photo_thumbnail = StoredImageField(source='photo_thumbnail_name')
+    photo_srcset = ImageSrcsetField(source='photo_variants')
     ingredient_groups = IngredientGroupSerializer(many=True)
     subrecipes = SerializerMethodField()
     seasons = SeasonSerializer(many=True, required=False)
@@ -92,7 +143,8 @@ class RecipeSerializer(FieldLimiter, serializers.ModelSerializer):
 
     def get_subrecipes(self, obj):
         try:
-            subrecipes = SubRecipe.objects.filter(parent_recipe_id=obj.id)
+            # `parent_recipe` holds the SubRecipes whose parent is `obj`.
+            subrecipes = obj.parent_recipe.all()
             return [SubRecipeSerializer(subrecipe).data for subrecipe in subrecipes]
         except:
             return {}
@@ -103,6 +155,8 @@ class RecipeSerializer(FieldLimiter, serializers.ModelSerializer):
             'id',
             'photo',
             'photo_thumbnail',
+            'photo_status',
+            'photo_srcset',
             'ingredient_groups',
             'subrecipes',
             'seasons',
@@ -127,3 +181,6 @@ class RecipeSerializer(FieldLimiter, serializers.ModelSerializer):
             'public',
             'author',
         ]
+        prefetch_related = {
+            'subrecipes': [Prefetch('parent_recipe', queryset=SubRecipe.objects.select_related('child_recipe'))],
+        }
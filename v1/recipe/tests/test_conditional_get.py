@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+from v1.ingredient.models import Ingredient
+from v1.recipe import views
+from v1.recipe.models import Recipe
+from v1.recipe_groups.models import Course
+from v1.recipe_groups.views import CourseViewSet
+
+
+class ConditionalGetTests(TestCase):
+    fixtures = [
+        'test/users.json',
+        'course_data.json',
+        'cuisine_data.json',
+        'season_data.json',
+        'tag_data.json',
+        'ing_data.json',
+        'recipe_data.json'
+    ]
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.get(pk=1)
+
+    def get(self, view, url, etag=None, user=None, **kwargs):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        request = self.factory.get(url, **headers)
+        force_authenticate(request, user or self.user)
+        return view(request, **kwargs)
+
+    def retrieve(self, etag=None, user=None):
+        view = views.RecipeViewSet.as_view({'get': 'retrieve'})
+        return self.get(view, '/api/v1/recipe/recipes/tasty-chili/', etag, user, slug='tasty-chili')
+
+    def list(self, etag=None):
+        view = views.RecipeViewSet.as_view({'get': 'list'})
+        return self.get(view, '/api/v1/recipe/recipes/?course=entry', etag)
+
+    def test_retrieve_not_modified(self):
+        response = self.retrieve()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn('Last-Modified', response)
+
+        # One query for the validators, nothing is serialized.
+        with self.assertNumQueries(1):
+            response = self.retrieve(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # The ETag is per user.
+        response = self.retrieve(etag, User.objects.get(pk=2))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_retrieve_ingredient_changes(self):
+        etag = self.retrieve()['ETag']
+        ingredients = Ingredient.objects.filter(ingredient_group__recipe__slug='tasty-chili')
+
+        ingredient = ingredients.first()
+        ingredient.title = 'Chili flakes'
+        ingredient.save()
+        response = self.retrieve(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        ingredients.last().delete()
+        response = self.retrieve(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_not_modified(self):
+        response = self.list()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.list(etag)
+        self.assertEqual(response.status_code, 304)
+
+        # The version is bumped once the change commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.get(slug='tasty-chili')
+            recipe.title = 'Tasty Chili con Carne'
+            recipe.save()
+        response = self.list(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_course_list_not_modified(self):
+        view = CourseViewSet.as_view({'get': 'list'})
+        etag = self.get(view, '/api/v1/recipe_groups/course/')['ETag']
+        self.assertEqual(self.get(view, '/api/v1/recipe_groups/course/', etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.create(title='Brunch', author=self.user)
+        response = self.get(view, '/api/v1/recipe_groups/course/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
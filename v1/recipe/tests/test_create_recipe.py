@@ -2,12 +2,18 @@
 # encoding: utf-8
 
 import os
+from copy import deepcopy
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from rest_framework.test import APIRequestFactory
 from v1.recipe import views
+from v1.recipe.models import Recipe
+from v1.recipe.save_recipe import SaveRecipe
+from v1.recipe_groups.models import Tag
 
 
 class RecipeSerializerTests(TestCase):
@@ -177,4 +183,61 @@ class RecipeSerializerTests(TestCase):
         response = self.client.post('/api/v1/recipe/recipes/', self.data, content_type="application/json")
         self.assertEqual(response.status_code, 400)
         self.assertTrue("ingredient_groups[2].ingredients[1].title" in str(response.data))
-        self.assertTrue("Ensure this value has at most 250 characters" in str(response.data))
\ No newline at end of file
+        self.assertTrue("Ensure this value has at most 250 characters" in str(response.data))
+
+    def test_create_recipe_search_document(self):
+        """The search document is built from the saved recipe"""
+        response = self.client.post('/api/v1/recipe/recipes/', self.data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        recipe = Recipe.objects.get(id=response.data.get('id'))
+        self.assertTrue(recipe.search_document.startswith('recipe name'))
+        for text in ['kidney beans', 'kosher salt', 'summer', 'hello']:
+            self.assertTrue(text in recipe.search_document)
+
+    def test_create_recipe_ingredient_queries(self):
+        """The ingredients are inserted in bulk, more of them cost no more queries"""
+        def count_queries(copies):
+            data = deepcopy(self.data)
+            data['title'] = 'Recipe with %s copies' % copies
+            for group in data['ingredient_groups']:
+                group['ingredients'] = group['ingredients'] * copies
+            with CaptureQueriesContext(connection) as queries:
+                recipe = SaveRecipe(data, self.staff).create()
+            self.assertEqual(
+                recipe.ingredient_groups.filter(ingredients__isnull=False).count(),
+                sum(len(group['ingredients']) for group in self.data['ingredient_groups']) * copies
+            )
+            return len(queries)
+
+        # The first one creates the tags.
+        count_queries(1)
+        self.assertEqual(count_queries(2), count_queries(10))
+
+    def test_create_recipe_duplicate_ingredient_group(self):
+        self.data['ingredient_groups'].append(deepcopy(self.data['ingredient_groups'][1]))
+        response = self.client.post('/api/v1/recipe/recipes/', self.data, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue("ingredient_groups[%s].__all__" % (len(self.data['ingredient_groups']) - 1) in str(response.data))
+
+    def test_create_recipe_tag_queries(self):
+        """Tags are resolved and linked set-based, more of them cost no more queries"""
+        titles = ['Tag %s' % i for i in range(10)]
+        SaveRecipe._get_or_create_titles(Tag, titles)
+        self.assertEqual(Tag.objects.filter(title__in=titles).count(), 10)
+
+        def count_queries(tags):
+            data = deepcopy(self.data)
+            data['title'] = 'Recipe with %s tags' % tags
+            data['tags'] = [{'title': title} for title in titles[:tags]]
+            with CaptureQueriesContext(connection) as queries:
+                recipe = SaveRecipe(data, self.staff).create()
+            self.assertEqual(recipe.tags.count(), tags)
+            return len(queries)
+
+        self.assertEqual(count_queries(2), count_queries(10))
+
+        # Existing titles are reused, only the new ones are created.
+        tags = SaveRecipe._get_or_create_titles(Tag, ['Tag 1', 'Tag 10'])
+        self.assertEqual(tags['Tag 1'], Tag.objects.get(title='Tag 1'))
+        self.assertEqual(Tag.objects.filter(title__in=titles + ['Tag 10']).count(), 11)
@@ -6,11 +6,18 @@ import shutil
 from pathlib import Path
 
 from django.conf import settings
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from rest_framework.test import APIRequestFactory
+from v1.ingredient.models import Ingredient, IngredientGroup
+from v1.jobs.queue import run_pending_jobs
+from v1.rating.models import Rating
 from v1.recipe import views
-from v1.recipe.models import Recipe
+from v1.recipe.delete_recipe import delete_recipe
+from v1.recipe.facet_counts import rebuild_facet_counts
+from v1.recipe.models import Recipe, SubRecipe
 
 
 class RecipeSerializerTests(TestCase):
@@ -65,6 +72,31 @@ class RecipeSerializerTests(TestCase):
         response = view(request, slug='tasty-chili')
         self.assertEqual(response.status_code, 204)
 
-        # photo should be deleted
-        my_file = Path(media_path, '/food.jpg')
-        self.assertFalse(my_file.is_file(), 'Deleting File failed')
\ No newline at end of file
+        # photo should be deleted, by the worker
+        run_pending_jobs()
+        my_file = Path(media_path, 'food.jpg')
+        self.assertFalse(my_file.is_file(), 'Deleting File failed')
+
+    def test_delete_recipe_rows(self):
+        """The rows of a recipe are deleted without loading them, a DELETE per table"""
+        recipe = Recipe.objects.get(slug='tasty-chili')
+        other = Recipe.objects.exclude(pk=recipe.pk).first()
+        SubRecipe.objects.create(parent_recipe=other, child_recipe=recipe)
+        Rating.objects.bulk_create([
+            Rating(recipe=recipe, comment='good', rating=4, author=self.staff) for i in range(50)
+        ])
+        rebuild_facet_counts()
+        self.assertTrue(IngredientGroup.objects.filter(recipe=recipe).exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            delete_recipe(recipe)
+        self.assertFalse([q['sql'] for q in queries if 'FROM "rating_rating"' in q['sql'] and q['sql'].startswith('SELECT')])
+
+        self.assertFalse(Recipe.objects.filter(pk=recipe.pk).exists())
+        self.assertFalse(IngredientGroup.objects.filter(recipe_id=recipe.pk).exists())
+        self.assertFalse(Ingredient.objects.filter(ingredient_group__recipe_id=recipe.pk).exists())
+        self.assertFalse(Rating.objects.filter(recipe_id=recipe.pk).exists())
+        self.assertFalse(SubRecipe.objects.filter(child_recipe_id=recipe.pk).exists())
+        self.assertFalse(Recipe.tags.through.objects.filter(recipe_id=recipe.pk).exists())
+        self.assertTrue(Recipe.objects.filter(pk=other.pk).exists())
+        self.assertEqual(rebuild_facet_counts(), 0)
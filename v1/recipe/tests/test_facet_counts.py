@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from v1.rating.models import Rating
+from v1.recipe.facet_counts import count_facets, move_facet_counts, rebuild_facet_counts
+from v1.recipe.models import FacetCount, Recipe
+from v1.recipe.save_recipe import SaveRecipe
+
+
+class FacetCountTests(TestCase):
+    fixtures = [
+        'test/users.json',
+        'course_data.json',
+        'cuisine_data.json',
+        'season_data.json',
+        'tag_data.json',
+        'ing_data.json',
+        'recipe_data.json'
+    ]
+
+    def setUp(self):
+        call_command('rebuild_facet_counts', stdout=StringIO())
+        self.user = User.objects.get(pk=1)
+
+    def total(self, facet, value, public=True):
+        count = FacetCount.objects.filter(facet=facet, value=value, public=public).first()
+        return count.total if count else 0
+
+    def test_rebuild(self):
+        """The rebuild stores the counted totals and fixes drift"""
+        self.assertEqual(self.total('course', 6), 31)
+        self.assertEqual(rebuild_facet_counts(), 0)
+
+        FacetCount.objects.filter(facet='course', value=6).update(total=12)
+        FacetCount.objects.filter(facet='tag').delete()
+        self.assertEqual(rebuild_facet_counts(), 5)
+        self.assertEqual(self.total('course', 6), 31)
+
+    def test_save_recipe(self):
+        """Creating, updating and deleting a recipe moves the counters"""
+        recipe = SaveRecipe({
+            'title': 'Facet Soup',
+            'servings': 2,
+            'public': False,
+            'course': {'id': 6},
+            'tags': [{'title': 'easy'}],
+            'ingredient_groups': [{'title': '', 'ingredients': []}],
+        }, self.user).create()
+        self.assertEqual(self.total('course', 6, public=False), 1)
+        self.assertEqual(rebuild_facet_counts(), 0)
+
+        SaveRecipe({
+            'public': True,
+            'course': {'title': 'Soups'},
+            'tags': [],
+        }, self.user, partial=True).update(Recipe.objects.get(pk=recipe.pk))
+        soups = Recipe.objects.get(pk=recipe.pk).course_id
+        self.assertEqual(self.total('course', 6, public=False), 0)
+        self.assertEqual(self.total('course', soups), 1)
+        self.assertEqual(rebuild_facet_counts(), 0)
+
+        Rating.objects.create(recipe=Recipe.objects.get(pk=recipe.pk), comment='', rating=4, author=self.user)
+        self.assertEqual(rebuild_facet_counts(), 0)
+
+        Recipe.objects.get(pk=recipe.pk).delete()
+        self.assertEqual(self.total('course', soups), 0)
+        self.assertEqual(rebuild_facet_counts(), 0)
+
+    def test_move_facet_counts(self):
+        """The counts move in one UPDATE, after inserting the missing rows"""
+        tagged = self.total('tag', 1)
+        with self.assertNumQueries(2):
+            move_facet_counts({('course', 6, True), ('tag', 1, True)}, {('course', 7, True), ('tag', 1, True)})
+        self.assertEqual(self.total('course', 6), 30)
+        self.assertEqual(self.total('course', 7), 1)
+        self.assertEqual(self.total('tag', 1), tagged)
+        # Counted out only.
+        with self.assertNumQueries(1):
+            move_facet_counts({('course', 7, True)}, set())
+        self.assertEqual(self.total('course', 7), 0)
+
+    def test_count_facets(self):
+        """The counters answer the unfiltered facets"""
+        totals = count_facets()
+        self.assertEqual(sum(total for (facet, value, public), total in totals.items() if facet == 'rating'), 31)
+        # The count and the page.
+        with self.assertNumQueries(2):
+            self.client.get('/api/v1/recipe_groups/course-count/')
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management import call_command
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory
+from v1.recipe.facet_index import FacetIndex, bitset, get_facet_index, rebuild_facet_index
+from v1.recipe.models import Recipe
+from v1.recipe.recipe_filter import RecipeFilter
+from v1.recipe.save_recipe import SaveRecipe
+from v1.recipe_groups.views import SeasonCountViewSet
+
+
+class FacetIndexTests(TestCase):
+    fixtures = [
+        'test/users.json',
+        'course_data.json',
+        'cuisine_data.json',
+        'season_data.json',
+        'tag_data.json',
+        'ing_data.json',
+        'recipe_data.json'
+    ]
+    queries = [
+        'cuisine=american&tag=easy',
+        'course=entry&season=spring,summer',
+        'tag=easy,gluten-free&rating=0,1,2,3',
+        'course=entry&cuisine=american&season=winter&tag=nut-free&rating=0',
+        'search=chili&tag=easy',
+    ]
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        call_command('build_search_documents', stdout=StringIO())
+        call_command('rebuild_facet_counts', stdout=StringIO())
+        with override_settings(RECIPE_FACET_INDEX=True):
+            rebuild_facet_index()
+
+    def facets(self, query):
+        # Not through the view, that would run into the anonymous throttle.
+        request = SimpleNamespace(query_params=QueryDict(query), user=AnonymousUser())
+        return RecipeFilter(request).facets()
+
+    def assertSameFacets(self):
+        for query in self.queries:
+            expected = self.facets(query)
+            with override_settings(RECIPE_FACET_INDEX=True):
+                self.assertEqual(self.facets(query), expected, query)
+
+    def test_bitset(self):
+        self.assertEqual(bitset([1, 3], 8), 0b1010)
+        self.assertEqual(bitset([], 0), 0)
+
+    def test_facets(self):
+        """The index counts the same facets as SQL"""
+        self.assertSameFacets()
+
+    @override_settings(RECIPE_FACET_INDEX=True)
+    def test_facet_count_view(self):
+        view = SeasonCountViewSet.as_view({'get': 'list'})
+        response = view(self.factory.get('/api/v1/recipe_groups/season-count/?cuisine=american&tag=easy'))
+        totals = {item['slug']: item['total'] for item in response.data.get('results')}
+        self.assertEqual(totals, {'spring': 3, 'summer': 1, 'autumn': 1})
+
+    def test_follows_changes(self):
+        """Saved recipes are moved in the index once the transaction commits"""
+        with override_settings(RECIPE_FACET_INDEX=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                SaveRecipe({
+                    'tags': [{'title': 'easy'}, {'title': 'nut-free'}],
+                    'seasons': [{'title': 'Winter'}],
+                }, User.objects.get(pk=1), partial=True).update(Recipe.objects.get(pk=2))
+            with self.captureOnCommitCallbacks(execute=True):
+                Recipe.objects.get(pk=3).delete()
+            self.assertFalse(get_facet_index().expired())
+
+        self.assertSameFacets()
+
+    def test_rebuild(self):
+        """An expired index answers until the new one is swapped in, the changes made meanwhile are replayed"""
+        with override_settings(RECIPE_FACET_INDEX=True):
+            index = get_facet_index()
+            with mock.patch('v1.recipe.facet_index.threading.Thread') as thread, \
+                    mock.patch.object(index, 'built_at', None):
+                self.assertIs(get_facet_index(), index)
+                thread.assert_called_once()
+                thread.return_value.start.assert_called_once()
+                # Started already.
+                get_facet_index()
+                thread.assert_called_once()
+                # As if it ran in the background, on the test's connection.
+                thread.call_args.kwargs['target']()
+            self.assertIsNot(get_facet_index(), index)
+
+            build = FacetIndex.build
+
+            def build_then_save(new_index):
+                build(new_index)
+                with self.captureOnCommitCallbacks(execute=True):
+                    SaveRecipe({'tags': [{'title': 'easy'}]}, User.objects.get(pk=1), partial=True).update(
+                        Recipe.objects.get(pk=2)
+                    )
+
+            with mock.patch.object(FacetIndex, 'build', build_then_save):
+                rebuild_facet_index()
+
+        self.assertSameFacets()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from v1.jobs.queue import run_pending_jobs
+from v1.recipe.models import Recipe, hash_photo
+from v1.recipe.photo_variants import delete_variants, generate_variants
+from v1.recipe.save_recipe import SaveRecipe
+
+
+def rotated_photo():
+    """ A 300x200 JPEG, to be shown rotated by 90 degrees (200x300). """
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    content = BytesIO()
+    Image.new('RGB', (300, 200), 'red').save(content, 'JPEG', exif=exif)
+    return content.getvalue()
+
+
+def use_media_root(test):
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root)
+    settings = override_settings(MEDIA_ROOT=media_root, RECIPE_PHOTO_VARIANT_WIDTHS=[100, 400])
+    settings.enable()
+    test.addCleanup(settings.disable)
+    # Forget the thumbnails other tests generated elsewhere.
+    cache.clear()
+
+
+class PhotoVariantsTests(TestCase):
+    def setUp(self):
+        use_media_root(self)
+        self.name = default_storage.save('upload/recipe_photos/food.jpg', ContentFile(rotated_photo()))
+
+    def test_generate_variants(self):
+        variants = generate_variants(default_storage, self.name)
+        self.assertEqual(list(variants), ['webp', 'jpeg'])
+        self.assertEqual(
+            [(variant['width'], variant['height']) for variant in variants['jpeg']],
+            [(100, 150), (200, 300)]
+        )
+        self.assertEqual(variants['webp'][0]['name'], 'CACHE/variants/upload/recipe_photos/food.jpg/100.webp')
+
+        with default_storage.open(variants['jpeg'][1]['name']) as f:
+            image = Image.open(f)
+            self.assertEqual(image.size, (200, 300))
+            self.assertTrue(image.info.get('progressive'))
+            self.assertEqual(len(image.getexif()), 0)
+
+        # Rendered again in place.
+        self.assertEqual(generate_variants(default_storage, self.name), variants)
+
+        # Another photo with the same name but a different extension has its own variants.
+        with default_storage.open(self.name) as f:
+            png = default_storage.save('upload/recipe_photos/food.png', ContentFile(f.read()))
+        png_variants = generate_variants(default_storage, png)
+        delete_variants(default_storage, png)
+        self.assertFalse(default_storage.exists(png_variants['webp'][0]['name']))
+        self.assertTrue(default_storage.exists(variants['webp'][0]['name']))
+
+        delete_variants(default_storage, self.name)
+        self.assertFalse(default_storage.exists(variants['webp'][0]['name']))
+
+
+class PhotoUploadTests(TestCase):
+    fixtures = [
+        'test/users.json',
+        'course_data.json',
+        'cuisine_data.json',
+        'season_data.json',
+        'tag_data.json',
+        'recipe_data.json'
+    ]
+
+    def setUp(self):
+        use_media_root(self)
+
+    def test_upload_upright(self):
+        """ The stored photo is upright, like its variants """
+        recipe = SaveRecipe(
+            {'photo': SimpleUploadedFile('food.jpg', rotated_photo(), 'image/jpeg')}, User.objects.get(pk=1), partial=True
+        ).update(Recipe.objects.get(slug='tasty-chili'))
+        run_pending_jobs()
+
+        recipe.refresh_from_db()
+        with recipe.photo.open() as f:
+            self.assertEqual(Image.open(f).size, (200, 300))
+        self.assertEqual(
+            [(variant['width'], variant['height']) for variant in recipe.photo_variants['jpeg']],
+            [(100, 150), (200, 300)]
+        )
+
+
+class RegenerateImagesTests(TestCase):
+    fixtures = [
+        'test/users.json',
+        'course_data.json',
+        'cuisine_data.json',
+        'season_data.json',
+        'tag_data.json',
+        'recipe_data.json'
+    ]
+
+    def setUp(self):
+        use_media_root(self)
+
+        content = BytesIO()
+        Image.new('RGB', (300, 200), 'red').save(content, 'JPEG')
+        name = default_storage.save('upload/recipe_photos/food.jpg', ContentFile(content.getvalue()))
+        # Stale, as if rendered before.
+        Recipe.objects.filter(slug='tasty-chili').update(photo=name, photo_hash='stale')
+
+    def regenerate(self, *args):
+        stdout = StringIO()
+        call_command('regenerate_images', '--processes', '2', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_regenerate_images(self):
+        self.assertIn('1 of 1 photos regenerated', self.regenerate())
+        recipe = Recipe.objects.get(slug='tasty-chili')
+        self.assertEqual(recipe.photo_hash, hash_photo(recipe.photo.name))
+        self.assertTrue(default_storage.exists(recipe.photo_thumbnail_name))
+        self.assertEqual([variant['width'] for variant in recipe.photo_variants['webp']], [100, 300])
+
+        # Up to date.
+        self.assertIn('0 of 1 photos regenerated', self.regenerate())
+        self.assertIn('1 of 1 photos regenerated', self.regenerate('--force'))
+        self.assertIn('0 of 0 photos regenerated', self.regenerate('--start-id', str(recipe.id)))
+
+        # The widths changed, the left over variants are deleted.
+        with override_settings(RECIPE_PHOTO_VARIANT_WIDTHS=[200]):
+            self.assertIn('1 of 1 photos regenerated', self.regenerate())
+        recipe.refresh_from_db()
+        self.assertEqual([variant['width'] for variant in recipe.photo_variants['webp']], [200])
+        self.assertFalse(default_storage.exists('CACHE/variants/upload/recipe_photos/food.jpg/100.webp'))
+
+    def test_regenerate_rotated_upload(self):
+        """ Regenerating renders the same as the upload did """
+        recipe = SaveRecipe(
+            {'photo': SimpleUploadedFile('food.jpg', rotated_photo(), 'image/jpeg')}, User.objects.get(pk=1), partial=True
+        ).update(Recipe.objects.get(slug='tasty-chili'))
+        run_pending_jobs()
+        recipe.refresh_from_db()
+        uploaded = recipe.photo_variants
+
+        self.assertIn('1 of 1 photos regenerated', self.regenerate('--force'))
+        recipe.refresh_from_db()
+        for format_name, format_variants in uploaded.items():
+            self.assertEqual(
+                [(variant['width'], variant['height']) for variant in recipe.photo_variants[format_name]],
+                [(variant['width'], variant['height']) for variant in format_variants]
+            )
+        self.assertEqual(
+            [(variant['width'], variant['height']) for variant in recipe.photo_variants['jpeg']],
+            [(100, 150), (200, 300)]
+        )
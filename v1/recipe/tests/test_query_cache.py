@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from io import StringIO
+from types import SimpleNamespace
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from v1.recipe import views
+from v1.recipe.models import Recipe
+from v1.recipe.query_cache import query_cache
+from v1.recipe.recipe_filter import RecipeFilter
+from v1.recipe_groups.models import Tag
+
+
+@override_settings(RECIPE_QUERY_CACHE=True)
+class QueryCacheTests(TestCase):
+    fixtures = [
+        'test/users.json',
+        'course_data.json',
+        'cuisine_data.json',
+        'season_data.json',
+        'tag_data.json',
+        'ing_data.json',
+        'recipe_data.json'
+    ]
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.get(pk=1)
+        call_command('build_search_documents', stdout=StringIO())
+        cache.clear()
+
+    def recipe_filter(self, query, user=None):
+        return RecipeFilter(SimpleNamespace(query_params=QueryDict(query), user=user or AnonymousUser()))
+
+    def list_recipes(self, query):
+        view = views.RecipeViewSet.as_view({'get': 'list'})
+        request = self.factory.get('/api/v1/recipe/recipes/' + query)
+        force_authenticate(request, self.user)
+        return view(request).data
+
+    def test_normalized(self):
+        self.assertEqual(
+            self.recipe_filter('search=Beef%20Chili&tag=easy,vegan&rating=4,3').normalized(),
+            self.recipe_filter('search=chili%20beef&tag__slug=vegan,easy&rating=3,4').normalized(),
+        )
+        self.assertNotEqual(
+            self.recipe_filter('tag=easy').normalized(),
+            self.recipe_filter('tag=easy', self.user).normalized(),
+        )
+        # A facet doesn't filter itself, so its own filter doesn't split the entries.
+        self.assertEqual(
+            self.recipe_filter('tag=easy&course=entry').normalized(exclude='tag'),
+            self.recipe_filter('course=entry').normalized(exclude='tag'),
+        )
+
+    def test_list(self):
+        for query in ('?limit=5&offset=3', '?search=chili&ordering=title', '?tag=easy&limit=2'):
+            with override_settings(RECIPE_QUERY_CACHE=False):
+                expected = self.list_recipes(query)
+            self.assertEqual(self.list_recipes(query), expected)
+            self.assertEqual(self.list_recipes(query), expected)
+        self.assertEqual(query_cache.stats(), {'hits': 3, 'misses': 3})
+
+        # Another page of the same query is cut from the same ids.
+        self.list_recipes('?tag=easy&limit=2&offset=2')
+        self.assertEqual(query_cache.stats(), {'hits': 4, 'misses': 3})
+
+    def test_invalidated_by_changes(self):
+        self.list_recipes('?tag=easy')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.get(slug='tasty-chili')
+            recipe.tags.add(Tag.objects.get(slug='easy'))
+        self.list_recipes('?tag=easy')
+        self.assertEqual(query_cache.stats(), {'hits': 0, 'misses': 2})
+
+    def test_facet_totals(self):
+        query = 'course=entry&tag=easy&rating=0,1,2,3'
+        with override_settings(RECIPE_QUERY_CACHE=False):
+            expected = self.recipe_filter(query).facets()
+        self.assertEqual(self.recipe_filter(query).facets(), expected)
+
+        # Warm, only the versions are read.
+        with self.assertNumQueries(1 + 4):
+            self.assertEqual(self.recipe_filter(query).facets(), expected)
+
+    def test_mini_browse(self):
+        """The random sample bypasses the cache, a miss would load every matching id"""
+        view = views.MiniBrowseViewSet.as_view({'get': 'list'})
+        for i in range(2):
+            request = self.factory.get('/api/v1/recipe/mini-browse/?limit=3&course=entry')
+            force_authenticate(request, self.user)
+            results = view(request).data.get('results')
+            self.assertEqual(len(results), 3)
+        self.assertEqual(query_cache.stats(), {'hits': 0, 'misses': 0})
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+
+from v1.recipe import views
+from v1.recipe.models import Recipe, SubRecipe
+
+
+class QueryPlannerTests(TestCase):
+    fixtures = [
+        'test/users.json',
+        'course_data.json',
+        'cuisine_data.json',
+        'season_data.json',
+        'tag_data.json',
+        'ing_data.json',
+        'recipe_data.json'
+    ]
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        SubRecipe.objects.create(
+            parent_recipe=Recipe.objects.get(slug='tasty-chili'),
+            child_recipe=Recipe.objects.get(slug='tasty-chili-2'),
+        )
+
+    def list_recipes(self, query):
+        view = views.RecipeViewSet.as_view({'get': 'list'})
+        return view(self.factory.get('/api/v1/recipe/recipes/' + query))
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        """A page costs the same number of queries, no matter how many recipes it holds"""
+        # validators, count, recipes, seasons, tags, ingredient groups, ingredients, subrecipes
+        with self.assertNumQueries(8):
+            response = self.list_recipes('?limit=100')
+        self.assertEqual(len(response.data.get('results')), 31)
+
+        with self.assertNumQueries(8):
+            response = self.list_recipes('?limit=2&ordering=pub_date')
+        self.assertEqual(len(response.data.get('results')), 2)
+
+        recipe = response.data.get('results')[0]
+        self.assertEqual(recipe.get('slug'), 'tasty-chili')
+        self.assertEqual(recipe.get('subrecipes')[0].get('slug'), 'tasty-chili-2')
+        self.assertTrue(len(recipe.get('ingredient_groups')) > 0)
+        self.assertTrue(recipe.get('pub_username'))
+
+    def test_list_with_limited_fields(self):
+        """Only the relations of the requested fields are loaded"""
+        with self.assertNumQueries(3):
+            response = self.list_recipes('?fields=id,title,pub_username')
+        for r in response.data.get('results'):
+            self.assertEqual(set(r.keys()), {'id', 'title', 'pub_username'})
+
+        with self.assertNumQueries(4):
+            response = self.list_recipes('?fields=id,tags')
+
+    def test_retrieve(self):
+        view = views.RecipeViewSet.as_view({'get': 'retrieve'})
+        # validators, recipe, seasons, tags, ingredient groups, ingredients, subrecipes
+        with self.assertNumQueries(7):
+            response = view(self.factory.get('/api/v1/recipe/recipes/tasty-chili'), slug='tasty-chili')
+        self.assertEqual(response.data.get('title'), 'Tasty Chili')
+        self.assertEqual(response.data.get('course').get('title'), Recipe.objects.get(slug='tasty-chili').course.title)
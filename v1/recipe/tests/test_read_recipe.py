@@ -2,9 +2,15 @@
 # encoding: utf-8
 
 import json
+from io import StringIO
+from unittest import mock
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
 from django.test import TestCase
 from rest_framework.test import APIRequestFactory
 from v1.recipe import views
+from v1.recipe.models import Recipe
+from v1.recipe.random_sample import random_sample
 
 
 class RecipeSerializerTests(TestCase):
@@ -99,3 +105,73 @@ class RecipeSerializerTests(TestCase):
         uniqueResultsLen = len(uniqueResults)
 
         self.assertEqual(resultsLen, uniqueResultsLen)
+
+    def test_list_view_search(self):
+        """Search the recipes and order them by relevance"""
+        call_command('build_search_documents', stdout=StringIO())
+        view = views.RecipeViewSet.as_view({'get': 'list'})
+        request = self.factory.get('/api/v1/recipe/recipes/?fields=id,title&search=chili&ordering=-search_rank')
+        response = view(request)
+
+        results = response.data.get('results')
+        self.assertEqual(len(results), 20)
+        for r in results:
+            self.assertTrue('chili' in r.get('title').lower())
+
+        request = self.factory.get('/api/v1/recipe/recipes/?fields=id&search=blue berry')
+        response = view(request)
+        self.assertEqual(len(response.data.get('results')), 0)
+
+    def test_mini_browse_random_sample(self):
+        """The sample honours the filters, has no duplicates and wraps around"""
+        qs = Recipe.objects.filter(public=True)
+        for limit in [0, 1, 4, 31, 40]:
+            ids = random_sample(qs, limit)
+            self.assertEqual(len(ids), min(limit, 31))
+            self.assertEqual(len(set(ids)), len(ids))
+
+        Recipe.objects.update(random_key=0.0)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(random_sample(qs, 4)), 4)
+
+        self.assertEqual(random_sample(qs.filter(title='Tasty Chili'), 4), [1])
+
+    def test_browse_view(self):
+        """The browse page returns the recipes and the facets of the same filters"""
+        call_command('build_search_documents', stdout=StringIO())
+        view = views.RecipeBrowseViewSet.as_view({'get': 'list'})
+        request = self.factory.get('/api/v1/recipe/browse/?fields=id,title&cuisine=american&tag=easy&limit=2')
+        response = view(request)
+
+        self.assertEqual(response.data.get('count'), 4)
+        self.assertEqual(len(response.data.get('results')), 2)
+
+        facets = response.data.get('facets')
+        totals = lambda name: {item['slug']: item['total'] for item in facets[name]}
+        self.assertEqual(totals('course'), {'entry': 4})
+        self.assertEqual(totals('cuisine'), {'american': 4})
+        self.assertEqual(totals('season'), {'spring': 3, 'summer': 1, 'autumn': 1})
+        # A facet ignores its own filter.
+        self.assertEqual(totals('tag'), {'easy': 4, 'gluten-free': 2, 'milk-free': 2, 'nut-free': 1})
+        self.assertEqual(sum(item['total'] for item in facets['rating']), 4)
+
+        request = self.factory.get('/api/v1/recipe/browse/?fields=id&search=chili&course=entry')
+        response = view(request)
+        self.assertEqual(response.data.get('count'), 20)
+        self.assertEqual(response.data.get('facets')['course'][0]['total'], 20)
+
+    def test_list_view_thumbnails_without_storage(self):
+        """The thumbnail URLs are built from the recorded names, the storage isn't touched"""
+        Recipe.objects.update(
+            photo='upload/recipe_photos/food.jpg',
+            photo_thumbnail_name='CACHE/images/upload/recipe_photos/food/thumbnail.jpg',
+        )
+        view = views.RecipeViewSet.as_view({'get': 'list'})
+        request = self.factory.get('/api/v1/recipe/recipes/?limit=100')
+        with mock.patch.object(FileSystemStorage, 'exists', side_effect=AssertionError('exists')), \
+                mock.patch.object(FileSystemStorage, 'open', side_effect=AssertionError('open')):
+            results = view(request).data.get('results')
+
+        self.assertTrue(len(results) > 30)
+        for result in results:
+            self.assertTrue(result.get('photo_thumbnail').endswith('/CACHE/images/upload/recipe_photos/food/thumbnail.jpg'))
@@ -3,13 +3,31 @@
 
 import os
 import shutil
+import tempfile
+from io import StringIO
 from pathlib import Path
+from unittest import mock
 
 from django.conf import settings
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import pre_save
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APIRequestFactory
+from v1.ingredient.models import Ingredient, IngredientGroup
+from v1.ingredient.serializers import IngredientGroupSerializer
+from v1.jobs.models import Job
+from v1.jobs.queue import run_pending_jobs
+from v1.rating.models import Rating
 from v1.recipe import views
+from v1.recipe.models import CollectionVersion, Recipe
+from v1.recipe.save_recipe import SaveRecipe
+from v1.recipe_groups.models import Course, Cuisine, Tag
 
 
 class RecipeSerializerTests(TestCase):
@@ -474,10 +492,97 @@ class RecipeSerializerTests(TestCase):
         self.assertEqual(response.data.get('info'), 'Recipe info rgo')
         self.assertTrue(response.data.get('photo').endswith(os.path.join(PHOTO_PATH, 'food2.jpg')))
 
-        # photo should be deleted
+        # photo should be deleted, by the worker
+        run_pending_jobs()
         my_file = Path(media_path, 'food.jpg')
         self.assertFalse(my_file.is_file(), 'Deleting File failed')
 
+    def test_patch_recipe_with_uploaded_photo(self):
+        """The upload is stored as is, the worker processes it and swaps it in"""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        # Forget the thumbnails other tests generated elsewhere.
+        cache.clear()
+        with open('v1/fixtures/test/food.jpg', 'rb') as f:
+            photo = f.read()
+
+        with override_settings(MEDIA_ROOT=media_root):
+            recipe = SaveRecipe(
+                {'photo': SimpleUploadedFile('food.jpg', photo, 'image/jpeg')}, self.staff, partial=True
+            ).update(Recipe.objects.get(slug='tasty-chili'))
+            unprocessed = recipe.photo.name
+            self.assertEqual(recipe.photo_status, Recipe.PHOTO_PROCESSING)
+            self.assertEqual(unprocessed, 'upload/recipe_photos/unprocessed/food.jpg')
+            # Until processed, the upload is shown as the thumbnail.
+            self.assertEqual(recipe.photo_thumbnail_name, unprocessed)
+
+            run_pending_jobs()
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.photo_status, Recipe.PHOTO_READY)
+            self.assertEqual(recipe.photo.name, 'upload/recipe_photos/food.jpg')
+            self.assertTrue(recipe.photo.storage.exists(recipe.photo.name))
+            self.assertTrue(recipe.photo_thumbnail.storage.exists(recipe.photo_thumbnail.name))
+            self.assertEqual(recipe.photo_thumbnail_name, recipe.photo_thumbnail.name)
+            self.assertFalse(recipe.photo.storage.exists(unprocessed))
+            # The photo is 1x1, it isn't scaled up.
+            variant = recipe.photo_variants['webp'][0]
+            self.assertEqual(variant['name'], 'CACHE/variants/upload/recipe_photos/food.jpg/1.webp')
+            self.assertTrue(recipe.photo.storage.exists(variant['name']))
+
+            view = views.RecipeViewSet.as_view({'get': 'retrieve'})
+            request = self.factory.get('/api/v1/recipe/recipes/tasty-chili/')
+            request.user = self.staff
+            data = view(request, slug='tasty-chili').data
+            self.assertTrue(data.get('photo_thumbnail').endswith(recipe.photo_thumbnail_name))
+            srcset = data.get('photo_srcset')
+            self.assertEqual(list(srcset), ['webp', 'jpeg'])
+            self.assertTrue(srcset['webp'][0]['url'].endswith('/CACHE/variants/upload/recipe_photos/food.jpg/1.webp'))
+            self.assertEqual(srcset['webp'][0]['width'], 1)
+
+            # Not an image.
+            recipe = SaveRecipe(
+                {'photo': SimpleUploadedFile('food.jpg', b'no photo', 'image/jpeg')}, self.staff, partial=True
+            ).update(recipe)
+            run_pending_jobs()
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.photo_status, Recipe.PHOTO_FAILED)
+            self.assertEqual(recipe.photo_thumbnail_name, '')
+
+    def test_uploaded_photo_rolled_back(self):
+        """The stored upload is deleted if saving the recipe fails"""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with open('v1/fixtures/test/food.jpg', 'rb') as f:
+            photo = f.read()
+
+        with override_settings(MEDIA_ROOT=media_root), \
+                mock.patch.object(SaveRecipe, '_save_tags', side_effect=RuntimeError('failed')):
+            with self.assertRaises(RuntimeError):
+                SaveRecipe(
+                    {'photo': SimpleUploadedFile('food.jpg', photo, 'image/jpeg')}, self.staff, partial=True
+                ).update(Recipe.objects.get(slug='tasty-chili'))
+            self.assertFalse(Path(media_root, 'upload/recipe_photos/unprocessed/food.jpg').exists())
+            self.assertEqual(Recipe.objects.get(slug='tasty-chili').photo_status, Recipe.PHOTO_READY)
+
+    def test_uploaded_photo_processing_given_up(self):
+        """An upload the worker keeps failing on is marked failed once it gives up"""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with open('v1/fixtures/test/food.jpg', 'rb') as f:
+            photo = f.read()
+
+        with override_settings(MEDIA_ROOT=media_root), \
+                mock.patch('v1.recipe.models.generate_variants', side_effect=RuntimeError('failed')):
+            recipe = SaveRecipe(
+                {'photo': SimpleUploadedFile('food.jpg', photo, 'image/jpeg')}, self.staff, partial=True
+            ).update(Recipe.objects.get(slug='tasty-chili'))
+            for attempt in range(5):
+                Job.objects.update(run_at=timezone.now())
+                run_pending_jobs()
+                recipe.refresh_from_db()
+                self.assertEqual(recipe.photo_status, Recipe.PHOTO_FAILED if attempt == 4 else Recipe.PHOTO_PROCESSING)
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
     def test_update_recipe_too_long_name(self):
         view = views.RecipeViewSet.as_view({'put': 'update'})
         self.data['title'] = "Recipe name Lorem ipsum dolor sit amet, consectetuer adipiscing elit. Aenean commodo ligula eget dolor. Aenean massa. Cum sociis natoque penatibus et magnis dis parturient montes, nascetur ridiculus mus. Donec quam felis, ultricies nec, pellentesque eu, pretium."
@@ -486,3 +591,129 @@ class RecipeSerializerTests(TestCase):
         response = view(request, slug='tasty-chili')
         self.assertEqual(response.status_code, 400)
         self.assertTrue("Ensure this value has at most 250 characters" in str(response.data))
+
+    def stored_ingredients(self, recipe):
+        return [
+            (group['id'], group['title'], [(i['id'], i['title']) for i in group['ingredients']])
+            for group in IngredientGroupSerializer(recipe.ingredient_groups.order_by('pk'), many=True).data
+        ]
+
+    def save_ingredients(self, recipe, edit):
+        groups = [dict(group) for group in IngredientGroupSerializer(recipe.ingredient_groups.order_by('pk'), many=True).data]
+        for group in groups:
+            group['ingredients'] = [dict(ingredient) for ingredient in group['ingredients']]
+        edit(groups)
+        SaveRecipe({'ingredient_groups': groups}, self.staff, partial=True).update(recipe)
+        return self.stored_ingredients(recipe)
+
+    def test_update_ingredients_keeps_ids(self):
+        """Only the changed ingredient rows are written, the others keep their ids"""
+        recipe = Recipe.objects.get(slug='tasty-chili')
+        before = self.stored_ingredients(recipe)
+        untouched = Ingredient.objects.exclude(pk=before[0][2][1][0]).order_by('pk').values_list('pk', 'update_date')
+
+        def fix_typo(groups):
+            groups[0]['ingredients'][1]['title'] = 'chilli powder'
+        dates = list(untouched)
+        with CaptureQueriesContext(connection) as queries:
+            after = self.save_ingredients(recipe, fix_typo)
+        self.assertEqual(after[0][2][1], (before[0][2][1][0], 'chilli powder'))
+        self.assertEqual([(g, t, [i for i, title in ings]) for g, t, ings in after], [(g, t, [i for i, title in ings]) for g, t, ings in before])
+        self.assertEqual(list(untouched), dates)
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) and 'ingredient_' in q['sql']]
+        self.assertEqual(len(writes), 1)
+
+        def append_and_remove(groups):
+            del groups[0]['ingredients'][0]
+            groups[1]['ingredients'].append({'title': 'chipotle', 'numerator': 1, 'denominator': 1, 'measurement': 'can'})
+        after = self.save_ingredients(recipe, append_and_remove)
+        self.assertEqual(after[0][2], [(before[0][2][1][0], 'chilli powder')] + before[0][2][2:])
+        self.assertEqual(after[1][2][:-1], before[1][2])
+        self.assertEqual(after[1][2][-1][1], 'chipotle')
+
+    def test_update_ingredients_order(self):
+        """Rows are listed by id, the rows behind a moved one are inserted anew"""
+        recipe = Recipe.objects.get(slug='tasty-chili')
+        before = self.stored_ingredients(recipe)
+
+        def move_last_up(groups):
+            ingredients = groups[0]['ingredients']
+            ingredients.insert(1, ingredients.pop())
+        after = self.save_ingredients(recipe, move_last_up)
+        titles = [title for i, title in before[0][2]]
+        self.assertEqual([title for i, title in after[0][2]], titles[:1] + titles[-1:] + titles[1:-1])
+        self.assertEqual(after[0][2][0], before[0][2][0])
+
+        def swap_titles(groups):
+            groups[0]['title'], groups[1]['title'] = groups[1]['title'], groups[0]['title']
+        after = self.save_ingredients(recipe, swap_titles)
+        self.assertEqual([(g, t) for g, t, ings in after], [(before[0][0], before[1][1]), (before[1][0], before[0][1])])
+        self.assertEqual(IngredientGroup.objects.filter(recipe=recipe).count(), 2)
+
+    def test_update_deletes_unused_course(self):
+        """Only the course and cuisine the recipe left are deleted once unused, the command sweeps the rest"""
+        recipe = Recipe.objects.get(slug='tasty-chili')
+        course_id, cuisine_id = recipe.course_id, recipe.cuisine_id
+        Recipe.objects.exclude(pk=recipe.pk).filter(course_id=course_id).update(
+            course=Course.objects.exclude(pk=course_id).first()
+        )
+        unused = set(Course.objects.filter(recipe__isnull=True).values_list('pk', flat=True))
+        self.assertTrue(unused)
+
+        SaveRecipe({'course': {'title': 'Brunch'}}, self.staff, partial=True).update(recipe)
+        self.assertFalse(Course.objects.filter(pk=course_id).exists())
+        self.assertTrue(Cuisine.objects.filter(pk=cuisine_id).exists())
+        self.assertEqual(set(Course.objects.filter(recipe__isnull=True).values_list('pk', flat=True)), unused)
+
+        call_command('delete_unused_recipe_groups', stdout=StringIO())
+        self.assertFalse(Course.objects.filter(recipe__isnull=True).exists())
+        self.assertFalse(Cuisine.objects.filter(recipe__isnull=True).exists())
+
+    def test_created_groups_bump_versions(self):
+        """The courses and tags created in bulk bump their versions, so their lists aren't served stale"""
+        def versions():
+            return dict(CollectionVersion.objects.values_list('collection', 'version'))
+
+        before = versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            SaveRecipe._get_or_create_titles(Course, ['brand-new-course'], author=self.staff)
+            SaveRecipe._get_or_create_titles(Tag, ['brand-new-tag'])
+        after = versions()
+        for collection in ('course', 'tag'):
+            self.assertNotEqual(after.get(collection), before.get(collection))
+
+        # Nothing created, nothing bumped.
+        with self.captureOnCommitCallbacks(execute=True):
+            SaveRecipe._get_or_create_titles(Tag, ['brand-new-tag'])
+        self.assertEqual(versions(), after)
+
+    @override_settings(DELETE_ORPHAN_FILES=True)
+    def test_file_change_tracking_queries(self):
+        """Only Recipe and News saves check for a changed file, without querying the row again"""
+        self.assertFalse(pre_save.has_listeners(Ingredient))
+        self.assertFalse(pre_save.has_listeners(Rating))
+        ingredient = Ingredient.objects.first()
+        with self.assertNumQueries(1):
+            ingredient.save()
+
+        recipe = Recipe.objects.get(slug='tasty-chili')
+        with CaptureQueriesContext(connection) as queries:
+            recipe.save()
+        self.assertFalse([q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'recipe_recipe' in q['sql']])
+
+    @override_settings(DELETE_ORPHAN_FILES=True)
+    def test_file_names_refreshed(self):
+        """The file names reloaded by `refresh_from_db` are the ones a change deletes"""
+        recipe = Recipe.objects.get(slug='tasty-chili')
+        Recipe.objects.filter(pk=recipe.pk).update(photo='upload/recipe_photos/food.jpg')
+        recipe.refresh_from_db(fields=['title'])
+        self.assertEqual(recipe._original_file_names['photo'], '')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe._original_file_names['photo'], 'upload/recipe_photos/food.jpg')
+
+        recipe.photo = 'upload/recipe_photos/food2.jpg'
+        recipe.save()
+        self.assertEqual(
+            list(Job.objects.filter(name='recipe.delete_file').values_list('args', flat=True)),
+            [['recipe.Recipe', 'photo', 'upload/recipe_photos/food.jpg']]
+        )
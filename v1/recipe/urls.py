@@ -7,9 +7,11 @@ from . import views
 
 # Create a router and register our viewsets with it.
 router = DefaultRouter()
+router.register(r'browse', views.RecipeBrowseViewSet, basename='browse')
 router.register(r'mini-browse', views.MiniBrowseViewSet)
 router.register(r'recipes', views.RecipeViewSet, basename='recipes')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('query-cache/', views.QueryCacheStatsView.as_view(), name='query-cache'),
 ]
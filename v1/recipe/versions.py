@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import threading
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum, Value
+from django.utils import timezone
+
+from .models import CollectionVersion, Recipe
+
+# The collections a recipe response embeds, see `RecipeSerializer`.
+RECIPE_COLLECTIONS = ('recipe', 'course', 'cuisine', 'season', 'tag')
+
+# The collections changed by the open transactions of this thread.
+_pending = threading.local()
+
+
+def pending():
+    if not hasattr(_pending, 'collections'):
+        _pending.collections = set()
+    return _pending.collections
+
+
+def bump_collection_version(*collections):
+    """
+    Usage: Bumps the version of the `collections` once the transaction commits.
+    A transaction saving a recipe with all its ingredients bumps once.
+    Bumping after the commit never pairs a new version with the old data.
+    """
+    pending().update(collections)
+    transaction.on_commit(flush_collection_versions)
+
+
+def flush_collection_versions():
+    # The first callback of a commit bumps, the others find nothing left.
+    # Collections left by a rolled back transaction are bumped too, that's harmless.
+    collections = sorted(pending())
+    pending().clear()
+    for collection in collections:
+        versions = CollectionVersion.objects.filter(collection=collection)
+        if versions.update(version=F('version') + 1, update_date=timezone.now()):
+            continue
+        try:
+            with transaction.atomic():
+                CollectionVersion.objects.create(collection=collection, version=1)
+        except IntegrityError:
+            # Another request created the row in the meantime.
+            versions.update(version=F('version') + 1, update_date=timezone.now())
+
+
+def collection_versions(collections):
+    """
+    Usage: Returns the versions of the `collections` and when the last of them changed, one query.
+    Example:
+        collection_versions(['course'])
+        ({'course': 12}, datetime.datetime(2026, 10, 18, 9, 0, tzinfo=datetime.timezone.utc))
+    """
+    versions, last_modified = dict.fromkeys(collections, 0), None
+    for collection, version, update_date in CollectionVersion.objects.filter(
+        collection__in=collections
+    ).values_list('collection', 'version', 'update_date'):
+        versions[collection] = version
+        last_modified = max(last_modified or update_date, update_date)
+    return versions, last_modified
+
+
+def _per_recipe(function, path):
+    return Subquery(
+        Recipe.objects.filter(pk=OuterRef('pk')).order_by().values('pk').annotate(value=function(path)).values('value')
+    )
+
+
+def recipe_versions(queryset):
+    """
+    Usage: Returns what a recipe response is derived from and when it last changed, one query.
+    `None` if there is no such recipe.
+    The recipe, its ingredients, ingredient groups, ratings and subrecipes:
+    their latest change plus their number, so a deletion shows up too,
+    and the versions of the courses, cuisines, seasons and tags it embeds.
+    Example:
+        recipe_versions(Recipe.objects.filter(slug='tasty-chili'))
+    """
+    # A constant doesn't group, the collections add up to one row.
+    groups = CollectionVersion.objects.filter(
+        collection__in=RECIPE_COLLECTIONS[1:]
+    ).order_by().annotate(all=Value(1)).values('all')
+
+    versions = queryset.order_by().annotate(
+        ingredient_date=_per_recipe(Max, 'ingredient_groups__ingredients__update_date'),
+        ingredient_count=_per_recipe(Count, 'ingredient_groups__ingredients'),
+        group_date=_per_recipe(Max, 'ingredient_groups__update_date'),
+        group_count=_per_recipe(Count, 'ingredient_groups'),
+        rating_date=_per_recipe(Max, 'rating_recipe__update_date'),
+        subrecipe_date=_per_recipe(Max, 'parent_recipe__child_recipe__update_date'),
+        subrecipe_count=_per_recipe(Count, 'parent_recipe'),
+        collection_version=Subquery(groups.annotate(total=Sum('version')).values('total')),
+        collection_date=Subquery(groups.annotate(latest=Max('update_date')).values('latest')),
+    ).values(
+        'pk', 'update_date', 'rating_count', 'ingredient_date', 'ingredient_count', 'group_date', 'group_count',
+        'rating_date', 'subrecipe_date', 'subrecipe_count', 'collection_version', 'collection_date',
+    ).first()
+    if versions is None:
+        return None
+
+    dates = [value for name, value in versions.items() if name.endswith('date') and value is not None]
+    return versions, max(dates)
@@ -1,61 +1,51 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
-import random
 from django.core.exceptions import ValidationError
-from django.db.models.functions import Floor
 
-from rest_framework import filters, status, viewsets
+from rest_framework import filters, permissions, status, viewsets
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from . import serializers
+from .delete_recipe import delete_recipe
+from .mixins import QueryPlanner, QueryPlannerMixin
 from .models import Recipe
+from .query_cache import cached_ids, query_cache
+from .random_sample import random_sample
+from .recipe_filter import RecipeFilter
 from .save_recipe import SaveRecipe
+from .versions import RECIPE_COLLECTIONS, collection_versions, recipe_versions
+from v1.common.conditional_get import ConditionalGetMixin
+from v1.common.pagination import LimitOffsetOrKeysetPagination
 from v1.common.permissions import IsOwnerOrReadOnly
-from v1.recipe_groups.models import Course, Cuisine, Season, Tag
+from v1.common.recipe_search import RecipeSearchFilter
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, QueryPlannerMixin, viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
     `update` and `destroy` actions.
+
+    A recipe is validated by its own changes, see `recipe_versions`,
+    the list pages by the version of the recipes, see `collection_versions`.
+    Offset pages are cut from the cached ids of the query, see `query_cache`.
     """
     lookup_field = 'slug'
     serializer_class = serializers.RecipeSerializer
     permission_classes = (IsOwnerOrReadOnly,)
-    filter_backends = (filters.SearchFilter, filters.OrderingFilter)
-    search_fields = ('title', 'seasons__title', 'tags__title', 'ingredient_groups__ingredients__title')
-    ordering_fields = ('pub_date', 'title', 'rating')
+    pagination_class = LimitOffsetOrKeysetPagination
+    filter_backends = (RecipeSearchFilter, filters.OrderingFilter)
+    ordering_fields = ('pub_date', 'title', 'rating', 'search_rank')
     ordering = ('-pub_date', 'title')
 
+    filter_params = ('author__username', 'source', 'info', 'directions')
+
     def get_queryset(self):
-        query = Recipe.objects
+        self.recipe_filter = RecipeFilter(self.request)
+        query = self.recipe_filter.filter(Recipe.objects.all(), search=False)
         filter_set = {}
 
-        # If user is anonymous, restrict recipes to public.
-        if not self.request.user.is_authenticated:
-            filter_set['public'] = True
-
-        if 'course__slug' in self.request.query_params:
-            filter_set['course__in'] = Course.objects.filter(
-                slug__in=self.request.query_params.get('course__slug').split(',')
-            )
-
-        if 'cuisine__slug' in self.request.query_params:
-            filter_set['cuisine__in'] = Cuisine.objects.filter(
-                slug__in=self.request.query_params.get('cuisine__slug').split(',')
-            )
-
-        if 'season__slug' in self.request.query_params:
-            filter_set['seasons__in'] = Season.objects.filter(
-                slug__in=self.request.query_params.get('season__slug').split(',')
-            )
-
-        if 'tag__slug' in self.request.query_params:
-            filter_set['tags__in'] = Tag.objects.filter(
-                slug__in=self.request.query_params.get('tag__slug').split(',')
-            )
-
         if 'author__username' in self.request.query_params:
             filter_set['author__username'] = self.request.query_params.get('author__username')
 
@@ -68,14 +58,34 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if 'directions' in self.request.query_params:
             filter_set['directions__contains'] = self.request.query_params.get('directions')
 
-        query = query.filter(**filter_set).distinct()
-        if 'rating' not in self.request.query_params:
-            return query
+        return query.filter(**filter_set)
+
+    def paginate_queryset(self, queryset):
+        ids = self.get_cached_ids(queryset)
+        if ids is None:
+            return super(RecipeViewSet, self).paginate_queryset(queryset)
+
+        page = super(RecipeViewSet, self).paginate_queryset(ids)
+        recipes = QueryPlanner(self.get_serializer()).plan(Recipe.objects.filter(id__in=page)).in_bulk()
+        return [recipes[pk] for pk in page if pk in recipes]
+
+    def get_cached_ids(self, queryset):
+        # Keyset pages seek through the index, they don't need the ids.
+        params = self.request.query_params
+        if self.paginator is None or LimitOffsetOrKeysetPagination.cursor_query_param in params:
+            return None
+
+        query = self.recipe_filter.normalized()
+        query['ordering'] = params.get('ordering')
+        query.update((name, params.get(name)) for name in self.filter_params)
+        return cached_ids('recipes', query, queryset)
 
-        query = query.annotate(rating_c=Floor('rating'))
-        query_ratings = self.request.query_params.get('rating').split(',')
+    def get_list_validators(self):
+        return collection_versions(RECIPE_COLLECTIONS)
 
-        return query.filter(rating_c__in = query_ratings)
+    def get_object_validators(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return recipe_versions(self.get_queryset().filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}))
 
     def create(self, request, *args, **kwargs):
         try:
@@ -100,8 +110,39 @@ class RecipeViewSet(viewsets.ModelViewSet):
         except ValidationError as err:
             return Response(err.message_dict, status=status.HTTP_400_BAD_REQUEST)
 
+    def perform_destroy(self, instance):
+        delete_recipe(instance)
+
+
+class RecipeBrowseViewSet(QueryPlannerMixin,
+                          viewsets.mixins.ListModelMixin,
+                          viewsets.GenericViewSet):
+    """
+    This viewset automatically provides `list` action.
+
+    One request for a whole browse page:
+    the recipe page plus the course, cuisine, season, tag and rating facets,
+    i.e. what `recipes`, the `*-count` views and `rating-count` return.
+    Takes the filters of `RecipeFilter` and the ordering of `RecipeViewSet`.
+    """
+    serializer_class = serializers.RecipeSerializer
+    pagination_class = LimitOffsetOrKeysetPagination
+    filter_backends = RecipeViewSet.filter_backends
+    ordering_fields = RecipeViewSet.ordering_fields
+    ordering = RecipeViewSet.ordering
+
+    def get_queryset(self):
+        self.recipe_filter = RecipeFilter(self.request)
+        return self.recipe_filter.filter(Recipe.objects.all(), search=False)
+
+    def list(self, request, *args, **kwargs):
+        response = super(RecipeBrowseViewSet, self).list(request, *args, **kwargs)
+        response.data['facets'] = self.recipe_filter.facets()
+        return response
+
 
-class MiniBrowseViewSet(viewsets.mixins.ListModelMixin,
+class MiniBrowseViewSet(QueryPlannerMixin,
+                        viewsets.mixins.ListModelMixin,
                         viewsets.GenericViewSet):
     """
     This viewset automatically provides `list` action.
@@ -110,43 +151,23 @@ class MiniBrowseViewSet(viewsets.mixins.ListModelMixin,
     serializer_class = serializers.MiniBrowseSerializer
 
     def list(self, request, *args, **kwargs):
-        # If user is anonymous, restrict recipes to public.
-        if self.request.user.is_authenticated:
-            qs = Recipe.objects.all()
-        else:
-            qs = Recipe.objects.filter(public=True)
-
-        filter_set = {}
-        if 'course__slug' in self.request.query_params:
-            filter_set['course__in'] = Course.objects.filter(
-                slug__in=self.request.query_params.get('course__slug').split(',')
-            )
-        if 'cuisine__slug' in self.request.query_params:
-            filter_set['cuisine__in'] = Cuisine.objects.filter(
-                slug__in=self.request.query_params.get('cuisine__slug').split(',')
-            )
-        if 'season__slug' in self.request.query_params:
-            filter_set['seasons__in'] = Season.objects.filter(
-                slug__in=self.request.query_params.get('season__slug').split(',')
-            )
-        if 'tag__slug' in self.request.query_params:
-            filter_set['tags__in'] = Tag.objects.filter(
-                slug__in=self.request.query_params.get('tag__slug').split(',')
-            )
-
-        qs = qs.filter(**filter_set).distinct()
-        # Get the limit from the request and the count from the DB.
-        # Compare to make sure you aren't accessing more than possible.
+        recipe_filter = RecipeFilter(request)
+        qs = recipe_filter.filter(Recipe.objects.all(), search=False)
         limit = int(request.query_params.get('limit', 4))
-        count = qs.count()
-        if limit > count:
-            limit = count
-
-        # Get all ids from the DB.
-        my_ids = [key.id for key in qs]
         # Select a random sample from the DB.
-        rand_ids = random.sample(my_ids, limit)
+        # Not from the `query_cache`, the sample reads a few index entries, a miss would load every id.
+        rand_ids = random_sample(qs, limit)
         # set the queryset to that random sample.
         self.queryset = Recipe.objects.filter(id__in=rand_ids)
 
         return super(MiniBrowseViewSet, self).list(request, *args, **kwargs)
+
+
+class QueryCacheStatsView(APIView):
+    """
+    The hit and miss counters of the recipe `query_cache`, for admins.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(dict(query_cache.stats(), enabled=query_cache.enabled()))
@@ -5,10 +5,10 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
 
-from v1.common.db_fields import AutoSlugField
+from v1.common.db_fields import AutoSlugField, AutoSlugRetryMixin
 
 
-class Course(models.Model):
+class Course(AutoSlugRetryMixin, models.Model):
     """
     Django Model to hold Courses.
     Courses have a one to Many relation with Recipes.
@@ -25,7 +25,7 @@ class Course(models.Model):
         return '%s' % self.title
 
 
-class Cuisine(models.Model):
+class Cuisine(AutoSlugRetryMixin, models.Model):
     """
     Django Model to hold Cuisines.
     Cuisines have a one to Many relation with Recipes.
@@ -42,7 +42,7 @@ class Cuisine(models.Model):
         return self.title
 
 
-class Season(models.Model):
+class Season(AutoSlugRetryMixin, models.Model):
     """
     Django Model to hold Seasons.
     Seasons have a one to Many relation with Recipes.
@@ -60,7 +60,7 @@ class Season(models.Model):
         return self.recipe_set.filter(shared=0).count()
 
 
-class Tag(models.Model):
+class Tag(AutoSlugRetryMixin, models.Model):
     """
     Django Model to hold Tags.
     Tags have a Many to Many relation with Recipes.
@@ -76,3 +76,24 @@ class Tag(models.Model):
 
     def recipe_count(self):
         return self.recipe_set.filter(shared=0).count()
+
+
+def delete_unused_recipe_groups(course_ids=None, cuisine_ids=None):
+    """
+    Usage: Deletes the Courses and Cuisines no recipe uses anymore, except the ones of staff users.
+    Only the given ids are checked, leave them out (`None`) to sweep the whole tables.
+    Example:
+        delete_unused_recipe_groups(course_ids=[3], cuisine_ids=[])
+        (1, 0)
+    """
+    deleted = []
+    for model, ids in ((Course, course_ids), (Cuisine, cuisine_ids)):
+        groups = model.objects.exclude(author__is_staff=True).filter(recipe__isnull=True)
+        if ids is not None:
+            ids = [pk for pk in ids if pk is not None]
+            if not ids:
+                deleted.append(0)
+                continue
+            groups = groups.filter(pk__in=ids)
+        deleted.append(groups.delete()[1].get(model._meta.label, 0))
+    return tuple(deleted)
@@ -1,18 +1,17 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
-from django.db.models import Count
-from django.db.models.functions import Floor
 from rest_framework import viewsets
 
 from v1.recipe_groups.models import Course, Cuisine, Season, Tag
-from v1.recipe.models import Recipe
+from v1.recipe.recipe_filter import RecipeFilter
+from v1.recipe.versions import collection_versions
 from v1.recipe_groups import serializers
+from v1.common.conditional_get import ConditionalGetMixin
 from v1.common.permissions import IsParentRecipeOwnerOrReadOnly
-from v1.common.recipe_search import get_search_results
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
     `update` and `destroy` actions.
@@ -24,6 +23,9 @@ class CourseViewSet(viewsets.ModelViewSet):
     permission_classes = (IsParentRecipeOwnerOrReadOnly,)
     lookup_field = 'slug'
 
+    def get_list_validators(self):
+        return collection_versions(['course'])
+
 class CourseCountViewSet(viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
@@ -36,54 +38,10 @@ class CourseCountViewSet(viewsets.ModelViewSet):
     lookup_field = 'slug'
 
     def get_queryset(self):
-        query = Recipe.objects
-        filter_set = {}
-
-        # If user is anonymous, restrict recipes to public.
-        if not self.request.user.is_authenticated:
-            filter_set['public'] = True
-
-        if 'cuisine' in self.request.query_params:
-            try:
-                filter_set['cuisine__in'] = Cuisine.objects.filter(
-                    slug__in=self.request.query_params.get('cuisine').split(',')
-                )
-            except:
-                return []
-
-        if 'season' in self.request.query_params:
-            try:
-                filter_set['seasons__in'] = Season.objects.filter(
-                    slug__in=self.request.query_params.get('season').split(',')
-                )
-            except:
-                return []
-
-        if 'tag' in self.request.query_params:
-            try:
-                filter_set['tags__in'] = Tag.objects.filter(
-                    slug__in=self.request.query_params.get('tag').split(',')
-                )
-            except:
-                return []
+        return RecipeFilter(self.request).annotate_totals(Course.objects.order_by('title'), 'course')
 
-        if 'search' in self.request.query_params:
-            query = get_search_results(
-                ['title', 'ingredient_groups__ingredients__title', 'seasons__title', 'tags__title'],
-                query,
-                self.request.query_params.get('search')
-            ).distinct()
 
-        query = query.filter(**filter_set)
-        if 'rating' in self.request.query_params:
-            query = query.annotate(rating_c=Floor('rating'))
-            query_ratings = self.request.query_params.get('rating').split(',')
-            query = query.filter(rating_c__in = query_ratings)
-
-        return Course.objects.filter(recipe__in=query).order_by('title').annotate(total=Count('recipe', distinct=True))
-
-
-class CuisineViewSet(viewsets.ModelViewSet):
+class CuisineViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
     `update` and `destroy` actions.
@@ -95,6 +53,9 @@ class CuisineViewSet(viewsets.ModelViewSet):
     permission_classes = (IsParentRecipeOwnerOrReadOnly,)
     lookup_field = 'slug'
 
+    def get_list_validators(self):
+        return collection_versions(['cuisine'])
+
 class CuisineCountViewSet(viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
@@ -107,54 +68,10 @@ class CuisineCountViewSet(viewsets.ModelViewSet):
     lookup_field = 'slug'
 
     def get_queryset(self):
-        query = Recipe.objects
-        filter_set = {}
+        return RecipeFilter(self.request).annotate_totals(Cuisine.objects.order_by('title'), 'cuisine')
 
-        # If user is anonymous, restrict recipes to public.
-        if not self.request.user.is_authenticated:
-            filter_set['public'] = True
 
-        if 'course' in self.request.query_params:
-            try:
-                filter_set['course__in'] = Course.objects.filter(
-                    slug__in=self.request.query_params.get('course').split(',')
-                )
-            except:
-                return []
-
-        if 'season' in self.request.query_params:
-            try:
-                filter_set['seasons__in'] = Season.objects.filter(
-                    slug__in=self.request.query_params.get('season').split(',')
-                )
-            except:
-                return []
-
-        if 'tag' in self.request.query_params:
-            try:
-                filter_set['tags__in'] = Tag.objects.filter(
-                    slug__in=self.request.query_params.get('tag').split(',')
-                )
-            except:
-                return []
-
-        if 'search' in self.request.query_params:
-            query = get_search_results(
-                ['title', 'ingredient_groups__ingredients__title', 'seasons__title', 'tags__title'],
-                query,
-                self.request.query_params.get('search')
-            ).distinct()
-
-        query = query.filter(**filter_set)
-        if 'rating' in self.request.query_params:
-            query = query.annotate(rating_c=Floor('rating'))
-            query_ratings = self.request.query_params.get('rating').split(',')
-            query = query.filter(rating_c__in = query_ratings)
-
-        return Cuisine.objects.filter(recipe__in=query).order_by('title').annotate(total=Count('recipe', distinct=True))
-
-
-class SeasonViewSet(viewsets.ModelViewSet):
+class SeasonViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
     `update` and `destroy` actions.
@@ -166,6 +83,9 @@ class SeasonViewSet(viewsets.ModelViewSet):
     permission_classes = (IsParentRecipeOwnerOrReadOnly,)
     lookup_field = 'slug'
 
+    def get_list_validators(self):
+        return collection_versions(['season'])
+
 class SeasonCountViewSet(viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
@@ -178,54 +98,10 @@ class SeasonCountViewSet(viewsets.ModelViewSet):
     lookup_field = 'slug'
 
     def get_queryset(self):
-        query = Recipe.objects
-        filter_set = {}
+        return RecipeFilter(self.request).annotate_totals(Season.objects.order_by('title'), 'season')
 
-        # If user is anonymous, restrict recipes to public.
-        if not self.request.user.is_authenticated:
-            filter_set['public'] = True
 
-        if 'course' in self.request.query_params:
-            try:
-                filter_set['course__in'] = Course.objects.filter(
-                    slug__in=self.request.query_params.get('course').split(',')
-                )
-            except:
-                return []
-
-        if 'cuisine' in self.request.query_params:
-            try:
-                filter_set['cuisine__in'] = Cuisine.objects.filter(
-                    slug__in=self.request.query_params.get('cuisine').split(',')
-                )
-            except:
-                return []
-
-        if 'tag' in self.request.query_params:
-            try:
-                filter_set['tags__in'] = Tag.objects.filter(
-                    slug__in=self.request.query_params.get('tag').split(',')
-                )
-            except:
-                return []
-
-        if 'search' in self.request.query_params:
-            query = get_search_results(
-                ['title', 'ingredient_groups__ingredients__title', 'tags__title'],
-                query,
-                self.request.query_params.get('search')
-            ).distinct()
-
-        query = query.filter(**filter_set)
-        if 'rating' in self.request.query_params:
-            query = query.annotate(rating_c=Floor('rating'))
-            query_ratings = self.request.query_params.get('rating').split(',')
-            query = query.filter(rating_c__in = query_ratings)
-
-        return Season.objects.filter(recipe__in=query).order_by('title').annotate(total=Count('recipe', distinct=True))
-
-
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
     `update` and `destroy` actions.
@@ -238,6 +114,10 @@ class TagViewSet(viewsets.ModelViewSet):
     lookup_field = 'title'
     ordering_fields = ('title',)
 
+    def get_list_validators(self):
+        return collection_versions(['tag'])
+
+
 class TagCountViewSet(viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
@@ -250,48 +130,4 @@ class TagCountViewSet(viewsets.ModelViewSet):
     lookup_field = 'slug'
 
     def get_queryset(self):
-        query = Recipe.objects
-        filter_set = {}
-
-        # If user is anonymous, restrict recipes to public.
-        if not self.request.user.is_authenticated:
-            filter_set['public'] = True
-
-        if 'course' in self.request.query_params:
-            try:
-                filter_set['course__in'] = Course.objects.filter(
-                    slug__in=self.request.query_params.get('course').split(',')
-                )
-            except:
-                return []
-
-        if 'cuisine' in self.request.query_params:
-            try:
-                filter_set['cuisine__in'] = Cuisine.objects.filter(
-                    slug__in=self.request.query_params.get('cuisine').split(',')
-                )
-            except:
-                return []
-
-        if 'season' in self.request.query_params:
-            try:
-                filter_set['seasons__in'] = Season.objects.filter(
-                    slug__in=self.request.query_params.get('season').split(',')
-                )
-            except:
-                return []
-
-        if 'search' in self.request.query_params:
-            query = get_search_results(
-                ['title', 'ingredient_groups__ingredients__title', 'tags__title'],
-                query,
-                self.request.query_params.get('search')
-            ).distinct()
-
-        query = query.filter(**filter_set)
-        if 'rating' in self.request.query_params:
-            query = query.annotate(rating_c=Floor('rating'))
-            query_ratings = self.request.query_params.get('rating').split(',')
-            query = query.filter(rating_c__in = query_ratings)
-
-        return Tag.objects.filter(recipe__in=query).order_by('title').annotate(total=Count('recipe', distinct=True))
+        return RecipeFilter(self.request).annotate_totals(Tag.objects.order_by('title'), 'tag')